@@ -47,18 +47,84 @@ class RisingNote:
             self.y -= self.speed 
 
     def draw(self, surface):
-        if self.h <= 0: return
-        
-        # Create a surface for the note and its neon glow
-        note_surf = pygame.Surface((self.w + 20, self.h + 20), pygame.SRCALPHA)
-        
-        # 1. Outer Glow (Lower Alpha, BLEND_ADD makes it look like light)
-        pygame.draw.rect(note_surf, (*self.color, 80), (5, 5, self.w + 10, self.h + 10), border_radius=8)
-        
-        # 2. Core Note (Full Brightness)
-        pygame.draw.rect(note_surf, self.color, (10, 10, self.w, self.h), border_radius=5)
-        
-        surface.blit(note_surf, (self.x - 10, self.y - 10), special_flags=pygame.BLEND_ADD)
+        # returns the Rect drawn to, None if nothing was drawn
+        if self.h <= 0: return None
+
+        x = int(self.x - 10)
+        y = int(self.y - 10)
+
+        # too short for the caps, drawn whole (and cached, it never grows past this)
+        if self.h < MIN_TILED_HEIGHT:
+            key = (self.color, self.w, self.h)
+            note_surf = NOTE_SPRITES.get(key)
+            if note_surf is None:
+                note_surf = NOTE_SPRITES[key] = render_note(self.w, self.h, self.color)
+            return surface.blit(note_surf, (x, y), special_flags=pygame.BLEND_ADD)
+
+        top, body, bottom = note_sprites(self.w, self.color)
+
+        # top cap, body tiled to the current height, bottom cap
+        surface.blit(top, (x, y), special_flags=pygame.BLEND_ADD)
+        body_y = y + CAP_HEIGHT
+        remaining = self.h - MIN_TILED_HEIGHT
+        while remaining > 0:
+            part = min(remaining, BODY_TILE_HEIGHT)
+            surface.blit(body, (x, body_y), (0, 0, body.get_width(), part), special_flags=pygame.BLEND_ADD)
+            body_y += part
+            remaining -= part
+        surface.blit(bottom, (x, body_y), special_flags=pygame.BLEND_ADD)
+
+        return pygame.Rect(x, y, top.get_width(), body_y + bottom.get_height() - y)
+
+
+    def draw_simple(self, surface):
+        # plain bar without the glow, for when frames are running slow
+        if self.h <= 0: return None
+
+        rect = pygame.Rect(int(self.x), int(self.y), self.w, self.h)
+        return surface.fill(self.color, rect, special_flags=pygame.BLEND_ADD)
+
+
+# the note sprite has CAP_HEIGHT rows of rounded glow and core above and below
+# a straight middle, so notes at least MIN_TILED_HEIGHT tall are drawn as two
+# caps and a body tiled to the height
+CAP_HEIGHT = 15
+MIN_TILED_HEIGHT = 10
+BODY_TILE_HEIGHT = 256
+
+# (colour, width) -> (top cap, body tile, bottom cap), (colour, width, height) -> short note
+NOTE_SPRITES = {}
+
+
+def render_note(w, h, color):
+    """draws a whole w x h note with its glow, the way every note used to be drawn each frame"""
+    # Create a surface for the note and its neon glow
+    note_surf = pygame.Surface((w + 20, h + 20), pygame.SRCALPHA)
+
+    # 1. Outer Glow (Lower Alpha, BLEND_ADD makes it look like light)
+    pygame.draw.rect(note_surf, (*color, 80), (5, 5, w + 10, h + 10), border_radius=8)
+
+    # 2. Core Note (Full Brightness)
+    pygame.draw.rect(note_surf, color, (10, 10, w, h), border_radius=5)
+
+    return note_surf
+
+
+def note_sprites(w, color):
+    """cap and body sprites for notes of width w, cut from one tall render"""
+    key = (color, w)
+    sprites = NOTE_SPRITES.get(key)
+    if sprites is None:
+        h = BODY_TILE_HEIGHT + MIN_TILED_HEIGHT
+        full = render_note(w, h, color)
+        width = full.get_width()
+        sprites = NOTE_SPRITES[key] = (
+            full.subsurface((0, 0, width, CAP_HEIGHT)).copy(),
+            full.subsurface((0, CAP_HEIGHT, width, BODY_TILE_HEIGHT)).copy(),
+            full.subsurface((0, CAP_HEIGHT + BODY_TILE_HEIGHT, width, h + 20 - CAP_HEIGHT - BODY_TILE_HEIGHT)).copy(),
+        )
+
+    return sprites
 
 
 def main():
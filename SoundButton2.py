@@ -1,5 +1,11 @@
 import pygame
 import sys
+from fonts import get_font
+
+# button appearances
+IDLE = 0
+HOVER = 1
+ACTIVE = 2
 
 class SoundButton:
     def __init__(self, top_left, size, sound, text, colour):
@@ -8,27 +14,25 @@ class SoundButton:
         self.base_color = pygame.Color(colour)
         self.text_str = text
         # Fallback to system font if yours isn't in the folder
-        try:
-            self.font = pygame.font.Font("LibreFranklin-Regular.ttf", 14)
-        except:
-            self.font = pygame.font.SysFont("Arial", 14, bold=True)
+        self.font = get_font("LibreFranklin-Regular.ttf", 14, bold=True)
             
         self.text_surf = self.font.render(self.text_str, True, (255, 255, 255))
         self.text_rect = self.text_surf.get_rect(center=self.rect.center)
 
-    def draw(self, screen, mouse_pos, current_sound):
-        is_hovered = self.rect.collidepoint(mouse_pos)
-        is_active = (self.sound == current_sound)
+        # (body, text) surfaces for IDLE, HOVER and ACTIVE, rendered once
+        self.state_surfaces = [self.render_state(state) for state in (IDLE, HOVER, ACTIVE)]
 
+    def render_state(self, state):
+        """renders the button body and text for one appearance"""
         # 1. Create a transparent surface for the button body
         btn_surf = pygame.Surface((self.rect.width, self.rect.height), pygame.SRCALPHA)
         
         # 2. Logic for colors
-        if is_active:
+        if state == ACTIVE:
             bg_color = (255, 255, 255, 180)  # Bright white/opaque
             text_color = (20, 20, 30)        # Dark text for contrast
             border_color = (255, 255, 255, 255)
-        elif is_hovered:
+        elif state == HOVER:
             bg_color = (*self.base_color[:3], 200) # Brighter version
             text_color = (255, 255, 255)
             border_color = (255, 255, 255, 200)
@@ -40,13 +44,29 @@ class SoundButton:
         # 3. Draw to the transparent surface
         pygame.draw.rect(btn_surf, bg_color, (0, 0, self.rect.width, self.rect.height), border_radius=10)
         pygame.draw.rect(btn_surf, border_color, (0, 0, self.rect.width, self.rect.height), width=2, border_radius=10)
-        
-        # 4. Blit button to screen, then text on top
-        screen.blit(btn_surf, (self.rect.x, self.rect.y))
-        
+
         # Re-render text color for active state
         final_text = self.font.render(self.text_str, True, text_color)
-        screen.blit(final_text, self.text_rect)
+
+        return btn_surf, final_text
+
+    def state(self, mouse_pos, current_sound):
+        if self.sound == current_sound:
+            return ACTIVE
+        if self.rect.collidepoint(mouse_pos):
+            return HOVER
+        return IDLE
+
+    def draw(self, screen, mouse_pos, current_sound, offset=(0, 0)):
+        """
+        draws the button, offset is subtracted from its position when drawing
+        onto something other than the screen (eg a SoundButtonPanel)
+        """
+        btn_surf, final_text = self.state_surfaces[self.state(mouse_pos, current_sound)]
+
+        # 4. Blit button to screen, then text on top
+        screen.blit(btn_surf, (self.rect.x - offset[0], self.rect.y - offset[1]))
+        screen.blit(final_text, self.text_rect.move(-offset[0], -offset[1]))
 
     def collides(self, position):
         """
@@ -55,6 +75,42 @@ class SoundButton:
         return self.rect.collidepoint(position)
 
 
+class SoundButtonPanel:
+    """
+    all the sound buttons drawn into one surface, which is only redrawn when
+    the hovered button or the selected sound changes
+    """
+    def __init__(self, buttons, background=(0, 0, 0)):
+        """
+        :param buttons: SoundButtons
+        :param background: colour behind the buttons
+        """
+        self.buttons = buttons
+        self.background = background
+        self.rect = buttons[0].rect.unionall([button.rect for button in buttons[1:]])
+        self.surface = pygame.Surface(self.rect.size)
+
+        # appearance of each button when the surface was last drawn
+        self.states = None
+
+    def draw(self, screen, mouse_pos, current_sound):
+        """
+        :returns: whether the buttons changed since the last draw
+        """
+        states = tuple(button.state(mouse_pos, current_sound) for button in self.buttons)
+        changed = states != self.states
+
+        if changed:
+            self.surface.fill(self.background)
+            for button in self.buttons:
+                button.draw(self.surface, mouse_pos, current_sound, offset=self.rect.topleft)
+            self.states = states
+
+        screen.blit(self.surface, self.rect)
+
+        return changed
+
+
 def main():
     pygame.init()
     W, H = 1280, 720
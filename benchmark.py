@@ -0,0 +1,432 @@
+import os
+# draw benchmarks use offscreen surfaces, no window needed
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+import pygame
+import math_functions
+import draw_functions
+from instrument_top import InstrumentTop
+from instrument_front import InstrumentFront
+from keyboard_set import Keyboard, KeyboardSet
+from NoteRise import RisingNote, Spark
+from particles import ParticleSystem
+from camera_frame import Frame
+from touch_onset import TouchBand
+from fingertip_tracker import FingertipTracker
+from motion_gate import MotionGate
+from SoundButton2 import SoundButton, SoundButtonPanel
+
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+# name -> function that builds the zero argument callable to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """registers a benchmark, the decorated function does the setup and
+    returns the callable to time"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+# ------------------ SYNTHETIC DATA ------------------
+
+CORNERS = [np.array([0.1, 0.2]), np.array([0.9, 0.22]), np.array([0.08, 0.8]), np.array([0.92, 0.78])]
+
+
+def make_keyboard(num_white_keys):
+    """calibrated InstrumentTop plus its key points"""
+    instrument_top = InstrumentTop([], num_white_keys=num_white_keys, lowest_note=21)
+    instrument_top.set_corners(list(CORNERS))
+
+    return instrument_top, instrument_top.get_all_keys_points()
+
+
+def make_keyboard_set(num_keyboards, num_white_keys=21):
+    """built KeyboardSet of keyboards side by side across the top camera"""
+    keyboards = []
+    width = 0.9 / num_keyboards
+    for i in range(num_keyboards):
+        left = 0.05 + i * width
+        instrument_top = InstrumentTop([], num_white_keys=num_white_keys, lowest_note=36)
+        instrument_top.set_corners([np.array([left, 0.2]), np.array([left + width * 0.95, 0.2]),
+                                    np.array([left, 0.8]), np.array([left + width * 0.95, 0.8])])
+        keyboards.append(Keyboard(instrument_top, channel=i))
+
+    keyboard_set = KeyboardSet(keyboards)
+    keyboard_set.build()
+
+    return keyboard_set
+
+
+def random_fingers(count, rng):
+    """fingertips spread over the keyboard area"""
+    return [np.array([rng.uniform(0.1, 0.9), rng.uniform(0.25, 0.75)]) for _ in range(count)]
+
+
+def random_frame(size=(480, 640)):
+    return np.random.default_rng(0).integers(0, 255, (*size, 3), dtype=np.uint8)
+
+
+# ------------------ GEOMETRY ------------------
+
+@benchmark("math.distance")
+def bench_distance():
+    return lambda: math_functions.distance([0.1, 0.2], [0.4, 0.6])
+
+
+@benchmark("math.distance_to_line")
+def bench_distance_to_line():
+    return lambda: math_functions.distance_to_line([0.5, 0.52], [0.0, 0.5], [1.0, 0.55])
+
+
+@benchmark("math.in_quadrilateral")
+def bench_in_quadrilateral():
+    a, b, c, d = CORNERS
+    return lambda: math_functions.in_quadrilateral([0.5, 0.5], a, b, c, d)
+
+
+@benchmark("math.is_right_of_line")
+def bench_is_right_of_line():
+    return lambda: math_functions.is_right_of_line([0.5, 0.5], CORNERS[0], CORNERS[2])
+
+
+for keys in (7, 21, 52):
+    @benchmark(f"top.get_all_keys_points[{keys}keys]")
+    def bench_all_keys_points(keys=keys):
+        instrument_top, _ = make_keyboard(keys)
+        return instrument_top.get_all_keys_points
+
+    for fingers in (1, 5, 10):
+        @benchmark(f"top.get_notes[{keys}keys,{fingers}fingers]")
+        def bench_get_notes(keys=keys, fingers=fingers):
+            instrument_top, key_points = make_keyboard(keys)
+            finger_points = random_fingers(fingers, random.Random(keys * 100 + fingers))
+            return lambda: instrument_top.get_notes(finger_points, *key_points)
+
+
+for keyboards in (1, 3, 6):
+    @benchmark(f"keyboards.get_notes[{keyboards}keyboards,10fingers]")
+    def bench_keyboard_notes(keyboards=keyboards):
+        keyboard_set = make_keyboard_set(keyboards)
+        finger_points = random_fingers(10, random.Random(keyboards))
+        return lambda: keyboard_set.get_notes(finger_points)
+
+
+for fingers in (1, 5, 10):
+    @benchmark(f"front.get_pressed_fingers[{fingers}fingers]")
+    def bench_pressed_fingers(fingers=fingers):
+        instrument_front = InstrumentFront([], [], table_distance_threshold=0.015)
+        instrument_front.set_endpoints([np.array([0.0, 0.5]), np.array([1.0, 0.52])])
+        rng = random.Random(fingers)
+        front = [[rng.uniform(0, 1), rng.uniform(0.48, 0.54)] for _ in range(fingers)]
+        top = random_fingers(fingers, rng)
+        return lambda: instrument_front.get_pressed_fingers(front, top)
+
+
+# ------------------ CAMERA FRAMES ------------------
+
+@benchmark("camera_frame.views[640x480]")
+def bench_camera_frame_views():
+    image = random_frame()
+
+    def views():
+        # a new frame, then every stage asking for its views
+        frame = Frame(image)
+        for _ in range(2):
+            frame.rgb
+            frame.gray
+            frame.resized((160, 120), gray=True)
+
+    return views
+
+
+@benchmark("touch_onset.band[640x480]")
+def bench_touch_band():
+    band = TouchBand()
+    band.set_line([(0.0, 0.5), (1.0, 0.52)], 0.015, (480, 640, 3))
+    empty = random_frame()
+    touched = empty.copy()
+    touched[200:250, 300:320] = 0
+    frames = [empty, touched]
+    band.detect(empty)
+    index = [0]
+
+    def detect():
+        # a finger landing and lifting (the band skips a frame it has already seen)
+        index[0] ^= 1
+        band.detect(frames[index[0]])
+
+    return detect
+
+
+@benchmark("fingertip_tracker.track[10fingertips]")
+def bench_fingertip_tracker():
+    rng = np.random.default_rng(0)
+    image = random_frame()
+    # the same scene moved 2 pixels right, gray views made up front like the other stages would
+    frames = [Frame(image), Frame(np.roll(image, 2, axis=1))]
+    for frame in frames:
+        frame.gray
+    keypoints = (rng.uniform(0.3, 0.7, (5, 2)).tolist(), rng.uniform(0.3, 0.7, (5, 2)).tolist())
+    tracker = FingertipTracker()
+
+    def track():
+        tracker.seed(frames[0], keypoints)
+        tracker.track(frames[1])
+
+    return track
+
+
+@benchmark("motion_gate.should_run[640x480]")
+def bench_motion_gate():
+    instrument_front = InstrumentFront([], [], table_distance_threshold=0.015)
+    instrument_front.set_endpoints([np.array([0.0, 0.5]), np.array([1.0, 0.52])])
+    gate = MotionGate(2, force_interval=float("inf"))
+    gate.set_regions(make_keyboard_set(1), instrument_front, num_top=1)
+    image = random_frame()
+    gate.should_run(0, Frame(image), ([], []))
+
+    # a new camera frame of a still scene every call, its gray view included
+    return lambda: gate.should_run(0, Frame(image), ([], []))
+
+
+# ------------------ RENDERING ------------------
+
+@benchmark("draw.draw_frame[640x480->640x360]")
+def bench_draw_frame():
+    screen = pygame.Surface((1280, 720))
+    frame = random_frame()
+    return lambda: draw_functions.draw_frame(screen=screen, frame=frame, size=(640, 360))
+
+
+@benchmark("draw.frame_presenter[640x480->640x360]")
+def bench_frame_presenter():
+    screen = pygame.Surface((1280, 720))
+    frame = random_frame()
+    presenter = draw_functions.FramePresenter((640, 360))
+    return lambda: presenter.draw(screen, frame)
+
+
+for keys in (21, 52):
+    @benchmark(f"draw.draw_keys[{keys}keys]")
+    def bench_draw_keys(keys=keys):
+        screen = pygame.Surface((1280, 720))
+        _, (tops, bases, black_tops, black_bases) = make_keyboard(keys)
+
+        def draw():
+            draw_functions.draw_keys(screen=screen, key_tops=tops, key_bases=bases, overlap=True,
+                                     outline_colour="blue", outline_width=3, window_width=640, window_height=360)
+            draw_functions.draw_keys(screen=screen, key_tops=black_tops, key_bases=black_bases, overlap=False,
+                                     outline_colour="red", outline_width=3, window_width=640, window_height=360)
+        return draw
+
+
+    @benchmark(f"draw.overlay_layer_and_highlights[{keys}keys]")
+    def bench_overlay(keys=keys):
+        screen = pygame.Surface((1280, 720))
+        instrument_top, key_points = make_keyboard(keys)
+
+        def render(surface, key_points, size):
+            draw_functions.draw_keys(screen=surface, key_tops=key_points[0], key_bases=key_points[1], overlap=True,
+                                     outline_colour="blue", outline_width=3, window_width=size[0], window_height=size[1])
+            draw_functions.draw_keys(screen=surface, key_tops=key_points[2], key_bases=key_points[3], overlap=False,
+                                     outline_colour="red", outline_width=3, window_width=size[0], window_height=size[1])
+
+        overlay = draw_functions.OverlayLayer(render)
+        highlights = draw_functions.KeyHighlights(instrument_top)
+        # ten fingers down
+        notes = set(range(0, 20, 2))
+
+        def draw():
+            highlights.draw(screen, key_points, (640, 360), notes)
+            overlay.draw(screen, key_points, (640, 360))
+        return draw
+
+
+def make_buttons():
+    """the app's 2x5 sound button grid"""
+    return [SoundButton(top_left=(790 + 200 * b, 100 + 65 * p), size=(180, 50), sound=(b, p),
+                        text=f"Preset {b} {p}", colour=(0, 220, 255))
+            for b in range(2) for p in range(5)]
+
+
+@benchmark("draw.sound_buttons[10]")
+def bench_sound_buttons():
+    screen = pygame.Surface((1280, 720))
+    buttons = make_buttons()
+
+    def draw():
+        for button in buttons:
+            button.draw(screen, (800, 110), (1, 2))
+    return draw
+
+
+@benchmark("draw.sound_button_panel[10]")
+def bench_sound_button_panel():
+    screen = pygame.Surface((1280, 720))
+    panel = SoundButtonPanel(make_buttons())
+    return lambda: panel.draw(screen, (800, 110), (1, 2))
+
+
+for count in (30, 300):
+    @benchmark(f"effects.spark_update_draw[{count}]")
+    def bench_sparks(count=count):
+        screen = pygame.Surface((1280, 720))
+        random.seed(count)
+        sparks = [Spark(640, 360, (0, 255, 150)) for _ in range(count)]
+
+        def step():
+            for spark in sparks:
+                spark.update()
+                spark.draw(screen)
+                # keep them alive and on screen
+                spark.life = 200
+                spark.x, spark.y = 640, 360
+        return step
+
+
+for count in (30, 300, 2000):
+    @benchmark(f"effects.particle_system_update_draw[{count}]")
+    def bench_particle_system(count=count):
+        screen = pygame.Surface((1280, 720))
+        particles = ParticleSystem(capacity=count, seed=count)
+
+        def step():
+            # top up what died so the count stays around count
+            particles.emit(640, 360, (0, 255, 150), count - len(particles))
+            particles.update()
+            particles.draw(screen)
+        return step
+
+
+for count in (5, 20):
+    @benchmark(f"effects.rising_note_update_draw[{count}]")
+    def bench_rising_notes(count=count):
+        screen = pygame.Surface((1280, 720))
+        notes = [RisingNote(40 * i, 600, 30, (0, 220, 255)) for i in range(count)]
+
+        def step():
+            for note in notes:
+                note.update()
+                note.draw(screen)
+                # stop them growing forever
+                if note.h > 300:
+                    note.h, note.y = 0, 600
+        return step
+
+
+# ----------------------------------------------------
+
+def time_callable(fn, repeat=5, min_time=0.2):
+    """
+    times fn like timeit: picks a loop count that takes at least min_time,
+    then returns the best of repeat runs as seconds per call
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed == 0 else max(2, int(min_time / elapsed))
+
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - start) / loops)
+
+    return best
+
+
+def run(name_filter=None, repeat=5, min_time=0.2) -> dict:
+    """runs the benchmarks, returns name -> seconds per call"""
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = time_callable(setup(), repeat, min_time)
+
+    return results
+
+
+def compare(results, baseline, threshold) -> list[str]:
+    """prints results against the baseline and returns the regressed names"""
+    regressions = []
+    width = max(len(name) for name in results)
+
+    for name, seconds in results.items():
+        line = f"{name.ljust(width)}  {seconds * 1e6:12.2f} us"
+
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            line += f"  {change:+7.1%}"
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+
+        print(line)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the hot paths")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline json file")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--filter", default=None, help="only run benchmarks containing this")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown vs baseline that counts as a regression (0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing run")
+    args = parser.parse_args()
+
+    pygame.init()
+    results = run(args.filter, args.repeat, args.min_time)
+    pygame.quit()
+
+    if not results:
+        print(f"No benchmarks match {args.filter!r}")
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        # keep the baseline of benchmarks that were filtered out
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": platform.node(),
+                "python": platform.python_version(),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "results": baseline,
+            }, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+import numpy as np
+from config import env_str
+from instrument_front import TableSegments
+
+
+DEFAULT_CALIBRATION_PATH = "calibration.json"
+
+
+def calibration_path() -> str:
+    """Returns the calibration file path (CALIBRATION_PATH in .env or default)"""
+    return env_str("CALIBRATION_PATH", DEFAULT_CALIBRATION_PATH)
+
+
+def save_calibration(path, corner_positions, endpoint_positions, num_white_keys, lowest_note,
+                     keyboards=None, instrument_front=None) -> None:
+    """
+    writes the clicked calibration points to a json file
+
+    :param path: file to write
+    :param corner_positions: 4 normalized piano corners
+    :param endpoint_positions: 2 normalized table endpoints
+    :param num_white_keys: number of white keys on the paper piano
+    :param lowest_note: midi note of the leftmost white key
+    :param keyboards: optional keyboard_set.KeyboardSet, to save every
+                      keyboard (the first one is also saved as above)
+    :param instrument_front: optional instrument_front.TableSegments, to save
+                             every front camera's table line (the first one
+                             is also saved as endpoint_positions)
+    """
+    data = {
+        "corners": points_to_json(corner_positions),
+        "endpoints": points_to_json(endpoint_positions),
+        "num_white_keys": int(num_white_keys),
+        "lowest_note": int(lowest_note),
+    }
+
+    if keyboards is not None and (len(keyboards) > 1 or keyboards[0].camera != 0):
+        data["keyboards"] = [{
+            "corners": points_to_json(keyboard.instrument_top.piano_corners),
+            "num_white_keys": int(keyboard.instrument_top.num_keys),
+            "lowest_note": int(keyboard.instrument_top.lowest_note),
+            "channel": int(keyboard.channel),
+            "camera": int(keyboard.camera),
+        } for keyboard in keyboards]
+
+    if isinstance(instrument_front, TableSegments) and len(instrument_front) > 1:
+        data["fronts"] = [points_to_json(front.table_endpoints) for front in instrument_front]
+
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_calibration(path) -> dict:
+    """
+    reads a calibration file written by save_calibration
+
+    :param path: file to read
+    :returns: dict with "corners" and "endpoints" (lists of numpy points),
+              the "num_white_keys"/"lowest_note" layout, "keyboards", a list
+              of {"corners", "num_white_keys", "lowest_note", "channel",
+              "camera"} with one entry per keyboard (just the first for older
+              files) and "fronts", the endpoints of each front camera
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    if len(data.get("corners", [])) != 4 or len(data.get("endpoints", [])) != 2:
+        raise ValueError(f"Invalid calibration file {path}")
+
+    keyboards = data.get("keyboards") or [data]
+    if any(len(keyboard.get("corners", [])) != 4 for keyboard in keyboards):
+        raise ValueError(f"Invalid calibration file {path}")
+    fronts = data.get("fronts") or [data["endpoints"]]
+    if any(len(endpoints) != 2 for endpoints in fronts):
+        raise ValueError(f"Invalid calibration file {path}")
+
+    return {
+        "corners": [np.array(p, dtype=float) for p in data["corners"]],
+        "endpoints": [np.array(p, dtype=float) for p in data["endpoints"]],
+        "num_white_keys": int(data.get("num_white_keys", 21)),
+        "lowest_note": int(data.get("lowest_note", 60)),
+        "keyboards": [{
+            "corners": [np.array(p, dtype=float) for p in keyboard["corners"]],
+            "num_white_keys": int(keyboard.get("num_white_keys", 21)),
+            "lowest_note": int(keyboard.get("lowest_note", 60)),
+            "channel": int(keyboard.get("channel", 0)),
+            "camera": int(keyboard.get("camera", 0)),
+        } for keyboard in keyboards],
+        "fronts": [[np.array(p, dtype=float) for p in endpoints] for endpoints in fronts],
+    }
+
+
+def points_to_json(points) -> list:
+    return [[float(p[0]), float(p[1])] for p in points]
@@ -0,0 +1,75 @@
+import threading
+import cv2
+
+
+class Frame:
+    """
+    A captured BGR camera frame and the views derived from it: RGB for
+    mediapipe, grayscale for detectors, resized copies. Each view is made the
+    first time something asks for it and then shared, so inference, rendering
+    and detectors never convert the same frame twice.
+
+    Views are shared, so they must not be drawn on, copy them first.
+    """
+    __slots__ = ("bgr", "timestamp", "views", "locks")
+
+    def __init__(self, bgr, timestamp=None):
+        """
+        :param bgr: opencv frame
+        :param timestamp: time.perf_counter() when it was captured
+        """
+        self.bgr = bgr
+        self.timestamp = timestamp
+        # key -> view
+        self.views = {}
+        # key -> lock, inference threads and the render loop can ask at the same time
+        self.locks = {}
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    def view(self, key, make):
+        """returns the view for key, calling make() to create it the first time"""
+        view = self.views.get(key)
+        if view is None:
+            with self.locks.setdefault(key, threading.Lock()):
+                view = self.views.get(key)
+                if view is None:
+                    view = self.views[key] = make()
+
+        return view
+
+    @property
+    def rgb(self):
+        return self.view("rgb", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    @property
+    def gray(self):
+        return self.view("gray", lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    def resized(self, size, gray=False):
+        """
+        :param size: (width, height)
+        :param gray: resize the grayscale view instead of the colour frame
+        """
+        def make():
+            source = self.gray if gray else self.bgr
+            if (source.shape[1], source.shape[0]) == tuple(size):
+                return source
+            return cv2.resize(source, tuple(size), interpolation=cv2.INTER_AREA)
+
+        return self.view(("resized", tuple(size), gray), make)
+
+    def roi(self, x, y, width, height, gray=False):
+        """crop in pixels, a view of the frame (or its grayscale) without copying"""
+        source = self.gray if gray else self.bgr
+        return source[y:y + height, x:x + width]
+
+
+def as_frame(image) -> Frame:
+    """wraps a plain opencv frame in a Frame, Frames are returned as they are"""
+    if isinstance(image, Frame):
+        return image
+
+    return Frame(image)
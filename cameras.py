@@ -0,0 +1,70 @@
+import video
+from engine import warm_up_hands_model
+from config import env_str
+
+
+# camera roles, each with its own list of cameras
+TOP = "top"
+FRONT = "front"
+# role -> .env variable and default sources
+ROLE_SOURCES = {
+    TOP: ("TOP_CAMERAS", "1"),
+    FRONT: ("FRONT_CAMERAS", "0"),
+}
+
+
+def parse_sources(value) -> list:
+    """
+    :param value: comma separated camera indices, video files or stream urls
+    :returns: the sources, with camera indices as ints for cv2.VideoCapture
+    """
+    sources = []
+    for source in value.split(","):
+        source = source.strip()
+        if source:
+            sources.append(int(source) if source.isdigit() else source)
+
+    return sources
+
+
+def camera_roles_from_env() -> dict:
+    """
+    role -> camera sources, from TOP_CAMERAS and FRONT_CAMERAS in .env (top
+    is camera 1 and front camera 0 by default). Cameras of the same role are
+    listed left to right.
+    """
+    roles = {}
+    for role, (name, default) in ROLE_SOURCES.items():
+        roles[role] = parse_sources(env_str(name, default))
+        if not roles[role]:
+            raise ValueError(f"{name} lists no cameras")
+
+    return roles
+
+
+def camera_name(role, index) -> str:
+    """name of a camera (and its startup job), eg "top camera", "front camera 2" """
+    return f"{role} camera" if index == 0 else f"{role} camera {index + 1}"
+
+
+def submit_cameras(warmup, roles, max_num_hands=2) -> dict:
+    """
+    opens every camera and warms up a hands model for each in the background
+
+    :param warmup: startup.Warmup
+    :param roles: camera_roles_from_env output
+    :param max_num_hands: hands each model tracks
+    :returns: role -> (camera Futures, hands model Futures)
+    """
+    submitted = {}
+    for role, sources in roles.items():
+        caps = []
+        hands = []
+        for index, source in enumerate(sources):
+            name = camera_name(role, index)
+            hands.append(warmup.submit(name.replace("camera", "hands model"), warm_up_hands_model,
+                                       max_num_hands=max_num_hands))
+            caps.append(warmup.submit(name, video.Video, source))
+        submitted[role] = (caps, hands)
+
+    return submitted
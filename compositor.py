@@ -0,0 +1,85 @@
+import pygame
+
+
+def merge_rects(rects) -> list:
+    """
+    drops rects inside another one and joins overlapping ones when their
+    union isn't bigger than the two apart, so areas aren't sent twice
+    """
+    merged = []
+    for rect in sorted(rects, key=lambda r: r.width * r.height, reverse=True):
+        for i, other in enumerate(merged):
+            if other.contains(rect):
+                break
+            if other.colliderect(rect):
+                union = other.union(rect)
+                if union.width * union.height <= other.width * other.height + rect.width * rect.height:
+                    merged[i] = union
+                    break
+        else:
+            merged.append(rect)
+
+    return merged
+
+
+class Compositor:
+    """
+    Sends only the parts of the window that changed to the display, instead
+    of flipping the whole window every frame
+
+    Each frame clear() wipes the areas drawn on the frame before, whatever is
+    drawn is registered with add(), and present() pushes this frame's rects
+    plus last frame's (which were just cleared) with pygame.display.update.
+    Anything never added is assumed to look the same as on the last frame,
+    like the background or a button panel that didn't change.
+
+    invalidate() makes the next frame clear and flip the whole window, for
+    screens that redraw everything themselves or after the window is exposed.
+    """
+
+    def __init__(self, screen, background=(0, 0, 0), enabled=True):
+        """
+        :param screen: pygame display surface
+        :param background: colour areas are cleared to
+        :param enabled: False to clear and flip the whole window every frame
+        """
+        self.screen = screen
+        self.background = background
+        self.enabled = enabled
+        self.screen_rect = screen.get_rect()
+
+        # drawn this frame
+        self.rects = []
+        # drawn last frame, cleared and sent again this frame
+        self.previous = [self.screen_rect]
+        self.full = True
+
+    def invalidate(self) -> None:
+        self.full = True
+
+    def clear(self) -> None:
+        if self.full or not self.enabled:
+            self.screen.fill(self.background)
+            return
+
+        for rect in self.previous:
+            self.screen.fill(self.background, rect)
+
+    def add(self, rect) -> None:
+        """registers an area drawn this frame, None is ignored"""
+        if rect is not None:
+            self.rects.append(rect)
+
+    def present(self) -> None:
+        if self.full or not self.enabled:
+            pygame.display.flip()
+            # everything was drawn, so the next frame clears everything
+            self.previous = [self.screen_rect]
+        else:
+            rects = [rect.clip(self.screen_rect) for rect in self.rects]
+            rects = [rect for rect in rects if rect.width and rect.height]
+            pygame.display.update(merge_rects(self.previous + rects))
+            self.previous = rects
+
+        self.rects = []
+        self.full = False
@@ -0,0 +1,35 @@
+import os
+
+
+def env_str(name: str, default=None):
+    """Returns the environment variable name, or default if it is unset or empty"""
+    value = os.getenv(name)
+
+    if value is None or value.strip() == "":
+        return default
+
+    return value.strip()
+
+
+def env_int(name: str, default=None):
+    """Returns the environment variable name as an int"""
+    value = env_str(name)
+
+    return default if value is None else int(value)
+
+
+def env_float(name: str, default=None):
+    """Returns the environment variable name as a float"""
+    value = env_str(name)
+
+    return default if value is None else float(value)
+
+
+def env_bool(name: str, default=False):
+    """Returns the environment variable name as a bool (1/true/yes/on)"""
+    value = env_str(name)
+
+    if value is None:
+        return default
+
+    return value.lower() in ("1", "true", "yes", "on")
@@ -2,6 +2,7 @@ import pygame
 import cv2
 from SoundButton2 import SoundButton
 import numpy as np
+from camera_frame import as_frame
 
 
 def unnormalize_point(screen, point, width=None, height=None):
@@ -12,6 +13,9 @@ def unnormalize_point(screen, point, width=None, height=None):
 
 
 def draw_hand_points(frame, hand_keypoints):
+    # returns a copy of frame with the points drawn, camera frames are shared
+    frame = as_frame(frame).bgr.copy()
+
     # Unnormalize points
     h, w, _ = frame.shape
 
@@ -22,48 +26,104 @@ def draw_hand_points(frame, hand_keypoints):
     return frame
 
 
-def draw_hand_points_pg(screen, hand_keypoints):
+def draw_hand_points_pg(screen, hand_keypoints, frame_rect=None):
     """
     draw hand keypoints
     
     :param screen: pygame screen
     :param hand_keypoints: list of keybpoints
+    :param frame_rect: if given, keypoints are normalized to this drawn frame rect
+    :returns: pygame Rect around the points, None if there are none
+    """
+    if frame_rect is not None:
+        hand_keypoints = [(frame_rect.x + p[0] * frame_rect.width,
+                           frame_rect.y + p[1] * frame_rect.height)
+                          for p in hand_keypoints]
+
+    rects = [pygame.draw.circle(surface=screen, color="red", center=point, radius=2)
+             for point in hand_keypoints]
+
+    return rects[0].unionall(rects[1:]) if rects else None
+
+
+class FramePresenter:
+    """
+    draws opencv frames for one panel, keeping its buffers between frames
+
+    The frame is resized straight into a preallocated BGR buffer that a pygame
+    Surface shares (pygame.image.frombuffer), so presenting a frame is one
+    resize and one blit with no new Surface or intermediate copies. The
+    buffers are only rebuilt when the frame or panel size changes.
     """
-    for point in hand_keypoints:
-        pygame.draw.circle(surface=screen, color="red",
-                           center=point, radius=2)
+
+    def __init__(self, size=None):
+        """
+        :param size: (width, height) to draw frames at, None for the whole screen
+        """
+        self.size = size
+
+        # (frame shape, target size) the buffers were built for
+        self.built_for = None
+        # frame currently in the buffer, so the same frame isn't resized twice
+        self.frame = None
+        self.frame_size = None
+        self.buffer = None
+        self.surface = None
+
+    def rebuild(self, frame_shape, target_size) -> None:
+        # get frame info (height and width are supposed! to be switched this is correct)
+        frame_size = [frame_shape[1], frame_shape[0]]
+
+        # find scaled size depending which aspect is bigger compared to target
+        scale_factor = min(target_size[0]/frame_size[0], target_size[1]/frame_size[1])
+        new_frame_size = [int(frame_size[0] * scale_factor), int(frame_size[1] * scale_factor)]
+
+        self.built_for = (frame_shape, target_size)
+        self.frame_size = new_frame_size
+        self.buffer = np.empty((new_frame_size[1], new_frame_size[0], 3), dtype=np.uint8)
+        # shares self.buffer, so writing the buffer updates the surface
+        self.surface = pygame.image.frombuffer(self.buffer, new_frame_size, "BGR")
+
+    def draw(self, screen, frame, top_left=(0, 0)):
+        """
+        :param screen: pygame screen
+        :param frame: frame to draw (camera_frame.Frame or opencv brg matrix)
+        :param top_left: top left corner formatted (x, y)
+        :returns: pygame Rect the frame was drawn to
+        """
+        image = as_frame(frame).bgr
+
+        # get size of target area to display on (default is entire screen)
+        target_size = screen.get_size() if self.size is None else tuple(self.size)
+
+        if self.built_for != (image.shape, target_size):
+            self.rebuild(image.shape, target_size)
+            self.frame = None
+
+        # rendering runs faster than the cameras, most frames are repeats
+        if image is not self.frame:
+            # resize if needed, straight into the buffer
+            if self.buffer.shape == image.shape:
+                np.copyto(self.buffer, image)
+            else:
+                cv2.resize(image, self.frame_size, dst=self.buffer)
+            self.frame = image
+
+        return screen.blit(self.surface, top_left)
 
 
 def draw_frame(screen, frame, top_left=np.array((0, 0)), size=None):
     """
-    draws opencv frame on pygame screen
+    draws opencv frame on pygame screen, for one off draws (FramePresenter
+    reuses its buffers when drawing every frame)
 
     :param screen: pygame screen
     :param frame: frame to draw (opencv brg matrix)
     :param top_left: top left corner formatted (x, y)
     :param size: (width, height) to draw it at
+    :returns: pygame Rect the frame was drawn to
     """
-    # get frame info (height and width are supposed! to be switched this is correct)
-    frame_size = [frame.shape[1], frame.shape[0]]
-    
-    # get size of target area to display on (default is entire screen)
-    if size is None:
-        target_size = screen.get_size()
-    else:
-        target_size = size
-
-    # find scaled size depending which aspect is bigger compared to target
-    scale_factor = min(target_size[0]/frame_size[0], target_size[1]/frame_size[1])
-    new_frame_size = [int(frame_size[0] * scale_factor), int(frame_size[1] * scale_factor)]
-
-    # resize if needed
-    if new_frame_size != frame_size:
-        frame = cv2.resize(frame, new_frame_size)
-
-    # draw frame
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    frame_surface = pygame.surfarray.make_surface(frame_rgb.swapaxes(0, 1))
-    screen.blit(frame_surface, top_left)
+    return FramePresenter(size).draw(screen, frame, top_left)
 
 
 def draw_points(screen, point_list, colour):
@@ -168,6 +228,98 @@ def draw_tabletop(screen, left, right, outline_colour, outline_width,
                      width=outline_width)
     
 
+class OverlayLayer:
+    """
+    transparent panel sized layer for drawing that only changes with the
+    calibration (key outlines, table line), rendered once and then blitted in
+    one call per frame
+
+    It is rendered again when the source it was drawn from (eg the key points
+    or table endpoints) is replaced, ie after calibrating, or the panel size
+    changes.
+    """
+
+    def __init__(self, render):
+        """
+        :param render: render(surface, source, size) draws the overlay onto the layer
+        """
+        self.render = render
+        self.surface = None
+        self.source = None
+        self.size = None
+
+    def draw(self, screen, source, size, top_left=(0, 0)):
+        """
+        :param screen: pygame screen
+        :param source: what the overlay is drawn from, compared by identity
+        :param size: (width, height) of the panel
+        :param top_left: top left of the panel
+        """
+        size = tuple(size)
+        if self.surface is None or source is not self.source or size != self.size:
+            self.surface = pygame.Surface(size, pygame.SRCALPHA)
+            self.render(self.surface, source, size)
+            # match the display's pixel format so the per frame blit is a fast path
+            if pygame.display.get_surface() is not None:
+                self.surface = self.surface.convert_alpha()
+            self.source = source
+            self.size = size
+
+        return screen.blit(self.surface, top_left)
+
+
+class KeyHighlights:
+    """
+    per key highlight masks for the playing notes, filled once per
+    calibration and blitted for the notes being played
+    """
+
+    def __init__(self, instrument_top, colour=(255, 255, 255, 90)):
+        """
+        :param instrument_top: InstrumentTop whose keys are highlighted
+        :param colour: rgba fill of a highlighted key
+        """
+        self.instrument_top = instrument_top
+        self.colour = colour
+        # note index -> (mask surface, top left in the panel)
+        self.masks = {}
+        self.key_points = None
+        self.size = None
+
+    def build(self, key_points, size) -> None:
+        self.masks = {}
+        for note, points in self.instrument_top.get_key_polygons(key_points).items():
+            points = [(p[0] * size[0], p[1] * size[1]) for p in points]
+            left = int(min(p[0] for p in points))
+            top = int(min(p[1] for p in points))
+            right = int(max(p[0] for p in points)) + 1
+            bottom = int(max(p[1] for p in points)) + 1
+
+            mask = pygame.Surface((right - left, bottom - top), pygame.SRCALPHA)
+            pygame.draw.polygon(mask, self.colour, [(x - left, y - top) for x, y in points])
+            self.masks[note] = (mask, (left, top))
+
+        self.key_points = key_points
+        self.size = size
+
+    def draw(self, screen, key_points, size, notes, top_left=(0, 0)) -> None:
+        """
+        :param screen: pygame screen
+        :param key_points: get_all_keys_points output, compared by identity
+        :param size: (width, height) of the panel
+        :param notes: note indexes to highlight
+        :param top_left: top left of the panel
+        """
+        size = tuple(size)
+        if key_points is not self.key_points or size != self.size:
+            self.build(key_points, size)
+
+        screen.blits([
+            (mask, (top_left[0] + x, top_left[1] + y))
+            for mask, (x, y) in (self.masks[note] for note in notes if note in self.masks)
+        ], doreturn=False)
+
+
 def draw_soundbuttons(screen, buttons, mouse_position, current_sound):
     """
     draw buttons
@@ -0,0 +1,212 @@
+import os
+import numpy as np
+from instrument import Instrument
+from instrument_top import InstrumentTop
+from instrument_front import InstrumentFront
+from midi_recorder import start_recorder_from_env
+from latency_trace import start_tracer_from_env
+from synth_server import remote_synth_from_env
+from stage_timers import NULL_TIMERS
+from camera_frame import as_frame
+
+
+def create_hands_model(max_num_hands=2):
+    # Creates one mediapipe hands model
+    # mediapipe is imported here as it takes seconds, so startup can do it in the background
+    # max_num_hands: 2 per player, so one model serves every keyboard under the camera
+    import mediapipe as mp
+
+    return mp.solutions.hands.Hands(
+        static_image_mode=False,
+        max_num_hands=max_num_hands,
+        model_complexity=1,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+
+def initialize_mediapipe_hands(num_frames: int, max_num_hands=2):
+    # Initializes mediapipe hands models, one per camera
+
+    return [create_hands_model(max_num_hands) for _ in range(num_frames)]
+
+
+def warm_up_hands_model(frame_size=(480, 640), max_num_hands=2):
+    """Creates a hands model and runs it once on a blank frame, so the
+    first real frame doesn't pay for graph setup"""
+    hand_model = create_hands_model(max_num_hands)
+    process_frame(np.zeros((*frame_size, 3), dtype=np.uint8), hand_model)
+
+    return hand_model
+
+
+def process_frame(frame, hand_model, timers=NULL_TIMERS, camera="hands"):
+    # Runs mediapipe hands on frame (a camera_frame.Frame or opencv bgr frame)
+    # timers/camera: optional StageTimers and the name to record the steps under
+
+    with timers.time(f"{camera} bgr->rgb"):
+        rgb_frame = as_frame(frame).rgb
+    with timers.time(f"{camera} mediapipe"):
+        hand_results = hand_model.process(rgb_frame)
+
+    # label -> fingertips of each hand with that label
+    hands = {"Left": [], "Right": []}
+
+    if hand_results.multi_hand_landmarks and hand_results.multi_handedness:
+        for landmarks, handedness in zip(
+            hand_results.multi_hand_landmarks,
+            hand_results.multi_handedness
+        ):
+            # get handedness label ("Left" or "Right")
+            label = handedness.classification[0].label
+
+            # fingertip indices
+            finger_indices = [4, 8, 12, 16, 20]
+
+            points = [
+                [landmarks.landmark[i].x, landmarks.landmark[i].y]
+                for i in finger_indices
+            ]
+
+            if label in hands:
+                hands[label].append(points)
+
+    # with several players, hands are paired across the cameras by their left to right order
+    left_hand_keypoints = [p for points in sorted(hands["Left"], key=mean_x) for p in points]
+    right_hand_keypoints = [p for points in sorted(hands["Right"], key=mean_x) for p in points]
+
+    return left_hand_keypoints, right_hand_keypoints
+
+
+def mean_x(points) -> float:
+    return sum(p[0] for p in points) / len(points)
+
+
+def merge_keypoints(camera_keypoints):
+    """Merges the process_frame output of several cameras with the same role
+    as if they were one wide camera: camera i's x coordinates have i added,
+    so the fingertips stay in left to right order across the cameras
+    args:
+        camera_keypoints: (left, right) fingertips of each camera, left to right
+
+    returns:
+        (left, right) fingertips
+    """
+    if len(camera_keypoints) == 1:
+        return camera_keypoints[0]
+
+    left = [[p[0] + i, p[1]] for i, (points, _) in enumerate(camera_keypoints) for p in points]
+    right = [[p[0] + i, p[1]] for i, (_, points) in enumerate(camera_keypoints) for p in points]
+
+    return left, right
+
+
+def play_notes(piano: Instrument, playing_notes, trace=None) -> None:
+    """Plays notes on instrument
+    args:
+        piano: Intrument
+        playing_notes: set of playing notes
+        trace: optional latency_trace.FrameTrace of the frames the notes came from
+
+    returns:
+        None
+    """
+
+    # only touch the notes that changed, whatever the size of the keyboard
+    for note in piano.current_notes - playing_notes:
+        piano.remove_note(note)
+
+    for note in playing_notes - piano.current_notes:
+        piano.add_note(note, trace)
+
+
+def get_playing_notes(instrument_top: InstrumentTop, instrument_front: InstrumentFront,
+                      top_keypoints, front_keypoints, key_points, timers=NULL_TIMERS):
+    """Finds the notes being played from the keypoints of both cameras
+    args:
+        instrument_top: calibrated InstrumentTop
+        instrument_front: calibrated InstrumentFront
+        top_keypoints: (left, right) fingertips from the top camera
+        front_keypoints: (left, right) fingertips from the front camera
+        key_points: (white tops, white bases, black tops, black bases)
+        timers: optional StageTimers
+
+    returns:
+        InstrumentTop.get_notes output, or None if no hands are seen
+    """
+    pressed_fingers = get_pressed_fingers(instrument_front, top_keypoints, front_keypoints, timers)
+    if pressed_fingers is None:
+        return None
+
+    with timers.time("note lookup"):
+        return instrument_top.get_notes(pressed_fingers, *key_points)
+
+
+def get_keyboard_notes(keyboards, instrument_front: InstrumentFront,
+                       top_keypoints, front_keypoints, timers=NULL_TIMERS):
+    """get_playing_notes for every keyboard of a keyboard_set.KeyboardSet
+
+    returns:
+        KeyboardSet.get_notes output, or None if no hands are seen
+    """
+    pressed_fingers = get_pressed_fingers(instrument_front, top_keypoints, front_keypoints, timers)
+    if pressed_fingers is None:
+        return None
+
+    with timers.time("note lookup"):
+        return keyboards.get_notes(pressed_fingers)
+
+
+def get_pressed_fingers(instrument_front: InstrumentFront, top_keypoints, front_keypoints,
+                        timers=NULL_TIMERS):
+    """The top camera fingertips touching the table, None if no hands are seen"""
+    top_left, top_right = top_keypoints
+    front_left, front_right = front_keypoints
+
+    if len(top_left) == 0 or len(front_left) == 0:
+        return None
+
+    # Filter for pressed fingers
+    with timers.time("press detection"):
+        pressed_fingers_left = instrument_front.get_pressed_fingers(front_left, top_left)
+        pressed_fingers_right = instrument_front.get_pressed_fingers(front_right, top_right)
+        return pressed_fingers_left + pressed_fingers_right
+
+
+def load_piano() -> Instrument:
+    """
+    loads the soundfont and starts the synth (and midi recorder and latency
+    tracer if enabled), on a synth server if SYNTH_SERVER is set
+    """
+    soundfont_path = os.path.join(".", "Soundfont.sf2")
+    piano = Instrument(soundfont_path, 0, 0, 50, synth=remote_synth_from_env(soundfont_path))
+    piano.start()
+    start_recorder_from_env(piano)
+    start_tracer_from_env(piano)
+
+    return piano
+
+
+def shutdown(warmup) -> None:
+    """releases the cameras, hands models and synth, waiting for any still starting up"""
+    warmup.shutdown()
+
+    for camera in [name for name in warmup.jobs if name.endswith("camera") or " camera " in name]:
+        cap = warmup.result(camera)
+        if cap is not None:
+            cap.release()
+
+    # their graph threads and TFLite resources would otherwise live until exit
+    for model in [name for name in warmup.jobs if name.endswith("hands model") or " hands model " in name]:
+        hands = warmup.result(model)
+        if hands is not None:
+            hands.close()
+
+    piano = warmup.result("soundfont")
+    if piano is not None:
+        piano.remove_all_notes()
+        if piano.recorder is not None:
+            piano.recorder.stop()
+        if piano.tracer is not None:
+            piano.tracer.stop()
+        piano.stop()
@@ -0,0 +1,158 @@
+import math
+import cv2
+import numpy as np
+from camera_frame import as_frame
+from config import env_bool, env_int, env_float
+
+
+class FingertipTracker:
+    """
+    Follows one camera's fingertips from frame to frame with pyramidal
+    Lucas-Kanade optical flow, so fingertips move on every captured frame
+    and not only on the frames the hands model runs on.
+
+    Each hands model result reseeds the tracker. Only a patch around the
+    fingertips is tracked, and every point is tracked back again: if a
+    point is lost, comes back more than max_error pixels from where it
+    started, or max_frames frames have been tracked since the last seed,
+    the tracker counts as lost and gives nothing until the next seed.
+    """
+
+    def __init__(self, window=15, levels=2, margin=32, max_error=2.0, max_frames=30):
+        """
+        :param window: side of the optical flow search window in pixels
+        :param levels: pyramid levels above the full resolution patch
+        :param margin: pixels of image around the fingertips that are tracked
+        :param max_error: forward-backward error in pixels a point may have
+        :param max_frames: frames tracked between seeds before a new detection is needed
+        """
+        self.window = (window, window)
+        self.levels = levels
+        self.margin = margin
+        self.max_error = max_error
+        self.max_frames = max_frames
+
+        # the frame the points are in
+        self.frame = None
+        # (n, 2) float32 pixel positions of the left then right fingertips, None without hands
+        self.points = None
+        # fingertips in the left and right lists
+        self.lengths = (0, 0)
+        self.frames_tracked = 0
+        self.lost = True
+
+    def seed(self, frame, keypoints, latest=None):
+        """
+        restarts tracking from a hands model result
+
+        :param frame: the frame the hands model ran on
+        :param keypoints: its process_frame output
+        :param latest: newest frame of the camera, the fingertips are tracked
+                       on to it if it isn't frame
+        :returns: the fingertips in latest (keypoints if tracking them there failed)
+        """
+        left, right = keypoints
+        self.lengths = (len(left), len(right))
+        self.frame = frame
+        self.frames_tracked = 0
+        self.lost = False
+
+        if left or right:
+            height, width = as_frame(frame).shape[:2]
+            self.points = (np.array(left + right) * (width, height)).astype(np.float32)
+        else:
+            self.points = None
+
+        if latest is not None and latest is not frame:
+            tracked = self.track(latest)
+            if tracked is not None:
+                return tracked
+            # tracking failed, the detection is still better than nothing
+            self.lost = False
+            self.frame = frame
+
+        return keypoints
+
+    def current(self):
+        """the fingertips in the last frame tracked, None if lost"""
+        if self.lost:
+            return None
+        if self.points is None:
+            return [], []
+
+        height, width = as_frame(self.frame).shape[:2]
+        points = (self.points / (width, height)).tolist()
+        return points[:self.lengths[0]], points[self.lengths[0]:]
+
+    # ---------- hot path (capture stage) ----------
+
+    def track(self, frame):
+        """
+        :param frame: the camera's next frame
+        :returns: the fingertips moved to frame (process_frame format), None if lost
+        """
+        if self.lost or frame is self.frame:
+            return self.current()
+        if self.points is None:
+            # no hands to follow
+            self.frame = frame
+            return [], []
+
+        self.frames_tracked += 1
+        if self.frames_tracked > self.max_frames:
+            self.lost = True
+            return None
+
+        previous = as_frame(self.frame).gray
+        gray = as_frame(frame).gray
+        height, width = gray.shape
+
+        # the patch around every fingertip
+        x0 = max(0, int(self.points[:, 0].min()) - self.margin)
+        y0 = max(0, int(self.points[:, 1].min()) - self.margin)
+        x1 = min(width, int(math.ceil(self.points[:, 0].max())) + self.margin)
+        y1 = min(height, int(math.ceil(self.points[:, 1].max())) + self.margin)
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            self.lost = True
+            return None
+
+        previous_patch = previous[y0:y1, x0:x1]
+        patch = gray[y0:y1, x0:x1]
+        offset = np.array([x0, y0], dtype=np.float32)
+        start = (self.points - offset).reshape(-1, 1, 2)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_patch, patch, start, None,
+                                                    winSize=self.window, maxLevel=self.levels)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(patch, previous_patch, moved, None,
+                                                        winSize=self.window, maxLevel=self.levels)
+
+        error = np.linalg.norm((back - start).reshape(-1, 2), axis=1)
+        if not (status.all() and back_status.all()) or error.max() > self.max_error:
+            self.lost = True
+            return None
+
+        self.points = moved.reshape(-1, 2) + offset
+        self.frame = frame
+
+        return self.current()
+
+
+def start_tracking_from_env(pipeline):
+    """
+    gives every camera of pipeline a FingertipTracker if TRACK_FINGERTIPS is
+    set in .env
+
+    :param pipeline: Pipeline to track fingertips for
+    :returns: the trackers, or None if tracking is off
+    """
+    if not env_bool("TRACK_FINGERTIPS", False):
+        return None
+
+    trackers = [
+        FingertipTracker(max_error=env_float("TRACK_MAX_ERROR", 2.0),
+                         max_frames=env_int("TRACK_MAX_FRAMES", 30))
+        for _ in pipeline.caps
+    ]
+    pipeline.trackers = trackers
+
+    return trackers
@@ -0,0 +1,26 @@
+import pygame
+
+
+# (path, size, fallback, bold) -> Font, shared so each button doesn't open its own
+FONTS = {}
+
+
+def get_font(path, size, fallback="Arial", bold=False):
+    """
+    returns a shared pygame Font, opened the first time it is asked for
+
+    :param path: font file to load
+    :param size: point size
+    :param fallback: system font used if path can't be loaded
+    :param bold: whether the fallback font is bold
+    """
+    key = (path, size, fallback, bold)
+    font = FONTS.get(key)
+    if font is None:
+        try:
+            font = pygame.font.Font(path, size)
+        except (OSError, pygame.error):
+            font = pygame.font.SysFont(fallback, size, bold=bold)
+        FONTS[key] = font
+
+    return font
@@ -0,0 +1,79 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from instrument_front import instrument_front_from_calibration
+from keyboard_set import keyboard_layout, keyboards_from_calibration
+from cameras import TOP, FRONT, camera_roles_from_env, submit_cameras
+from engine import load_piano, shutdown
+from calibration import calibration_path, load_calibration
+from pipeline import Pipeline
+from startup import Warmup
+from profiling import profiler_from_args
+from session_recorder import start_session_recorder_from_env
+from touch_onset import start_touch_onset_from_env
+from fingertip_tracker import start_tracking_from_env
+from motion_gate import start_motion_gate_from_env
+from config import env_str, env_float
+from log import log
+
+
+def main():
+    load_dotenv()
+
+    # calibration is done once with the full UI (main.py) and saved to file
+    path = calibration_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No calibration found at {path}, run main.py once to calibrate")
+    calibration = load_calibration(path)
+
+    # TOP_CAMERAS / FRONT_CAMERAS, they have to match the calibration
+    roles = camera_roles_from_env()
+    if len(roles[FRONT]) != len(calibration["fronts"]) or \
+            max(keyboard["camera"] for keyboard in calibration["keyboards"]) >= len(roles[TOP]):
+        raise ValueError(f"Cameras in .env don't match the calibration in {path}, run main.py to calibrate again")
+
+    # one job per camera and hands model, plus the soundfont
+    warmup = Warmup(max_workers=2 * sum(len(sources) for sources in roles.values()) + 1)
+
+    # load everything concurrently, the pipeline starts once it is all ready
+    # (two hands per keyboard)
+    cameras = submit_cameras(warmup, roles, max_num_hands=2 * len(calibration["keyboards"]))
+    top_caps, hands_top = cameras[TOP]
+    front_caps, hands_front = cameras[FRONT]
+    piano = warmup.submit("soundfont", load_piano)
+    warmup.all_submitted()
+
+    # layouts and channels come from the calibration, transposes from .env
+    transposes = [keyboard_layout(number)["transpose"]
+                  for number in range(1, len(calibration["keyboards"]) + 1)]
+    keyboards = keyboards_from_calibration(calibration, transposes)
+    instrument_front = instrument_front_from_calibration(calibration)
+
+    # same stages as the UI, just without the render stage
+    pipeline = Pipeline(top_caps, front_caps, hands_top, hands_front,
+                        keyboards, instrument_front, piano,
+                        stats_path=env_str("STAGE_TIMES_PATH"),
+                        stats_interval=env_float("STAGE_TIMES_INTERVAL", 10.0),
+                        profiler=profiler_from_args())
+    # RECORD_SESSION=<dir> records frames, fingertips and notes for replay.py
+    start_session_recorder_from_env(pipeline)
+    # TOUCH_ONSET=1 watches the table line between hands model runs for earlier note ons
+    start_touch_onset_from_env(pipeline)
+    # TRACK_FINGERTIPS=1 follows the fingertips with optical flow between hands model runs
+    start_tracking_from_env(pipeline)
+    # MOTION_GATE=1 skips the hands models while nothing moves over the keyboards or table
+    start_motion_gate_from_env(pipeline)
+    pipeline.start_playing()
+
+    log(f"Running headless with calibration from {path}")
+
+    try:
+        asyncio.run(pipeline.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown(warmup)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,37 @@
-import fluidsynth
 from SoundButton2 import SoundButton
 
 
+# notes are midi notes on channel 0, and channel * 128 + midi note on the
+# other channels (one keyboard per channel, see keyboard_set)
+NOTES_PER_CHANNEL = 128
+
+
+def voice(channel: int, midi_note: int) -> int:
+    """the note number Instrument plays midi_note on channel with"""
+    return channel * NOTES_PER_CHANNEL + midi_note
+
+
+def split_voice(note: int) -> tuple[int, int]:
+    """(channel, midi note) of a voice() note number"""
+    return divmod(note, NOTES_PER_CHANNEL)
+
+
 class Instrument:
 
-    def __init__(self, soundfont_path: str, initial_bank=0, initial_preset=0, volume=50):
+    def __init__(self, soundfont_path: str, initial_bank=0, initial_preset=0, volume=50, synth=None):
+        """
+        :param synth: optional stand in for fluidsynth.Synth, eg a
+                      synth_server.RemoteSynth, a fluidsynth synth is made if None
+        """
         self.current_notes = set()
 
-        # create synthesizer object
-        self.fs = fluidsynth.Synth()
+        if synth is None:
+            # imported here so it can load in the background at startup
+            import fluidsynth
+
+            # create synthesizer object
+            synth = fluidsynth.Synth()
+        self.fs = synth
 
         # load soundfont and all sounds
         self.soundfont_path = soundfont_path
@@ -19,6 +42,14 @@ class Instrument:
         self.bank = initial_bank
         self.volume = volume
 
+        # midi channels the current sound has been selected on
+        self.channels = set()
+
+        # optional MidiRecorder that receives every note event
+        self.recorder = None
+        # optional latency_trace.LatencyTracer that receives every traced note on
+        self.tracer = None
+
     # def generate_soundbuttons(self, group_top_left, size, padding):
     #     """
     #     return list of buttons from the sounds in the soundfont
@@ -83,31 +114,55 @@ class Instrument:
         self.fs.setting("synth.gain", 2.0)
         self.fs.start()
 
-        self.fs.program_select(0, self.sfid, self.bank, self.preset)
+        self.select_channel(0)
+
+    def select_channel(self, channel: int) -> None:
+        """selects the current sound on channel, done the first time a channel plays"""
+        self.fs.program_select(channel, self.sfid, self.bank, self.preset)
+        self.channels.add(channel)
+
+        if self.recorder is not None:
+            self.recorder.program_change(self.bank, self.preset, channel)
 
     def change_sound(self, new_sound):
         self.bank = new_sound[0]
         self.preset = new_sound[1]
-        self.fs.program_select(0, self.sfid, self.bank, self.preset)
+
+        for channel in sorted(self.channels):
+            self.select_channel(channel)
 
     def stop(self) -> None:
         self.fs.delete()
 
-    def add_note(self, midi_note: int) -> None:
+    def add_note(self, midi_note: int, trace=None) -> None:
+        """:param midi_note: midi note, or voice() for channels other than 0"""
         self.current_notes.add(midi_note)
 
-        self.fs.noteon(0, midi_note, self.volume)
+        channel, note = split_voice(midi_note)
+        if channel not in self.channels:
+            self.select_channel(channel)
+        self.fs.noteon(channel, note, self.volume)
+
+        if self.tracer is not None and trace is not None:
+            self.tracer.note_on(midi_note, trace)
+
+        if self.recorder is not None:
+            self.recorder.note_on(note, self.volume, channel)
 
     def remove_note(self, midi_note) -> None:
         if midi_note not in self.current_notes:
             return
 
         self.current_notes.remove(midi_note)
-        self.fs.noteoff(0, midi_note)
+        channel, note = split_voice(midi_note)
+        self.fs.noteoff(channel, note)
+
+        if self.recorder is not None:
+            self.recorder.note_off(note, channel)
 
     def remove_all_notes(self):
-        for i in range(30, 150):
-            self.remove_note(i)
+        for note in list(self.current_notes):
+            self.remove_note(note)
 
     def is_playing(self, midi_note) -> bool:
         return midi_note in self.current_notes
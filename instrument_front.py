@@ -1,6 +1,7 @@
 import numpy as np
 import cv2
 from math_functions import distance_to_line
+from camera_frame import as_frame
 
 
 class InstrumentFront():
@@ -67,8 +68,10 @@ class InstrumentFront():
             (255, 255, 255)  # White
         ]
 
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Convert to grayscale (shared with other detectors if image is a camera_frame.Frame)
+        frame = as_frame(image)
+        gray = frame.gray
+        image = frame.bgr
 
         # Canny edge detection
         edges = cv2.Canny(gray, 100, 150)
@@ -171,4 +174,67 @@ class InstrumentFront():
         self.table_endpoints = np.array(endpoint_list)
 
 
-    
\ No newline at end of file
+class TableSegments:
+    """
+    Several front cameras, each watching its own segment of the table line
+    with its own InstrumentFront. Works like an InstrumentFront in the note
+    engine: front fingertips from camera i have i added to their x (see
+    engine.merge_keypoints) and are judged by that camera's InstrumentFront.
+    """
+
+    def __init__(self, instrument_fronts):
+        """
+        :param instrument_fronts: one InstrumentFront per front camera, in camera order
+        """
+        self.instrument_fronts = list(instrument_fronts)
+
+    def __len__(self) -> int:
+        return len(self.instrument_fronts)
+
+    def __iter__(self):
+        return iter(self.instrument_fronts)
+
+    def __getitem__(self, index) -> InstrumentFront:
+        return self.instrument_fronts[index]
+
+    @property
+    def table_endpoints(self):
+        """the first camera's table line"""
+        return self.instrument_fronts[0].table_endpoints
+
+    def get_pressed_fingers(self, front_fingers, top_fingers):
+        """
+        Returns the set of top_fingers whose corresponding front_fingers are pressed
+        """
+        last = len(self.instrument_fronts) - 1
+
+        pressed = []
+        for front_finger, top_finger in zip(front_fingers, top_fingers):
+            camera = min(last, max(0, int(front_finger[0])))
+            instrument_front = self.instrument_fronts[camera]
+            if instrument_front.is_pressed((front_finger[0] - camera, front_finger[1]),
+                                           instrument_front.table_distance_threshold):
+                pressed.append(top_finger)
+
+        return pressed
+
+
+def make_instrument_front(num_cameras=1, table_distance_threshold=0.015):
+    """an uncalibrated InstrumentFront, or TableSegments of one per camera"""
+    if num_cameras == 1:
+        return InstrumentFront([], [], table_distance_threshold)
+
+    return TableSegments(InstrumentFront([], [], table_distance_threshold) for _ in range(num_cameras))
+
+
+def instrument_front_from_calibration(calibration, table_distance_threshold=0.015):
+    """
+    calibrated InstrumentFront (or TableSegments) from a load_calibration output
+    """
+    instrument_fronts = []
+    for endpoints in calibration["fronts"]:
+        instrument_front = InstrumentFront([], [], table_distance_threshold)
+        instrument_front.set_endpoints(list(endpoints))
+        instrument_fronts.append(instrument_front)
+
+    return instrument_fronts[0] if len(instrument_fronts) == 1 else TableSegments(instrument_fronts)
@@ -1,11 +1,48 @@
 import numpy as np
-from math_functions import in_quadrilateral , is_right_of_line , get_white_note , distance
+from math_functions import in_quadrilateral , is_right_of_line , distance
 from log import log
 
+# pitch classes of the white keys (C D E F G A B)
+WHITE_PITCH_CLASSES = (0, 2, 4, 5, 7, 9, 11)
+
 class InstrumentTop:
-    def __init__(self,piano_corners,num_white_keys):
+    def __init__(self,piano_corners,num_white_keys,lowest_note=60,transpose=0):
+        """
+        :param piano_corners: 4 corners of the paper piano
+        :param num_white_keys: number of white keys (52 for a full 88 key piano)
+        :param lowest_note: midi note of the leftmost white key (60 = middle C, 21 = A0)
+        :param transpose: octaves to shift the played notes by
+        """
+        if lowest_note % 12 not in WHITE_PITCH_CLASSES:
+            raise ValueError(f"Lowest note {lowest_note} is not a white key")
+
         self.piano_corners = piano_corners
         self.num_keys = num_white_keys
+        self.lowest_note = lowest_note
+        self.transpose = transpose
+
+        # midi note of each white key, walking up the white keys from lowest_note
+        white_midi = [lowest_note]
+        for _ in range(num_white_keys - 1):
+            note = white_midi[-1] + 1
+            while note % 12 not in WHITE_PITCH_CLASSES:
+                note += 1
+            white_midi.append(note)
+
+        # note index (semitones above lowest_note) of each white key
+        self.white_note_index = [note - lowest_note for note in white_midi]
+
+        # for each line between two keys, whether there is a black key on it
+        # (a whole tone between the white keys), never on the outer edges
+        self.has_black_key = [False] + [
+            white_midi[i] - white_midi[i-1] == 2 for i in range(1, num_white_keys)
+        ] + [False]
+
+        # note index -> midi note
+        first_midi = lowest_note + 12 * transpose
+        self.midi_table = [first_midi + i for i in range(self.white_note_index[-1] + 1)]
+        if self.midi_table[0] < 0 or self.midi_table[-1] > 127:
+            raise ValueError(f"Keyboard covers midi notes {self.midi_table[0]}-{self.midi_table[-1]}, outside 0-127")
     
     def get_all_keys_points(self):
         '''
@@ -30,7 +67,7 @@ class InstrumentTop:
         black_keys_bottom_point =[]
 
         for i in range(len(lines_top_point)):
-            if i % 7 == 3 or i % 7 == 0:
+            if not self.has_black_key[i]:
                 black_keys_top_point.append(None)
                 black_keys_bottom_point.append(None)
                 black_keys_top_point.append(None)
@@ -94,19 +131,19 @@ class InstrumentTop:
                 # print(lines_top_point[mid], lines_top_point[mid+1], lines_bottom_point[mid], lines_bottom_point[mid+1])
                 if in_quadrilateral(finger, lines_top_point[mid], lines_top_point[mid+1], lines_bottom_point[mid], lines_bottom_point[mid+1]) :
                     if in_quadrilateral(finger, black_keys_top_point[2*mid], black_keys_top_point[2*mid+1], black_keys_bottom_point[2*mid], black_keys_bottom_point[2*mid+1]):
-                        notes.append(get_white_note(mid)-1)
+                        notes.append(self.white_note_index[mid]-1)
                         mid_cordinates_played_note.append((black_keys_top_point[2*mid]+black_keys_top_point[2*mid+1])/2)
                         width_played_key.append(distance(black_keys_top_point[2*mid], black_keys_top_point[2*mid+1]))
                         top_coner_left_x_coordinate.append(black_keys_top_point[2*mid][0])
                     
                     elif in_quadrilateral(finger, black_keys_top_point[2*mid+2], black_keys_top_point[2*mid+3], black_keys_bottom_point[2*mid+2], black_keys_bottom_point[2*mid+3]):
-                        notes.append(get_white_note(mid)+1)
+                        notes.append(self.white_note_index[mid]+1)
                         mid_cordinates_played_note.append((black_keys_top_point[2*mid+2]+black_keys_top_point[2*mid+3])/2)
                         width_played_key.append(distance(black_keys_top_point[2*mid+2], black_keys_top_point[2*mid+3]))
                         top_coner_left_x_coordinate.append(black_keys_top_point[2*mid+2][0])
 
                     else:
-                        notes.append(get_white_note(mid))
+                        notes.append(self.white_note_index[mid])
                         mid_cordinates_played_note.append((lines_top_point[mid]+lines_top_point[mid+1])/2)
                         width_played_key.append(distance(lines_top_point[mid], lines_top_point[mid+1]))
                         top_coner_left_x_coordinate.append(lines_top_point[mid][0])
@@ -127,12 +164,29 @@ class InstrumentTop:
         return set(notes) , mid_cordinates_played_note , width_played_key , top_coner_left_x_coordinate
     
     
-    def index_to_midi(self, index):
-        """Assumes index 0 = lowest C
-        Makes lowest note = middle C (for now)
+    def get_key_polygons(self, key_points):
+        """
+        :param key_points: get_all_keys_points output
+        :returns: note index -> the key's 4 corners (top left, top right, bottom right, bottom left)
         """
+        lines_top_point, lines_bottom_point, black_keys_top_point, black_keys_bottom_point = key_points
+
+        polygons = {}
+        for i in range(self.num_keys):
+            polygons[self.white_note_index[i]] = (lines_top_point[i], lines_top_point[i+1],
+                                                  lines_bottom_point[i+1], lines_bottom_point[i])
+
+            # black key on the line on the left of this white key, same lookup as get_notes
+            if self.has_black_key[i]:
+                polygons[self.white_note_index[i]-1] = (black_keys_top_point[2*i], black_keys_top_point[2*i+1],
+                                                        black_keys_bottom_point[2*i+1], black_keys_bottom_point[2*i])
+
+        return polygons
+
+    def index_to_midi(self, index):
+        """Index 0 = leftmost white key (lowest_note), shifted by transpose octaves"""
 
-        return index + 60
+        return self.midi_table[index]
         
 
 
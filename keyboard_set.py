@@ -0,0 +1,236 @@
+import numpy as np
+from instrument_top import InstrumentTop
+from instrument import voice
+from math_functions import in_quadrilateral
+from config import env_int
+
+
+# cells per side of the grid over the keyboards
+GRID_SIZE = 16
+
+# midi channels, channel 9 (10 in most midi software) is drums
+MIDI_CHANNELS = 16
+DRUM_CHANNEL = 9
+# one channel each, skipping the drums
+MAX_KEYBOARDS = MIDI_CHANNELS - 1
+
+
+class Keyboard:
+    """one paper keyboard of a KeyboardSet"""
+    __slots__ = ("instrument_top", "channel", "camera", "key_points", "bounds")
+
+    def __init__(self, instrument_top: InstrumentTop, channel=0, camera=0):
+        """
+        :param instrument_top: the keyboard's layout and corners
+        :param channel: midi channel its notes are played on
+        :param camera: index of the top camera it is under, its corners have
+                       this added to x (see engine.merge_keypoints)
+        """
+        if not 0 <= channel < MIDI_CHANNELS:
+            raise ValueError(f"Keyboard channel {channel} is outside 0-{MIDI_CHANNELS - 1}")
+
+        self.instrument_top = instrument_top
+        self.channel = channel
+        self.camera = camera
+
+        # set by KeyboardSet.build once the corners are known
+        self.key_points = None
+        # (left, top, right, bottom) around the corners, normalized
+        self.bounds = None
+
+    def midi(self, note_index) -> int:
+        """note number (see instrument.voice) of one of the keyboard's note indices"""
+        return voice(self.channel, self.instrument_top.index_to_midi(note_index))
+
+
+class KeyboardSet:
+    """
+    Several paper keyboards under the top camera(s), each with its own
+    InstrumentTop (layout, lowest note, transpose) and midi channel.
+
+    A uniform grid over the keyboards lists the keyboards whose bounds touch
+    each cell, so a fingertip finds its keyboard with one cell lookup
+    (plus a corner check where keyboards share a cell) and only that
+    keyboard's keys are searched, however many keyboards there are.
+    """
+
+    def __init__(self, keyboards, grid_size=GRID_SIZE):
+        """
+        :param keyboards: Keyboards, or InstrumentTops to play on channel 0
+        :param grid_size: cells per side of the spatial index
+        """
+        self.keyboards = [k if isinstance(k, Keyboard) else Keyboard(k) for k in keyboards]
+        self.grid_size = grid_size
+
+        # grid_size * grid_size cells, each a tuple of keyboard indices
+        self.grid = None
+        # (left, top) of the grid and cells per normalized unit
+        self.origin = (0.0, 0.0)
+        self.scale = (grid_size, grid_size)
+        # every keyboard's get_all_keys_points output, in keyboard order
+        self.key_points = None
+
+    def __len__(self) -> int:
+        return len(self.keyboards)
+
+    def __iter__(self):
+        return iter(self.keyboards)
+
+    def __getitem__(self, index) -> Keyboard:
+        return self.keyboards[index]
+
+    @property
+    def primary(self) -> InstrumentTop:
+        """the first keyboard, the one a single keyboard setup has"""
+        return self.keyboards[0].instrument_top
+
+    def build(self) -> None:
+        """called once every keyboard's corners are set, works out the keys and fills the grid"""
+        size = self.grid_size
+        cells = [[] for _ in range(size * size)]
+
+        for keyboard in self.keyboards:
+            keyboard.key_points = keyboard.instrument_top.get_all_keys_points()
+
+            corners = np.asarray(keyboard.instrument_top.piano_corners, dtype=float)
+            left, top = corners.min(axis=0)
+            right, bottom = corners.max(axis=0)
+            keyboard.bounds = (float(left), float(top), float(right), float(bottom))
+
+        # the grid covers every keyboard, however many cameras they are spread over
+        left = min(keyboard.bounds[0] for keyboard in self.keyboards)
+        top = min(keyboard.bounds[1] for keyboard in self.keyboards)
+        right = max(keyboard.bounds[2] for keyboard in self.keyboards)
+        bottom = max(keyboard.bounds[3] for keyboard in self.keyboards)
+        self.origin = (left, top)
+        self.scale = (size / max(right - left, 1e-6), size / max(bottom - top, 1e-6))
+
+        for index, keyboard in enumerate(self.keyboards):
+            left, top, right, bottom = keyboard.bounds
+            first_col, first_row = self.cell(left, top)
+            last_col, last_row = self.cell(right, bottom)
+            for row in range(first_row, last_row + 1):
+                for col in range(first_col, last_col + 1):
+                    cells[row * size + col].append(index)
+
+        self.grid = [tuple(cell) for cell in cells]
+        self.key_points = [keyboard.key_points for keyboard in self.keyboards]
+
+    def cell(self, x, y) -> tuple[int, int]:
+        """(column, row) of the grid cell a point is in, clamped to the grid"""
+        last = self.grid_size - 1
+        return (min(last, max(0, int((x - self.origin[0]) * self.scale[0]))),
+                min(last, max(0, int((y - self.origin[1]) * self.scale[1]))))
+
+    def keyboard_for(self, finger):
+        """:returns: index of the keyboard under finger, None if there isn't one"""
+        col, row = self.cell(finger[0], finger[1])
+        candidates = self.grid[row * self.grid_size + col]
+
+        # get_notes throws out fingers between the keys anyway, only overlaps need checking
+        if len(candidates) == 1:
+            return candidates[0]
+
+        for index in candidates:
+            corners = self.keyboards[index].instrument_top.piano_corners
+            if in_quadrilateral(finger, *corners):
+                return index
+
+        return None
+
+    def route(self, fingers) -> list[list]:
+        """splits fingers into one list per keyboard"""
+        routed = [[] for _ in self.keyboards]
+        for finger in fingers:
+            index = self.keyboard_for(finger)
+            if index is not None:
+                routed[index].append(finger)
+
+        return routed
+
+    def get_notes(self, fingers) -> list:
+        """
+        :param fingers: pressed fingertips from the top camera
+        :returns: InstrumentTop.get_notes output for each keyboard, in keyboard
+                  order (None for keyboards with no fingers on them)
+        """
+        return [
+            keyboard.instrument_top.get_notes(keyboard_fingers, *keyboard.key_points) if keyboard_fingers else None
+            for keyboard, keyboard_fingers in zip(self.keyboards, self.route(fingers))
+        ]
+
+    def midi_notes(self, keyboard_notes) -> set:
+        """note numbers (see instrument.voice) of a get_notes output"""
+        return {
+            keyboard.midi(note)
+            for keyboard, notes in zip(self.keyboards, keyboard_notes) if notes is not None
+            for note in notes[0]
+        }
+
+
+def keyboard_layout(number) -> dict:
+    """
+    layout of keyboard number (from 1) from .env, the first keyboard uses
+    NUM_WHITE_KEYS, LOWEST_NOTE and OCTAVE_TRANSPOSE and the others
+    KEYBOARD<number>_NUM_WHITE_KEYS etc, falling back to the first one's
+
+    :returns: dict with "num_white_keys", "lowest_note", "transpose",
+              "channel" and "camera" (index into TOP_CAMERAS)
+    """
+    layout = {
+        "num_white_keys": env_int("NUM_WHITE_KEYS", 21),
+        "lowest_note": env_int("LOWEST_NOTE", 60),
+        "transpose": env_int("OCTAVE_TRANSPOSE", 0),
+    }
+    if number > 1:
+        layout = {
+            "num_white_keys": env_int(f"KEYBOARD{number}_NUM_WHITE_KEYS", layout["num_white_keys"]),
+            "lowest_note": env_int(f"KEYBOARD{number}_LOWEST_NOTE", layout["lowest_note"]),
+            "transpose": env_int(f"KEYBOARD{number}_TRANSPOSE", layout["transpose"]),
+        }
+    # keep clear of the drums
+    default_channel = number - 1 if number - 1 < DRUM_CHANNEL else number
+    layout["channel"] = env_int(f"KEYBOARD{number}_CHANNEL", default_channel)
+    if not 0 <= layout["channel"] < MIDI_CHANNELS:
+        raise ValueError(f"KEYBOARD{number}_CHANNEL must be 0-{MIDI_CHANNELS - 1}, not {layout['channel']}")
+    # counted from 1 like the keyboards
+    layout["camera"] = env_int(f"KEYBOARD{number}_CAMERA", 1) - 1
+
+    return layout
+
+
+def keyboards_from_env() -> KeyboardSet:
+    """KEYBOARDS (default 1) uncalibrated keyboards laid out by keyboard_layout"""
+    count = env_int("KEYBOARDS", 1)
+    if not 1 <= count <= MAX_KEYBOARDS:
+        raise ValueError(f"KEYBOARDS must be 1-{MAX_KEYBOARDS} (one midi channel each), not {count}")
+
+    keyboards = []
+    for number in range(1, count + 1):
+        layout = keyboard_layout(number)
+        instrument_top = InstrumentTop([], num_white_keys=layout["num_white_keys"],
+                                       lowest_note=layout["lowest_note"], transpose=layout["transpose"])
+        keyboards.append(Keyboard(instrument_top, layout["channel"], layout["camera"]))
+
+    return KeyboardSet(keyboards)
+
+
+def keyboards_from_calibration(calibration, transposes) -> KeyboardSet:
+    """
+    calibrated keyboards from a load_calibration output
+
+    :param transposes: octave transpose of each keyboard, the last one is used
+                       for any keyboards after it
+    """
+    keyboards = []
+    for index, layout in enumerate(calibration["keyboards"]):
+        instrument_top = InstrumentTop([], num_white_keys=layout["num_white_keys"],
+                                       lowest_note=layout["lowest_note"],
+                                       transpose=transposes[min(index, len(transposes) - 1)])
+        instrument_top.set_corners(list(layout["corners"]))
+        keyboards.append(Keyboard(instrument_top, layout["channel"], layout["camera"]))
+
+    keyboard_set = KeyboardSet(keyboards)
+    keyboard_set.build()
+
+    return keyboard_set
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from config import env_str, env_float
+
+
+class FrameTrace:
+    """
+    Timeline of one frame pair through the pipeline, as time.perf_counter()
+    seconds. The capture stage creates it and every later stage stamps it, so
+    a note on can be traced back to the frames it came from.
+
+    top_captured/front_captured are when the camera threads received the
+    frames (the oldest top and front frame with several cameras), anything
+    before that (exposure, driver buffering) isn't visible.
+    """
+    __slots__ = ("seq", "top_captured", "front_captured", "paired", "inferred", "resolved")
+
+    def __init__(self, seq, top_captured, front_captured):
+        self.seq = seq
+        self.top_captured = top_captured
+        self.front_captured = front_captured
+        self.paired = time.perf_counter()
+        self.inferred = None
+        self.resolved = None
+
+    @property
+    def captured(self) -> float:
+        """the older of the two frames, the touch can't have been seen before it"""
+        return min(self.top_captured, self.front_captured)
+
+
+class LatencyTracer:
+    """
+    Writes one json line per note on with the timeline of the frame it came
+    from, from a background thread
+
+    note_on() is called from the audio stage and only appends to a deque, the
+    writer thread appends the lines to path every flush_interval seconds.
+    """
+
+    def __init__(self, path, flush_interval=2.0):
+        """
+        :param path: .jsonl file to append to, may contain strftime codes
+        :param flush_interval: seconds between writes
+        """
+        self.path = time.strftime(path)
+        self.flush_interval = flush_interval
+
+        # (note, FrameTrace, time sent to the synth)
+        self.events = deque()
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops the writer thread and writes what is left"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    # ---------- hot path (audio stage) ----------
+
+    def note_on(self, note: int, trace: FrameTrace) -> None:
+        self.events.append((note, trace, time.perf_counter()))
+
+    # ---------- writer thread ----------
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+        self.flush()
+
+    def flush(self) -> None:
+        if not self.events:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with open(self.path, "a") as f:
+            while self.events:
+                note, trace, sent = self.events.popleft()
+                f.write(json.dumps(trace_record(note, trace, sent)) + "\n")
+
+
+def trace_record(note, trace, sent) -> dict:
+    """the json line for one note on, times in ms after the oldest frame was captured"""
+    captured = trace.captured
+
+    def ms(timestamp):
+        return round((timestamp - captured) * 1000, 3)
+
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "note": note,
+        "seq": trace.seq,
+        "top_captured": ms(trace.top_captured),
+        "front_captured": ms(trace.front_captured),
+        "paired": ms(trace.paired),
+        "inferred": ms(trace.inferred),
+        "resolved": ms(trace.resolved),
+        "sent": ms(sent),
+    }
+
+
+def start_tracer_from_env(instrument):
+    """
+    starts a LatencyTracer on instrument if LATENCY_TRACE is set in .env
+
+    :param instrument: Instrument whose note ons are traced
+    :returns: the started tracer, or None if tracing is off
+    """
+    path = env_str("LATENCY_TRACE")
+    if path is None:
+        return None
+
+    tracer = LatencyTracer(path, flush_interval=env_float("LATENCY_TRACE_FLUSH", 2.0))
+    tracer.start()
+    instrument.tracer = tracer
+
+    return tracer
+
+
+# ------------------ SUMMARY ------------------
+
+# name -> (from, to) timeline points
+SEGMENTS = {
+    "capture -> paired": ("captured", "paired"),
+    "paired -> inferred": ("paired", "inferred"),
+    "inferred -> resolved": ("inferred", "resolved"),
+    "resolved -> sent": ("resolved", "sent"),
+    "touch -> note on": ("captured", "sent"),
+}
+
+
+def load_trace(path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records) -> dict:
+    """
+    :returns: segment -> {"count", "mean", "p50", "p90", "p95", "p99", "max"} in ms
+    """
+    summary = {}
+    for name, (start, end) in SEGMENTS.items():
+        # records are relative to the oldest captured frame
+        values = sorted(record[end] - (0.0 if start == "captured" else record[start])
+                        for record in records)
+        if not values:
+            continue
+
+        def percentile(p):
+            return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+        summary[name] = {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(50),
+            "p90": percentile(90),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": values[-1],
+        }
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency distributions of LATENCY_TRACE files")
+    parser.add_argument("traces", nargs="+", help="trace files, eg one per release to compare")
+    parser.add_argument("--json", default=None, help="also write the summaries to this file")
+    args = parser.parse_args()
+
+    summaries = {}
+    for path in args.traces:
+        summaries[path] = summarize(load_trace(path))
+
+        print(f"{path}")
+        print(f"{'segment':<22} {'count':>6} {'mean':>7} {'p50':>7} {'p90':>7} {'p95':>7} {'p99':>7} {'max':>7} ms")
+        for name, s in summaries[path].items():
+            print(f"{name:<22} {s['count']:>6} {s['mean']:7.1f} {s['p50']:7.1f} {s['p90']:7.1f} "
+                  f"{s['p95']:7.1f} {s['p99']:7.1f} {s['max']:7.1f}")
+        print()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,430 +1,530 @@
-import cv2
+import time
+# taken before the other imports so the startup report includes them
+START_TIME = time.perf_counter()
+
+import asyncio
 import os
 import numpy as np
-import mediapipe as mp
 from dotenv import load_dotenv
-import time
-import video
 import pygame
-import fluidsynth
-from instrument_top import InstrumentTop
-from instrument_front import InstrumentFront
+from instrument_front import TableSegments, make_instrument_front
+from keyboard_set import keyboards_from_env
+from cameras import TOP, FRONT, camera_roles_from_env, submit_cameras
 from instrument import Instrument
-from NoteRise import RisingNote, Spark
+from NoteRise import RisingNote
+from particles import ParticleSystem
+from SoundButton2 import SoundButtonPanel
+from fonts import get_font
+from compositor import Compositor
+from qos import QualityController
 import draw_functions
 import random
-from log import log
-from SoundButton2 import SoundButton
-
-def initialize_mediapipe_hands(num_frames: int):
-    # Initializes mediapipe hands models
-
-    if num_frames > 2:
-        raise ValueError("Maximum 2 frames permitted")
-
-    mp_hands = mp.solutions.hands
-
-    hands = []
-    for _ in range(num_frames):
-        hand = mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=2,
-            model_complexity=1,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-
-        hands.append(hand)
-
-    return hands
-
-
-def process_frame(frame, hand_model):
-    # Runs mediapipe hands on frame
-
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    hand_results = hand_model.process(rgb_frame)
-
-    left_hand_keypoints = []
-    right_hand_keypoints = []
-
-    if hand_results.multi_hand_landmarks and hand_results.multi_handedness:
-        for landmarks, handedness in zip(
-            hand_results.multi_hand_landmarks,
-            hand_results.multi_handedness
-        ):
-            # get handedness label ("Left" or "Right")
-            label = handedness.classification[0].label
-
-            # fingertip indices
-            finger_indices = [4, 8, 12, 16, 20]
-
-            points = [
-                [landmarks.landmark[i].x, landmarks.landmark[i].y]
-                for i in finger_indices
-            ]
-
-            if label == "Left":
-                left_hand_keypoints = points
-            elif label == "Right":
-                right_hand_keypoints = points
-
-    return left_hand_keypoints, right_hand_keypoints
-
-
-def play_notes(piano: Instrument, playing_notes) -> None:
-    """Plays notes on instrument
-    args:
-        piano: Intrument
-        playing_notes: set of playing notes
-
-    returns:
-        None
-    """
-
-    for i in range(50, 140):
-        if piano.is_playing(i):
-            if i not in playing_notes:
-                piano.remove_note(i)
-        else:
-            if i in playing_notes:
-                piano.add_note(i)
-
+from engine import load_piano, shutdown
+from calibration import calibration_path, save_calibration
+from pipeline import Pipeline
+from startup import Warmup
+from profiling import profiler_from_args
+from session_recorder import start_session_recorder_from_env
+from touch_onset import start_touch_onset_from_env
+from fingertip_tracker import start_tracking_from_env
+from motion_gate import start_motion_gate_from_env
+from screen_recorder import start_screen_recorder_from_env
+from config import env_bool, env_str, env_float
 
 # constants for states
 SELECT_PIANO = 0
 SELECT_TABLE = 1
 RUNNING = 2
 
+# colours for notes and particles
+NOTE_COLOURS = [(0, 255, 150), (0, 220, 255), (255, 100, 255), (255, 255, 100)]
 
-def main():
-    load_dotenv()
-
-    # -------------- PYGAME THINGS --------------
-
-    # initialize pygame
-    pygame.init()
-
-    # set up pygame
-    pygame_screen = pygame.display.set_mode((1280, 720))
-    clock = pygame.time.Clock()
-
-    # array of corners clicked
-    corner_positions = []
-    # corners saved
-    corners_saved = False
-    # colour to indicate corner save status
-    corner_colour = {True: "green", False: "red"}
-
-    # keyboard points
-    white_key_tops = []
-    white_key_bases = []
-    black_key_tops = []
-    black_key_bases = []
 
-    # array of table endpoints clicked
-    endpoint_positions = []
-    # endpoints saved
-    endpoints_saved = False
-    # colour to indicate endpoint save status
-    endpoint_colour = {True: "green", False: "red"}
+class App:
+    """pygame front end: calibration clicks, camera panels, sound buttons and effects"""
 
-    # start pygame loop
-    running = True
+    def __init__(self, pipeline: Pipeline, warmup: Warmup = None, window_size=(1280, 720)):
+        self.pipeline = pipeline
+        self.warmup = warmup
+        self.keyboards = pipeline.keyboards
+        self.instrument_top = pipeline.instrument_top
+        self.instrument_front = pipeline.instrument_front
+        # one InstrumentFront per front camera
+        if isinstance(self.instrument_front, TableSegments):
+            self.fronts = list(self.instrument_front)
+        else:
+            self.fronts = [self.instrument_front]
+
+        # -------------- PYGAME THINGS --------------
+
+        # initialize pygame
+        pygame.init()
+
+        # set up pygame
+        self.screen = pygame.display.set_mode(window_size)
+
+        # detect window height and width
+        self.window_width, self.window_height = self.screen.get_size()
+
+        # only sends the changed parts of the window to the display
+        self.compositor = Compositor(self.screen, enabled=env_bool("DIRTY_RECTS", True))
+
+        # array of corners clicked, 4 per keyboard (with the top camera index added to x)
+        self.corner_positions = []
+        # corners saved
+        self.corners_saved = False
+        # colour to indicate corner save status
+        self.corner_colour = {True: "green", False: "red"}
+
+        # array of table endpoints clicked, 2 per front camera
+        self.endpoint_positions = []
+
+        # set current state in app
+        self.state = SELECT_PIANO
+
+        # number of frames drawn
+        self.total_frames = 0
+
+        # sparks that appear when a key is played
+        self.particles = ParticleSystem()
+        self.active_rising_notes = {}
+        self.finished_notes = []
+        # ambient sparks along the bottom of the window
+        self.particles1 = ParticleSystem(capacity=512)
+
+        # camera panels, each keeps its frame buffers between frames
+        panel_size = (self.window_width // 2, self.window_height // 2)
+        self.top_presenter = draw_functions.FramePresenter(panel_size)
+        self.front_presenter = draw_functions.FramePresenter(panel_size)
+        # full window frame for the calibration screens
+        self.calibration_presenter = draw_functions.FramePresenter()
+
+        # key outlines and table line, redrawn only when the calibration changes
+        self.keys_overlay = draw_functions.OverlayLayer(self.render_keys_overlay)
+        self.table_overlay = draw_functions.OverlayLayer(self.render_table_overlay)
+        self.key_highlights = [draw_functions.KeyHighlights(keyboard.instrument_top)
+                               for keyboard in self.keyboards]
+
+        # sound buttons, made once the piano has loaded
+        self.all_soundbuttons = []
+        self.button_panel = None
+
+        # font for the loading message
+        self.font = get_font("LibreFranklin-Regular.ttf", 14)
+
+        # drops eye candy when frames run over budget (QOS=false to turn off)
+        self.quality = QualityController(1 / pipeline.render_fps, enabled=env_bool("QOS", True))
+        # camera frames on screen, held for a few frames at the lower quality levels
+        self.shown_frames = (None, None)
+
+        # stage latency HUD, toggled with h
+        self.show_hud = env_bool("SHOW_HUD", False)
+        self.hud_surfaces = []
+        self.hud_updated = 0
+        self.hud_font = pygame.font.SysFont("couriernew,monospace", 13)
+
+        # optional screen_recorder.ScreenRecorder, records the window while playing
+        self.screen_recorder = None
+
+    @property
+    def piano(self) -> Instrument:
+        return self.pipeline.piano
+
+    def object_counts(self) -> dict:
+        """sizes of the effect lists, logged with each memory snapshot"""
+        return {
+            "particles": len(self.particles),
+            "particles1": len(self.particles1),
+            "active_rising_notes": len(self.active_rising_notes),
+            "finished_notes": len(self.finished_notes),
+        }
+
+    def create_soundbuttons(self) -> None:
+        # The Instrument class now uses the new SoundButton logic
+        self.all_soundbuttons = self.piano.generate_soundbuttons(
+            group_top_left=(self.window_width // 2 + 150, 100),
+            size=(180, 50),
+            padding=(20, 15)
+        )
+        self.button_panel = SoundButtonPanel(self.all_soundbuttons)
 
-    # set current state in app
-    state = SELECT_PIANO
-    # -----------------------------------------
+    def handle_events(self) -> bool:
+        """polls pygame events, returns False when the app should close"""
+        for event in pygame.event.get():
+            # check for exit (window close button or q)
+            if event.type == pygame.QUIT:
+                return False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_q:
+                return False
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                self.show_hud = not self.show_hud
+            # window was uncovered or restored, send all of it again
+            if event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED):
+                self.compositor.invalidate()
+            # check for mouse left click
+            if (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1):
+                self.handle_click(event.pos)
+
+        return True
+
+    def calibration_keyboard(self):
+        """the keyboard whose corners are being clicked"""
+        return self.keyboards[min(len(self.corner_positions) // 4, len(self.keyboards) - 1)]
+
+    def calibration_front(self) -> int:
+        """index of the front camera whose table line is being clicked"""
+        return min(len(self.endpoint_positions) // 2, len(self.fronts) - 1)
+
+    def handle_click(self, position) -> None:
+        # Normalize clicked position
+        clicked_position = np.array(
+            [position[0] / self.window_width, position[1] / self.window_height])
+
+        # draw piano corner points
+        if self.state == SELECT_PIANO:
+            num_corners = 4 * len(self.keyboards)
+            # 4 corners of every keyboard not clicked yet -> add corner
+            if len(self.corner_positions) < num_corners:
+                camera = self.calibration_keyboard().camera
+                self.corner_positions.append(clicked_position + (camera, 0))
+            # all corners clicked -> confirm
+            elif len(self.corner_positions) == num_corners:
+                self.state = SELECT_TABLE
+                # pass to calculator, keyboards are clicked one after the other
+                for i, keyboard in enumerate(self.keyboards):
+                    keyboard.instrument_top.set_corners(self.corner_positions[4 * i:4 * i + 4])
+
+        elif self.state == SELECT_TABLE:
+            num_endpoints = 2 * len(self.fronts)
+            # 2 endpoints of every front camera not clicked yet -> add endpoint
+            if len(self.endpoint_positions) < num_endpoints:
+                self.endpoint_positions.append(clicked_position)
+            # all endpoints clicked -> confirm
+            elif len(self.endpoint_positions) == num_endpoints:
+                self.state = RUNNING
+                for i, instrument_front in enumerate(self.fronts):
+                    instrument_front.set_endpoints(self.endpoint_positions[2 * i:2 * i + 2])
+                # save so the headless engine can reuse this setup
+                save_calibration(calibration_path(), self.instrument_top.piano_corners,
+                                 self.instrument_front.table_endpoints, self.instrument_top.num_keys,
+                                 self.instrument_top.lowest_note, self.keyboards, self.instrument_front)
+                # start inference and note detection
+                self.pipeline.start_playing()
+
+        elif self.state == RUNNING:
+            # check whether any of the sound buttons are clicked
+            for button in self.all_soundbuttons:
+                if button.collides(position):
+                    self.piano.change_sound(button.sound)
+
+    def render(self, pipeline: Pipeline) -> bool:
+        """draws one frame, called by the pipeline render stage"""
+        start = time.perf_counter()
+
+        if not self.handle_events():
+            return False
+
+        top_frame, front_frame = pipeline.latest_frames
+        quality = self.quality.level
+        compositor = self.compositor
+
+        # the calibration screens redraw the whole window
+        if self.state != RUNNING:
+            compositor.invalidate()
 
-    # -------------- PROCESSING INIT --------------
+        # Draw pygame frame for each state
+        if self.state == SELECT_PIANO:
+            # the top camera of the keyboard being clicked
+            camera = self.calibration_keyboard().camera
+            self.screen.fill((20, 20, 20))
+            if pipeline.camera_frames[camera] is not None:
+                self.calibration_presenter.draw(self.screen, pipeline.camera_frames[camera])
 
-    # Initialize mediapipe hand models
-    hands_top, hands_front = initialize_mediapipe_hands(2)
+            # draw points to indicate corners
+            draw_functions.draw_points(screen=self.screen,
+                                       point_list=[p - (camera, 0) for i, p in enumerate(self.corner_positions)
+                                                   if self.keyboards[i // 4].camera == camera],
+                                       colour=self.corner_colour[self.corners_saved])
+
+        elif self.state == SELECT_TABLE:
+            front = self.calibration_front()
+            self.screen.fill((0, 0, 0))
+            if pipeline.camera_frames[pipeline.num_top + front] is not None:
+                self.calibration_presenter.draw(self.screen, pipeline.camera_frames[pipeline.num_top + front])
+
+            draw_functions.draw_points(screen=self.screen,
+                                       point_list=self.endpoint_positions[2 * front:2 * front + 2],
+                                       colour=self.corner_colour[self.corners_saved])
+
+        elif self.state == RUNNING:
+            timers = pipeline.timers
+
+            # show new camera frames less often at the lower quality levels
+            if self.total_frames % quality.camera_every:
+                top_frame, front_frame = self.shown_frames
+            self.shown_frames = (top_frame, front_frame)
+
+            with timers.time("draw frames"):
+                compositor.clear()
+                self.draw_cameras(top_frame, front_frame, pipeline.latest_keypoints, pipeline.latest_notes)
+
+            with timers.time("draw buttons"):
+                if self.button_panel is not None:
+                    mouse_p = pygame.mouse.get_pos()
+                    cur_s = (self.piano.bank, self.piano.preset)
+                    # redrawn every frame in case it was cleared, only sent when it changes
+                    if self.button_panel.draw(self.screen, mouse_p, cur_s):
+                        compositor.add(self.button_panel.rect)
+
+            with timers.time("particles"):
+                self.update_notes(pipeline.latest_notes, pipeline.latest_midi_notes, quality)
+                self.draw_effects(quality)
+
+        if not pipeline.ready:
+            compositor.add(self.draw_loading())
+        elif not self.all_soundbuttons:
+            self.create_soundbuttons()
+
+        if self.show_hud:
+            compositor.add(self.draw_hud(pipeline.timers))
+
+        self.total_frames += 1
+
+        # refresh pygame display
+        with pipeline.timers.time("display update"):
+            compositor.present()
+
+        if self.screen_recorder is not None and self.state == RUNNING:
+            with pipeline.timers.time("screen record"):
+                self.screen_recorder.capture(self.screen)
+
+        # slow inference or capture lowers the quality too, the camera wait isn't work
+        self.quality.add(time.perf_counter() - start, pipeline.timers.slowest(skip=("capture wait",)))
+
+        return True
+
+    def draw_hud(self, timers):
+        """draws the stage latency table, re-rendering the text twice a second
+        returns the Rect drawn to"""
+        now = time.perf_counter()
+        if now - self.hud_updated > 0.5:
+            self.hud_updated = now
+            lines = timers.hud_lines() + [
+                (f"quality level {self.quality.index}  load {self.quality.average:.0%} of budget",
+                 self.quality.index > 0)]
+            self.hud_surfaces = [
+                self.hud_font.render(text, True, (255, 80, 80) if over_budget else (220, 220, 220))
+                for text, over_budget in lines
+            ]
 
-    # Initialize the camera.
-    top_cap = video.Video(1)
-    front_cap = video.Video(0)
+        x = self.window_width // 2 + 10
+        y = self.window_height - 10 - sum(s.get_height() for s in self.hud_surfaces)
+        rect = pygame.Rect(x, y, 0, 0)
+        for surface in self.hud_surfaces:
+            rect.union_ip(self.screen.blit(surface, (x, y)))
+            y += surface.get_height()
+
+        return rect
+
+    def draw_loading(self):
+        """shows what is still loading in the background, returns the Rect drawn to"""
+        if self.warmup is None:
+            return None
+
+        text = "Loading: " + ", ".join(self.warmup.pending())
+        surface = self.font.render(text, True, (200, 200, 200))
+        return self.screen.blit(surface, (10, self.window_height - surface.get_height() - 10))
+
+    def draw_cameras(self, top_frame, front_frame, keypoints, playing_notes) -> None:
+        """
+        draws both camera panels with the calibration, playing keys and hand
+        points on top, the panels show the first top and front camera
+        """
+        (top_left, top_right), (front_left, front_right) = keypoints
+
+        # convert and draw frame in pygame
+        new_width = self.window_width // 2
+        new_height = self.window_height // 2
+        panel_size = (new_width, new_height)
+
+        compositor = self.compositor
+
+        if top_frame is not None:
+            frame_rect = self.top_presenter.draw(self.screen, top_frame)
+            # Draw the playing keys, then the white and black key outlines
+            if playing_notes is not None:
+                for keyboard, highlights, notes in zip(self.keyboards, self.key_highlights, playing_notes):
+                    if notes is not None and keyboard.camera == 0:
+                        highlights.draw(self.screen, keyboard.key_points, panel_size, notes[0])
+            compositor.add(self.keys_overlay.draw(self.screen, self.keyboards.key_points, panel_size))
+            compositor.add(frame_rect)
+            # Draw hand points
+            compositor.add(draw_functions.draw_hand_points_pg(self.screen, first_camera(top_left + top_right),
+                                                              frame_rect))
+
+        if front_frame is not None:
+            frame_rect = self.front_presenter.draw(self.screen, front_frame, (0, new_height))
+            compositor.add(self.table_overlay.draw(self.screen, self.instrument_front.table_endpoints,
+                                                   panel_size, (0, new_height)))
+            compositor.add(frame_rect)
+            compositor.add(draw_functions.draw_hand_points_pg(self.screen, first_camera(front_left + front_right),
+                                                              frame_rect))
+
+    def render_keys_overlay(self, surface, keyboard_key_points, size) -> None:
+        for keyboard, key_points in zip(self.keyboards, keyboard_key_points):
+            if keyboard.camera != 0:
+                continue
+            key_tops, key_bases, black_key_tops, black_key_bases = key_points
+            # Draw white keys
+            draw_functions.draw_keys(screen=surface, key_tops=key_tops, key_bases=key_bases, overlap=True,
+                                     outline_colour="blue", outline_width=3, window_width=size[0], window_height=size[1])
+            # Draw black keys
+            draw_functions.draw_keys(screen=surface, key_tops=black_key_tops, key_bases=black_key_bases, overlap=False,
+                                     outline_colour="red", outline_width=3, window_width=size[0], window_height=size[1])
+
+    def render_table_overlay(self, surface, table_endpoints, size) -> None:
+        draw_functions.draw_tabletop(surface, table_endpoints[0], table_endpoints[1], "blue", 4,
+                                     window_width=size[0], window_height=size[1])
+
+    def update_notes(self, playing_notes, playing_midi_notes, quality) -> None:
+        """starts and finishes rising notes and adds sparks for the playing notes"""
+        if playing_notes is None:
+            for note_obj in self.active_rising_notes.values():
+                note_obj.is_active = False
+                self.finished_notes.append(note_obj)
+            self.active_rising_notes.clear()
+            return
+
+        # set up all the smoke for curent playing notes
+        for keyboard, keyboard_notes in zip(self.keyboards, playing_notes):
+            # only the first top camera is on screen
+            if keyboard_notes is None or keyboard.camera != 0:
+                continue
 
-    # Initialize instruments
-    instrument_top = InstrumentTop([], num_white_keys=21)
-    instrument_front = InstrumentFront([], [], table_distance_threshold=0.015)
+            for note_idx, coord, width, x_coord in zip(*keyboard_notes):
+                midi_id = keyboard.midi(note_idx)
+                # Use coordinate relative to top-left camera view
+                px_x = coord[0] * self.window_width // 2
+                px_y = coord[1] * self.window_height // 2
+                px_w = width * self.window_width // 2
+                px_x_top_left = x_coord * self.window_width // 2
+
+                if midi_id not in self.active_rising_notes:
+                    self.active_rising_notes[midi_id] = RisingNote(
+                        px_x_top_left, px_y, px_w, random.choice(NOTE_COLOURS))
+
+                # Add sparkles at the key point every frame the finger is down
+                self.particles.emit(px_x, px_y, self.active_rising_notes[midi_id].color,
+                                    quality.sparks_per_finger)
+
+        # Transition notes to "Finished" once finger is lifted
+        for m_id in list(self.active_rising_notes.keys()):
+            if m_id not in playing_midi_notes:
+                note_obj = self.active_rising_notes.pop(m_id)
+                note_obj.is_active = False
+                self.finished_notes.append(note_obj)
+
+    def draw_effects(self, quality) -> None:
+        """updates and draws sparks and rising notes"""
+        if quality.ambient_sparks and self.total_frames % 30 == 0:
+            color = random.choice(NOTE_COLOURS)
+            px = random.random() * self.window_width // 2 + self.window_width // 2
+            py = self.window_height
+            self.particles1.emit(px, py, color, 6)
+
+        # Update all particles (removing dead ones) and draw them
+        self.particles.update()
+        self.compositor.add(self.particles.draw(self.screen))
+
+        self.particles1.update()
+        self.compositor.add(self.particles1.draw(self.screen))
+
+        # Draw Notes
+        all_visible_notes = self.finished_notes + \
+            list(self.active_rising_notes.values())
+        for note in all_visible_notes:
+            note.update()
+            if quality.note_glow:
+                self.compositor.add(note.draw(self.screen))
+            else:
+                self.compositor.add(note.draw_simple(self.screen))
+            # Cleanup notes that flew off the top
+            if note.y + note.h < -100:
+                if note in self.finished_notes:
+                    self.finished_notes.remove(note)
 
-    # soundfont_path = "Soundfont.sf2"
-    # piano = Instrument(soundfont_path=soundfont_path, preset=0, volume=100)
-    # piano.start()
 
+def first_camera(points) -> list:
+    """the merged fingertips (see engine.merge_keypoints) seen by the first camera"""
+    return [p for p in points if p[0] < 1]
 
-    # detect window height and width
-    window_width, window_height = pygame.display.get_surface().get_size()
 
-    total_time = 0
-    total_frames = 0
+def main():
+    load_dotenv()
 
-    # list of particles that will appear when a key is played
-    particles = []
-    active_rising_notes = {}
-    finished_notes = []
-    particles1= []
+    # keyboard layouts, a full 88 key piano is NUM_WHITE_KEYS=52 LOWEST_NOTE=21
+    # (KEYBOARDS=2 or more for several keyboards under the top camera)
+    keyboards = keyboards_from_env()
+    # TOP_CAMERAS / FRONT_CAMERAS, camera 1 on top and camera 0 in front by default
+    roles = camera_roles_from_env()
+    if max(keyboard.camera for keyboard in keyboards) >= len(roles[TOP]):
+        raise ValueError("A KEYBOARD<n>_CAMERA is past the cameras listed in TOP_CAMERAS")
 
-    # -------------------------------------------
+    # one job per camera and hands model, plus the soundfont
+    warmup = Warmup(START_TIME, max_workers=2 * sum(len(sources) for sources in roles.values()) + 1)
+    warmup.mark("imports")
 
+    # -------------- PROCESSING INIT --------------
 
-    # ------------- INIT SOUNDS ------------------
-    piano = Instrument(os.path.join(".", "Soundfont.sf2"), 0, 0, 50)
-    # The Instrument class now uses the new SoundButton logic
-    all_soundbuttons = piano.generate_soundbuttons(
-        group_top_left=(window_width // 2 + 150, 100),
-        size=(180, 50),
-        padding=(20, 15)
-    )
-    piano.start()
+    # everything slow loads in the background while the calibration window opens
+    # (two hands per keyboard)
+    cameras = submit_cameras(warmup, roles, max_num_hands=2 * len(keyboards))
+    top_caps, hands_top = cameras[TOP]
+    front_caps, hands_front = cameras[FRONT]
+    piano = warmup.submit("soundfont", load_piano)
+    warmup.all_submitted()
+
+    # Initialize instruments, one table line per front camera
+    instrument_front = make_instrument_front(len(front_caps), table_distance_threshold=0.015)
+
+    # --profile / --tracemalloc (or PROFILE_SECONDS / TRACEMALLOC_INTERVAL)
+    profiler = profiler_from_args()
+
+    pipeline = Pipeline(top_caps, front_caps, hands_top, hands_front,
+                        keyboards, instrument_front, piano,
+                        stats_path=env_str("STAGE_TIMES_PATH"),
+                        stats_interval=env_float("STAGE_TIMES_INTERVAL", 10.0),
+                        profiler=profiler)
+    # RECORD_SESSION=<dir> records frames, fingertips and notes for replay.py
+    start_session_recorder_from_env(pipeline)
+    # TOUCH_ONSET=1 watches the table line between hands model runs for earlier note ons
+    start_touch_onset_from_env(pipeline)
+    # TRACK_FINGERTIPS=1 follows the fingertips with optical flow between hands model runs
+    start_tracking_from_env(pipeline)
+    # MOTION_GATE=1 skips the hands models while nothing moves over the keyboards or table
+    start_motion_gate_from_env(pipeline)
+    app = App(pipeline, warmup)
+    # RECORD_SCREEN=<video file> records the window in a separate process
+    start_screen_recorder_from_env(app)
+    warmup.mark("window")
+
+    if profiler is not None:
+        profiler.counts = app.object_counts
 
     # --------------- EVENT LOOP ----------------
-    while running:
-        start = time.time()
-        # poll for events
-        for event in pygame.event.get():
-            # check for exit (window close button)
-            if event.type == pygame.QUIT:
-                running = False
-            # check for mouse left click
-            if (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1):
-                # Normalize clicked position
-                clicked_position = np.array(
-                    [event.pos[0] / window_width, event.pos[1] / window_height])
-
-                # draw piano corner points
-                if state == SELECT_PIANO:
-                    # 4 corners not clicked yet -> add corner
-                    if len(corner_positions) <= 3:
-                        corner_positions.append(clicked_position)
-                    # 4 corners clicked -> confirm
-                    elif len(corner_positions) == 4:
-                        state = SELECT_TABLE
-                        # pass to calculator
-                        instrument_top.set_corners(corner_positions)
-                        # get back all key corners
-                        white_key_tops, white_key_bases, black_key_tops, black_key_bases = instrument_top.get_all_keys_points()
-
-                elif state == SELECT_TABLE:
-                    # 2 endpoints not clicked yet -> add endpoint
-                    if len(endpoint_positions) <= 1:
-                        endpoint_positions.append(clicked_position)
-                    # 2 endpoints clicked -> confirm
-                    elif len(endpoint_positions) == 2:
-                        # UPDATE INSTRUMENT_FRONT KEYPOINTS HERE
-                        state = RUNNING
-                        instrument_front.set_endpoints(endpoint_positions)
-
-                elif state == RUNNING:
-                    # check whether any of the sound buttons are clicked
-                    for button in all_soundbuttons:
-                        if button.collides(event.pos):
-                            piano.change_sound(button.sound)
-
-        # Read top cap frame
-        if top_cap.isOpened():
-            top_frame = top_cap.read()
-
-            if top_frame is None:
-                continue
-
-        # Read bottom cap frame
-        if front_cap.isOpened():
-            front_frame = front_cap.read()
-
-            if front_frame is None:
-                continue
+    try:
+        asyncio.run(pipeline.run(render=app.render))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if app.screen_recorder is not None:
+            app.screen_recorder.stop()
 
-        # Draw pygame frame for each state
-        if state == SELECT_PIANO and top_cap.isOpened():
-            pygame_screen.fill((20, 20, 20))
-            draw_functions.draw_frame(screen=pygame_screen, frame=top_frame)
-
-            # draw points to indicate corners
-            draw_functions.draw_points(screen=pygame_screen,
-                                       point_list=corner_positions,
-                                       colour=corner_colour[corners_saved])
-
-        elif state == SELECT_TABLE and front_cap.isOpened():
-            pygame_screen.fill((0, 0, 0))
-            draw_functions.draw_frame(screen=pygame_screen, frame=front_frame)
-
-            draw_functions.draw_points(screen=pygame_screen,
-                                       point_list=endpoint_positions,
-                                       colour=corner_colour[corners_saved])
-
-        elif state == RUNNING and top_cap.isOpened() and front_cap.isOpened():
-            pygame_screen.fill(pygame.Color(0, 0, 0))
-
-            # --------------- OPENCV LOOP ----------------
-
-            # Process top camera
-            if top_cap.isOpened():
-                # Run processing for hand keypoints
-                top_hand_keypoints_left, top_hand_keypoints_right = process_frame(top_frame, hands_top)
-                
-                # Draw hand points
-                top_frame = draw_functions.draw_hand_points(top_frame, top_hand_keypoints_left)
-                top_frame = draw_functions.draw_hand_points(top_frame, top_hand_keypoints_right)
-
-                # convert and draw frame in pygame4
-                new_width = window_width // 2
-                new_height = window_height // 2
-                draw_functions.draw_frame(screen=pygame_screen, frame=top_frame,
-                                          size=(new_width, new_height))
-                # Draw white keys
-                draw_functions.draw_keys(screen=pygame_screen, key_tops=white_key_tops, key_bases=white_key_bases, overlap=True,
-                                         outline_colour="blue", outline_width=3, window_width=new_width, window_height=new_height)
-                # Draw black keys
-                draw_functions.draw_keys(screen=pygame_screen, key_tops=black_key_tops, key_bases=black_key_bases, overlap=False,
-                                         outline_colour="red", outline_width=3, window_width=new_width, window_height=new_height)
-
-            # Process front camera
-            if front_cap.isOpened():
-                front_frame = front_cap.read()
-
-                if front_frame is None:
-                    continue
-
-                # Run processing for hand keypoints
-                front_hand_keypoints_left, front_hand_keypoints_right = process_frame(front_frame, hands_front)
-
-                # Draw hand points
-                front_frame = draw_functions.draw_hand_points(front_frame, front_hand_keypoints_left)
-                front_frame = draw_functions.draw_hand_points(front_frame, front_hand_keypoints_right)
-
-
-                # convert and draw frame in pygame4
-                new_width = window_width // 2
-                new_height = window_height // 2
-                draw_functions.draw_frame(screen=pygame_screen, frame=front_frame, 
-                                          top_left=np.array((0, new_height)),
-                                          size=(new_width, new_height))
-                draw_functions.draw_tabletop(pygame_screen, endpoint_positions[0], endpoint_positions[1], "blue", 4, 
-                                             top_left=np.array((0, new_height)), window_width=new_width, window_height=new_height)
-
-                
-            mouse_p = pygame.mouse.get_pos()
-            cur_s = (piano.bank, piano.preset)
-            for button in all_soundbuttons:
-                button.draw(pygame_screen, mouse_p, cur_s)
-                
-            if top_cap.isOpened() and front_cap.isOpened() and len(top_hand_keypoints_left) > 0 and len(front_hand_keypoints_left) > 0:
-            # if top_cap.isOpened() and front_cap.isOpened() and len(front_hand_keypoints) > 0:
-                # Filter for pressed fingers
-                pressed_fingers_left = instrument_front.get_pressed_fingers(front_hand_keypoints_left, top_hand_keypoints_left)
-                pressed_fingers_right = instrument_front.get_pressed_fingers(front_hand_keypoints_right, top_hand_keypoints_right)
-                pressed_fingers = pressed_fingers_left + pressed_fingers_right
-
-                # Get playing notes
-                playing_notes = instrument_top.get_notes(
-                    pressed_fingers, white_key_tops, white_key_bases, black_key_tops, black_key_bases)
-                playing_midi_notes = {instrument_top.index_to_midi(
-                    note) for note in playing_notes[0]}
-
-                # print("Pressed fingers:", pressed_fingers)
-                # print("Corner positions", corner_positions)
-                # print("Playing notes!", playing_midi_notes)
-                # print("----------------")
-
-                play_notes(piano, playing_midi_notes)
-                # set up all the smoke for curent playing notes
-                for note_idx, coord, width, x_coord in zip(playing_notes[0], playing_notes[1], playing_notes[2], playing_notes[3]):
-                    midi_id = instrument_top.index_to_midi(note_idx)
-                    # Use coordinate relative to top-left camera view
-                    px_x = coord[0] * window_width // 2
-                    px_y = coord[1] * window_height // 2
-                    px_w = width * window_width // 2
-                    px_x_top_left = x_coord * window_width // 2
-
-                    if midi_id not in active_rising_notes:
-
-                        color = random.choice(
-                            [(0, 255, 150), (0, 220, 255), (255, 100, 255), (255, 255, 100)])
-                        active_rising_notes[midi_id] = RisingNote(
-                            px_x_top_left, px_y, px_w, color)
-
-                    # Add sparkles at the key point every frame the finger is down
-                    for _ in range(3):
-                        particles.append(
-                            Spark(px_x, px_y, active_rising_notes[midi_id].color))
-                            
-                # 2. Transition notes to "Finished" once finger is lifted
-                for m_id in list(active_rising_notes.keys()):
-                    if m_id not in playing_midi_notes:
-                        note_obj = active_rising_notes.pop(m_id)
-                        note_obj.is_active = False
-                        finished_notes.append(note_obj)
+        # uninit pygame or whatever
+        pygame.quit()
 
-            else:
-                piano.remove_all_notes()
-                for m_id, note_obj in active_rising_notes.items():
-                    note_obj.is_active = False
-                    finished_notes.append(note_obj)
-                active_rising_notes.clear()
-
-                                    
-            if total_frames % 30 == 0:
-                color = random.choice([(0, 255, 150), (0, 220, 255), (255, 100, 255), (255, 255, 100)])
-                px = random.random() * window_width//2 + window_width//2
-                py = window_height
-                for _ in range(6):
-                    particles1.append(Spark(px, py, color))
-
-            # Update all particles and remove dead ones
-            for p in particles[:]:
-                p.update()
-                p.draw(pygame_screen)
-                if p.life <= 0:
-                    particles.remove(p)
-
-            for p in particles1[:]:
-                p.update()
-                p.draw(pygame_screen)
-                if p.life <= 0:
-                    particles1.remove(p)
-
-            # Draw Notes
-            all_visible_notes = finished_notes + \
-                list(active_rising_notes.values())
-            for note in all_visible_notes[:]:
-                note.update()
-                note.draw(pygame_screen)
-                # Cleanup notes that flew off the top
-                if note.y + note.h < -100:
-                    if note in finished_notes:
-                        finished_notes.remove(note)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-
-        end = time.time()
-        if end - start < 1:
-            total_time += end - start
-            total_frames += 1
-
-        # refresh pygame display????
-        pygame.display.flip()
-        clock.tick(60)
-
-    average_time = 1000 * (total_time / total_frames)
-    # print("Average time per frame: ", average_time, "ms")
-    # print(1000 / average_time, "fps")
-
-    top_cap.release()
-    front_cap.release()
-    cv2.destroyAllWindows()
-
-    # uninit pygame or whatever
-    pygame.quit()
-
-    piano.stop()
+        shutdown(warmup)
 
 
 if __name__ == "__main__":
     main()
-
-
-
-
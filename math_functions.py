@@ -79,10 +79,6 @@ def is_right_of_line(p, a, b):
     else :
         return p[1]- (slope * p[0] +basis) > 0
     
-def get_white_note(index):
-    return 5*(index//7) +index + index%7 -1 *(index%7 > 2)
-
-
     
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import os
+import struct
+import threading
+import time
+from collections import deque
+from config import env_str, env_float
+
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+CONTROL_CHANGE = 0xB0
+PROGRAM_CHANGE = 0xC0
+
+
+def variable_length(value: int) -> bytes:
+    """Encodes value as a MIDI variable length quantity"""
+    out = [value & 0x7F]
+    value >>= 7
+
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    return bytes(reversed(out))
+
+
+class MidiRecorder:
+    """
+    Records note events to a Standard MIDI File (format 0) from a background thread
+
+    The note_on/note_off/program_change methods are called from the frame loop and
+    only append to a deque (append and popleft are thread safe, no lock needed).
+    The writer thread drains it and rewrites the whole file every flush_interval
+    seconds, so a crash loses at most that much of the session. Events are
+    encoded once as they are drained, and each flush only adds the note offs
+    of held notes and the end of track after them.
+    """
+
+    def __init__(self, path, flush_interval=5.0, ticks_per_beat=480, tempo=500000):
+        """
+        :param path: .mid file to write, may contain strftime codes (eg session-%H%M%S.mid)
+        :param flush_interval: seconds between file rewrites
+        :param ticks_per_beat: MIDI time division
+        :param tempo: microseconds per beat (500000 = 120 bpm)
+        """
+        self.path = time.strftime(path)
+        self.flush_interval = flush_interval
+        self.ticks_per_beat = ticks_per_beat
+        self.tempo = tempo
+
+        # (perf_counter time, status, data1, data2 or None)
+        self.events = deque()
+
+        # only touched by the writer thread: the encoded track events, the
+        # tick of the last one and the (channel, note) still held after them
+        self.track = bytearray()
+        self.last_tick = 0
+        self.held = set()
+
+        self.start_time = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+    def stop(self) -> None:
+        """Stops the writer thread and writes the final file"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    # ---------- hot path (frame loop) ----------
+
+    def note_on(self, note: int, velocity: int, channel=0) -> None:
+        self.events.append((time.perf_counter(), NOTE_ON | channel, note, velocity))
+
+    def note_off(self, note: int, channel=0) -> None:
+        self.events.append((time.perf_counter(), NOTE_OFF | channel, note, 0))
+
+    def program_change(self, bank: int, preset: int, channel=0) -> None:
+        now = time.perf_counter()
+        self.events.append((now, CONTROL_CHANGE | channel, 0, bank))
+        self.events.append((now, PROGRAM_CHANGE | channel, preset, None))
+
+    # ---------- writer thread ----------
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+        self.flush()
+
+    def drain(self) -> None:
+        """Encodes queued events on to the end of the track"""
+        while self.events:
+            timestamp, status, data1, data2 = self.events.popleft()
+            tick = max(self.last_tick, self.to_ticks(timestamp))
+            self.track += variable_length(tick - self.last_tick)
+            self.last_tick = tick
+
+            if data2 is None:
+                self.track += bytes((status, data1))
+            else:
+                self.track += bytes((status, data1, data2))
+
+            kind, channel = status & 0xF0, status & 0x0F
+            if kind == NOTE_ON:
+                self.held.add((channel, data1))
+            elif kind == NOTE_OFF:
+                self.held.discard((channel, data1))
+
+    def flush(self) -> None:
+        """Rewrites the file with everything recorded so far"""
+        self.drain()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # write then rename so a crash mid-write never leaves a broken file
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self.to_bytes(time.perf_counter()))
+        os.replace(temp_path, self.path)
+
+    def to_ticks(self, timestamp: float) -> int:
+        seconds = max(0.0, timestamp - self.start_time)
+
+        return round(seconds * self.ticks_per_beat * 1_000_000 / self.tempo)
+
+    def to_bytes(self, end_time: float) -> bytes:
+        """
+        builds the Standard MIDI File for the events drained so far, releasing
+        any notes still held at end_time so the file is always playable
+        """
+        # tempo meta event
+        tempo = variable_length(0) + b"\xff\x51\x03" + self.tempo.to_bytes(3, "big")
+
+        tail = bytearray()
+        last_tick = self.last_tick
+        end_tick = max(last_tick, self.to_ticks(end_time))
+        for channel, note in sorted(self.held):
+            tail += variable_length(end_tick - last_tick) + bytes((NOTE_OFF | channel, note, 0))
+            last_tick = end_tick
+
+        # end of track meta event
+        tail += variable_length(0) + b"\xff\x2f\x00"
+
+        header = b"MThd" + struct.pack(">IHHH", 6, 0, 1, self.ticks_per_beat)
+        length = len(tempo) + len(self.track) + len(tail)
+
+        return b"".join((header, b"MTrk", struct.pack(">I", length), tempo, self.track, tail))
+
+
+def start_recorder_from_env(instrument):
+    """
+    starts a MidiRecorder on instrument if RECORD_MIDI is set in .env
+
+    :param instrument: Instrument to record
+    :returns: the started recorder, or None if recording is off
+    """
+    path = env_str("RECORD_MIDI")
+    if path is None:
+        return None
+
+    recorder = MidiRecorder(path, flush_interval=env_float("RECORD_MIDI_FLUSH", 5.0))
+    recorder.start()
+    # the channels already selected (channel 0 by Instrument.start) won't be
+    # selected again, so their program goes at the start of the file
+    for channel in sorted(instrument.channels):
+        recorder.program_change(instrument.bank, instrument.preset, channel)
+    instrument.recorder = recorder
+
+    return recorder
@@ -0,0 +1,134 @@
+import time
+import cv2
+import numpy as np
+from instrument_front import TableSegments
+from camera_frame import as_frame
+from config import env_bool, env_int, env_float
+
+
+# size of the frames compared, (width, height)
+GATE_SIZE = (160, 120)
+
+
+class MotionGate:
+    """
+    Skips the hands model on frames where nothing is happening.
+
+    Each camera's frame is shrunk to GATE_SIZE grey and compared with the
+    frame the hands model last ran on, inside that camera's region of
+    interest (the keyboard quads for top cameras, a band around the table
+    line for front cameras). The model is skipped when too few pixels
+    changed and the last result had no hands, and runs anyway every
+    force_interval seconds in case something was missed.
+    """
+
+    def __init__(self, num_cameras, size=GATE_SIZE, pixel_threshold=20, min_changed=0.01,
+                 force_interval=1.0):
+        """
+        :param num_cameras: cameras gated, top cameras then front cameras
+        :param size: (width, height) the frames are compared at
+        :param pixel_threshold: grey level change of a pixel that counts as changed
+        :param min_changed: fraction of the region that must change to run the model
+        :param force_interval: longest time in seconds between model runs on a camera
+        """
+        self.size = tuple(size)
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.force_interval = force_interval
+
+        # per camera: uint8 region of interest mask (None for the whole frame),
+        # the frame the model last ran on and when
+        self.masks = [None] * num_cameras
+        self.mask_areas = [size[0] * size[1]] * num_cameras
+        self.references = [None] * num_cameras
+        self.last_run = [0.0] * num_cameras
+
+        self.ran = 0
+        self.skipped = 0
+
+    def set_regions(self, keyboards, instrument_front, num_top, band=0.1, margin=0.05) -> None:
+        """
+        masks the top cameras to their keyboards and the front cameras to their table lines
+
+        :param keyboards: calibrated keyboard_set.KeyboardSet
+        :param instrument_front: calibrated InstrumentFront or TableSegments
+        :param num_top: number of top cameras, the first cameras
+        :param band: normalized distance either side of a table line that is watched
+        :param margin: normalized distance around a keyboard that is watched
+        """
+        width, height = self.size
+        scale = np.array([width, height], dtype=float)
+        masks = [np.zeros((height, width), dtype=np.uint8) for _ in self.masks]
+
+        for keyboard in keyboards:
+            corners = np.asarray(keyboard.instrument_top.piano_corners, dtype=float) - (keyboard.camera, 0)
+            # piano_corners are top left, top right, bottom left, bottom right
+            quad = (corners[[0, 1, 3, 2]] * scale).astype(np.int32)
+            cv2.fillConvexPoly(masks[keyboard.camera], quad, 255)
+            cv2.polylines(masks[keyboard.camera], [quad], True, 255, max(1, int(margin * 2 * width)))
+
+        fronts = list(instrument_front) if isinstance(instrument_front, TableSegments) else [instrument_front]
+        for camera, front in enumerate(fronts):
+            start, end = (np.asarray(point, dtype=float) * scale for point in front.table_endpoints)
+            cv2.line(masks[num_top + camera], tuple(int(v) for v in start), tuple(int(v) for v in end),
+                     255, max(1, int(band * 2 * height)))
+
+        for camera, mask in enumerate(masks):
+            area = int(np.count_nonzero(mask))
+            if area:
+                self.masks[camera] = mask
+                self.mask_areas[camera] = area
+
+    # ---------- hot path (inference stage) ----------
+
+    def should_run(self, camera, frame, keypoints) -> bool:
+        """
+        :param camera: index of the camera
+        :param frame: its new frame
+        :param keypoints: the camera's last process_frame output
+        :returns: whether the hands model should run on frame
+        """
+        small = as_frame(frame).resized(self.size, gray=True)
+        now = time.perf_counter()
+        reference = self.references[camera]
+
+        run = (reference is None or any(keypoints)
+               or now - self.last_run[camera] >= self.force_interval
+               or self.changed(camera, small, reference) >= self.min_changed)
+
+        if run:
+            self.references[camera] = small
+            self.last_run[camera] = now
+            self.ran += 1
+        else:
+            self.skipped += 1
+
+        return run
+
+    def changed(self, camera, small, reference) -> float:
+        """fraction of the camera's region that differs from reference"""
+        changed = cv2.absdiff(small, reference) > self.pixel_threshold
+        if self.masks[camera] is not None:
+            changed &= self.masks[camera] > 0
+
+        return np.count_nonzero(changed) / self.mask_areas[camera]
+
+
+def start_motion_gate_from_env(pipeline):
+    """
+    gates pipeline's hands models with a MotionGate if MOTION_GATE is set in
+    .env, its regions are set once the pipeline starts playing
+
+    :param pipeline: Pipeline to gate
+    :returns: the gate, or None if gating is off
+    """
+    if not env_bool("MOTION_GATE", False):
+        return None
+
+    gate = MotionGate(len(pipeline.caps),
+                      pixel_threshold=env_int("MOTION_GATE_THRESHOLD", 20),
+                      min_changed=env_float("MOTION_GATE_CHANGED", 0.01),
+                      force_interval=env_float("MOTION_GATE_FORCE", 1.0))
+    pipeline.motion_gate = gate
+
+    return gate
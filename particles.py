@@ -0,0 +1,158 @@
+import numpy as np
+import pygame
+
+
+class ParticleSystem:
+    """
+    Fixed capacity particle system, the array backed replacement for a list of
+    NoteRise.Spark (or Smoke.SmokeParticle) objects
+
+    Position, velocity, life, size and colour live in preallocated numpy
+    arrays with the live particles packed at the front. update() moves them
+    all in one vectorized step and drops the dead ones by compacting the
+    arrays, draw() blits cached pre-rendered circle sprites in one blits call,
+    so nothing is allocated per particle per frame.
+
+    Once capacity is reached new particles are dropped, which bounds the frame
+    time however many fingers are down.
+    """
+
+    def __init__(self, capacity=2048, gravity=0.1, fade=3, growth=0.0,
+                 velocity_x=(-1.5, 1.5), velocity_y=(-7, 0.2), size=(2, 5),
+                 centred=False, additive=True, alpha_step=8, seed=None):
+        """
+        defaults match NoteRise.Spark
+
+        :param capacity: maximum number of live particles
+        :param gravity: added to the y velocity every update
+        :param fade: life (alpha, starts at 255) lost every update
+        :param growth: added to the radius every update
+        :param velocity_x: (low, high) of the uniform starting x velocity
+        :param velocity_y: (low, high) of the uniform starting y velocity
+        :param size: (low, high) starting radius in pixels, inclusive
+        :param centred: draw around (x, y) instead of with (x, y) top left
+        :param additive: blit with BLEND_ADD like Spark, otherwise alpha blend
+        :param alpha_step: life is rounded up to a multiple of this for the
+                           sprite cache
+        :param seed: optional seed for the random velocities and sizes
+        """
+        self.capacity = capacity
+        self.gravity = gravity
+        self.fade = fade
+        self.growth = growth
+        self.velocity_x = velocity_x
+        self.velocity_y = velocity_y
+        self.size_range = size
+        self.centred = centred
+        self.blend = pygame.BLEND_ADD if additive else 0
+        self.alpha_step = alpha_step
+        self.rng = np.random.default_rng(seed)
+
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int16)
+        self.size = np.zeros(capacity, dtype=np.float32)
+        self.colour = np.zeros(capacity, dtype=np.int16)
+
+        # live particles are [0, count)
+        self.count = 0
+
+        # colour tuple -> index into the colour array, and back
+        self.colour_indices = {}
+        self.colours = []
+        # (colour index, radius, alpha) -> sprite surface
+        self.sprites = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def clear(self) -> None:
+        self.count = 0
+
+    def emit(self, x, y, colour, count=1) -> None:
+        """adds count particles at (x, y), as many as fit"""
+        start = self.count
+        end = min(self.capacity, start + count)
+        n = end - start
+        if n <= 0:
+            return
+
+        colour = tuple(colour)
+        index = self.colour_indices.get(colour)
+        if index is None:
+            index = self.colour_indices[colour] = len(self.colours)
+            self.colours.append(colour)
+
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.vx[start:end] = self.rng.uniform(*self.velocity_x, n)
+        self.vy[start:end] = self.rng.uniform(*self.velocity_y, n)
+        self.life[start:end] = 255
+        self.size[start:end] = self.rng.integers(self.size_range[0], self.size_range[1] + 1, n)
+        self.colour[start:end] = index
+        self.count = end
+
+    def update(self) -> None:
+        """moves every particle one frame and removes the ones that faded out"""
+        n = self.count
+        if n == 0:
+            return
+
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.vy[:n] += self.gravity
+        self.life[:n] -= self.fade
+        if self.growth:
+            self.size[:n] += self.growth
+
+        alive = self.life[:n] > 0
+        remaining = int(np.count_nonzero(alive))
+        if remaining == n:
+            return
+
+        for array in (self.x, self.y, self.vx, self.vy, self.life, self.size, self.colour):
+            array[:remaining] = array[:n][alive]
+        self.count = remaining
+
+    def sprite(self, colour_index, radius, alpha) -> pygame.Surface:
+        key = (colour_index, radius, alpha)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            # same drawing as Spark.draw, made once instead of every frame
+            sprite = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, (*self.colours[colour_index], alpha), (radius, radius), radius)
+            self.sprites[key] = sprite
+
+        return sprite
+
+    def draw(self, surface: pygame.Surface):
+        """
+        :returns: pygame Rect around all the particles drawn, None if there are none
+        """
+        n = self.count
+        if n == 0:
+            return None
+
+        radius = self.size[:n].astype(np.int32)
+        step = self.alpha_step
+        alpha = np.minimum(255, (self.life[:n] + step - 1) // step * step)
+        x = self.x[:n]
+        y = self.y[:n]
+        if self.centred:
+            x = x - radius
+            y = y - radius
+
+        sprite = self.sprite
+        blend = self.blend
+        surface.blits([
+            (sprite(c, r, a), (px, py), None, blend)
+            for c, r, a, px, py in zip(self.colour[:n].tolist(), radius.tolist(), alpha.tolist(),
+                                       x.tolist(), y.tolist())
+        ], doreturn=False)
+
+        left = int(x.min())
+        top = int(y.min())
+        size = 2 * int(radius.max()) + 1
+        return pygame.Rect(left, top, int(x.max()) - left + size, int(y.max()) - top + size)
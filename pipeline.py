@@ -0,0 +1,426 @@
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from instrument_top import InstrumentTop
+from instrument_front import InstrumentFront
+from instrument import Instrument
+from engine import process_frame, play_notes, get_keyboard_notes, merge_keypoints
+from keyboard_set import KeyboardSet
+from stage_timers import StageTimers
+from latency_trace import FrameTrace
+from log import log
+from camera_frame import Frame
+from cameras import TOP, FRONT, camera_name
+
+
+# seconds to wait for a camera frame before checking the cameras are still open
+CAPTURE_TIMEOUT = 0.5
+
+
+def put_latest(queue: asyncio.Queue, item) -> None:
+    """puts item on a bounded queue, dropping the oldest items if it is full"""
+    while queue.full():
+        queue.get_nowait()
+
+    queue.put_nowait(item)
+
+
+def as_list(value) -> list:
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+async def resolve(value):
+    """returns value, or its result if it is a concurrent.futures.Future"""
+    if isinstance(value, Future):
+        return await asyncio.wrap_future(value)
+
+    return value
+
+
+class Pipeline:
+    """
+    Runs the app as asyncio stages joined by bounded drop-oldest queues:
+
+        capture -> inference -> note resolution -> audio
+                                                -> render (optional, own rate)
+
+    Capture waits for the camera threads instead of polling, inference runs the
+    mediapipe models in an executor, and a slow stage only ever makes the stages
+    before it drop old frames instead of queueing them.
+
+    The cameras, hands models and piano can be passed as Futures still being
+    set up by startup.Warmup. The render stage starts straight away and the
+    other stages start once they have all resolved.
+
+    instrument_top can be a keyboard_set.KeyboardSet to play several
+    keyboards under the top camera, one inference pass serves all of them.
+
+    top_cap/front_cap (and their hands models) can be lists, for several top
+    or front cameras side by side. Every camera has its own hands model and
+    executor worker (mediapipe runs outside the GIL, so they use separate
+    cores), and their fingertips are merged as if each role had one wide
+    camera (see engine.merge_keypoints). Several front cameras need an
+    instrument_front.TableSegments.
+    """
+
+    def __init__(self, top_cap, front_cap, hands_top, hands_front,
+                 instrument_top: InstrumentTop | KeyboardSet, instrument_front: InstrumentFront,
+                 piano: Instrument, queue_size=1, render_fps=60,
+                 stats_path=None, stats_interval=10.0, profiler=None):
+        # top cameras then front cameras, each with its hands model
+        self.caps = as_list(top_cap) + as_list(front_cap)
+        self.hands = as_list(hands_top) + as_list(hands_front)
+        self.num_top = len(as_list(top_cap))
+        if len(self.hands) != len(self.caps):
+            raise ValueError(f"{len(self.caps)} cameras but {len(self.hands)} hands models")
+        # timer name of each camera, "top" and "front" for the first ones
+        names = [camera_name(TOP, i) for i in range(self.num_top)] + \
+                [camera_name(FRONT, i) for i in range(len(self.caps) - self.num_top)]
+        self.camera_names = [name.replace(" camera", "") for name in names]
+        self.keyboards = instrument_top if isinstance(instrument_top, KeyboardSet) else KeyboardSet([instrument_top])
+        # the first keyboard
+        self.instrument_top = self.keyboards.primary
+        self.instrument_front = instrument_front
+        self.piano = piano
+        self.queue_size = queue_size
+        self.render_fps = render_fps
+
+        # per stage latency, dumped to stats_path (csv or json lines) every stats_interval seconds
+        self.timers = StageTimers()
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+
+        # optional profiling.Profiler run alongside the stages
+        self.profiler = profiler
+
+        # optional session_recorder.SessionRecorder, started with start_playing
+        self.recorder = None
+        # optional touch_onset.TouchOnsetDetector, run on every front frame once playing
+        self.touch_detector = None
+        # optional fingertip_tracker.FingertipTracker per camera, moves the
+        # fingertips on every captured frame between hands model runs
+        self.trackers = None
+        # optional motion_gate.MotionGate, skips the hands models on frames where nothing moved
+        self.motion_gate = None
+
+        # key corners from instrument_top, None until calibrated (see keyboards.key_points for the rest)
+        self.key_points = None
+
+        # latest results, read by the render stage
+        # (top frame, front frame) of the first camera of each role
+        self.latest_frames = (None, None)
+        # every camera's frame, top cameras then front cameras
+        self.camera_frames = (None,) * len(self.caps)
+        # ((top left, top right), (front left, front right)) fingertips
+        self.latest_keypoints = (([], []), ([], []))
+        # KeyboardSet.get_notes output (one InstrumentTop.get_notes output per
+        # keyboard), None when no hands are seen
+        self.latest_notes = None
+        self.latest_midi_notes = set()
+
+        # one worker per hands model so every camera is processed in parallel
+        self.executor = ThreadPoolExecutor(max_workers=len(self.caps))
+
+        self.loop = None
+        self.frame_event = None
+        self.stop_event = None
+
+        # True once every Future passed in has resolved
+        self.ready = False
+
+    def start_playing(self) -> None:
+        """Called once the keyboards and instrument_front are calibrated"""
+        self.keyboards.build()
+        self.key_points = self.keyboards[0].key_points
+        if self.motion_gate is not None:
+            self.motion_gate.set_regions(self.keyboards, self.instrument_front, self.num_top)
+
+        if self.recorder is not None:
+            # the videos only have room for one camera of each role
+            if len(self.caps) > 2 and self.recorder.video:
+                log("Recording fingertips only, session video needs one top and one front camera")
+                self.recorder.video = False
+            self.recorder.start(self.keyboards, self.instrument_front)
+
+    def stop(self) -> None:
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def on_new_frame(self) -> None:
+        # called from the camera threads
+        self.loop.call_soon_threadsafe(self.frame_event.set)
+
+    # ------------------ STAGES ------------------
+
+    async def capture_stage(self, capture_queue: asyncio.Queue, inference_queue: asyncio.Queue,
+                            audio_queue: asyncio.Queue) -> None:
+        """Groups the newest frame of every camera whenever any camera updates"""
+        num_top = self.num_top
+        # camera arrays and the Frames made for them
+        last_images = [None] * len(self.caps)
+        last_frames = (None,) * len(self.caps)
+        # numbers the frame groups sent on, so results can be matched to their frames
+        seq = 0
+
+        while any(cap.isOpened() for cap in self.caps):
+            try:
+                with self.timers.time("capture wait"):
+                    await asyncio.wait_for(self.frame_event.wait(), CAPTURE_TIMEOUT)
+            except asyncio.TimeoutError:
+                continue
+            self.frame_event.clear()
+
+            timestamped = [cap.read_timestamped() for cap in self.caps]
+            images = [image for image, _ in timestamped]
+            if any(image is None for image in images):
+                continue
+            if all(image is last for image, last in zip(images, last_images)):
+                continue
+
+            # one Frame per captured image, its views are shared by every stage
+            frames = tuple(
+                last_frame if image is last_image else Frame(image, timestamp)
+                for (image, timestamp), last_image, last_frame in zip(timestamped, last_images, last_frames)
+            )
+            last_images = images
+            last_frames = frames
+
+            self.camera_frames = frames
+            self.latest_frames = (frames[0], frames[num_top])
+
+            # nothing to infer until the keyboard and table are calibrated
+            if self.key_points is not None:
+                seq += 1
+                trace = FrameTrace(seq, min(frame.timestamp for frame in frames[:num_top]),
+                                   min(frame.timestamp for frame in frames[num_top:]))
+                if self.recorder is not None:
+                    self.recorder.frame(seq, (images[0], images[num_top]))
+                put_latest(capture_queue, (trace, frames))
+
+                if self.trackers is not None and self.ready:
+                    self.track_fingertips(trace, frames, inference_queue)
+                if self.touch_detector is not None and self.ready:
+                    self.detect_touches(seq, frames[num_top:], audio_queue)
+
+    def track_fingertips(self, trace, frames, inference_queue: asyncio.Queue) -> None:
+        """sends the fingertips tracked into frames straight to the resolve stage"""
+        with self.timers.time("fingertip tracking"):
+            camera_keypoints = [tracker.track(frame) for tracker, frame in zip(self.trackers, frames)]
+        # a camera lost its fingertips, wait for the hands model
+        if any(keypoints is None for keypoints in camera_keypoints):
+            return
+
+        top_keypoints = merge_keypoints(camera_keypoints[:self.num_top])
+        front_keypoints = merge_keypoints(camera_keypoints[self.num_top:])
+        # the capture trace carries on to inference, this one skips it
+        tracked = FrameTrace(trace.seq, trace.top_captured, trace.front_captured)
+        tracked.inferred = time.perf_counter()
+
+        self.latest_keypoints = (top_keypoints, front_keypoints)
+        put_latest(inference_queue, (tracked, top_keypoints, front_keypoints))
+
+    def detect_touches(self, seq, front_frames, audio_queue: asyncio.Queue) -> None:
+        """plays the notes under fingers the touch detector saw land, ahead of inference"""
+        with self.timers.time("touch onset"):
+            touches = self.touch_detector.detect(front_frames)
+            if not touches:
+                return
+
+            top_keypoints, front_keypoints = self.latest_keypoints
+            fingers = self.touch_detector.touched_fingers(touches, top_keypoints, front_keypoints)
+            if not fingers:
+                return
+
+            captured = min(frame.timestamp for frame in front_frames)
+            notes = self.keyboards.midi_notes(self.keyboards.get_notes(fingers))
+            new_notes = self.touch_detector.press(notes - self.latest_midi_notes, captured)
+            if not new_notes:
+                return
+
+        # no top frame or inference behind these notes, only the front frame
+        trace = FrameTrace(seq, captured, captured)
+        trace.inferred = trace.resolved = time.perf_counter()
+
+        self.latest_midi_notes = self.latest_midi_notes | new_notes
+        put_latest(audio_queue, (trace, self.latest_midi_notes))
+
+    async def inference_stage(self, capture_queue: asyncio.Queue,
+                              inference_queue: asyncio.Queue) -> None:
+        """Runs the hands models on frames that changed since the last run"""
+        num_top = self.num_top
+        last_frames = (None,) * len(self.caps)
+        # process_frame output of each camera
+        camera_keypoints = [([], [])] * len(self.caps)
+
+        while True:
+            trace, frames = await capture_queue.get()
+
+            jobs = {}
+            for i, frame in enumerate(frames):
+                if frame is last_frames[i]:
+                    continue
+                if self.motion_gate is not None:
+                    with self.timers.time("motion gate"):
+                        if not self.motion_gate.should_run(i, frame, camera_keypoints[i]):
+                            continue
+                jobs[i] = self.loop.run_in_executor(
+                    self.executor, process_frame, frame, self.hands[i], self.timers, self.camera_names[i])
+
+            # nothing moved on any camera, and none of them saw hands last time
+            if not jobs:
+                last_frames = frames
+                continue
+
+            for i, keypoints in zip(jobs.keys(), await asyncio.gather(*jobs.values())):
+                if self.trackers is not None:
+                    # carried on to the newest frame, which tracking has already reached
+                    keypoints = self.trackers[i].seed(frames[i], keypoints, self.camera_frames[i])
+                camera_keypoints[i] = keypoints
+            if self.trackers is not None:
+                for i in range(len(frames)):
+                    if i not in jobs:
+                        camera_keypoints[i] = self.trackers[i].current() or camera_keypoints[i]
+            last_frames = frames
+
+            top_keypoints = merge_keypoints(camera_keypoints[:num_top])
+            front_keypoints = merge_keypoints(camera_keypoints[num_top:])
+            trace.inferred = time.perf_counter()
+
+            self.latest_keypoints = (top_keypoints, front_keypoints)
+            put_latest(inference_queue, (trace, top_keypoints, front_keypoints))
+
+    async def resolve_stage(self, inference_queue: asyncio.Queue,
+                            audio_queue: asyncio.Queue) -> None:
+        """Turns fingertips into the set of playing midi notes"""
+        while True:
+            trace, top_keypoints, front_keypoints = await inference_queue.get()
+
+            playing_notes = get_keyboard_notes(self.keyboards, self.instrument_front,
+                                               top_keypoints, front_keypoints, self.timers)
+
+            if playing_notes is None:
+                playing_midi_notes = set()
+            else:
+                playing_midi_notes = self.keyboards.midi_notes(playing_notes)
+            trace.resolved = time.perf_counter()
+
+            if self.recorder is not None:
+                self.recorder.result(trace.seq, top_keypoints, front_keypoints, playing_midi_notes)
+            if self.touch_detector is not None:
+                # touches seen after this result's front frame
+                playing_midi_notes = self.touch_detector.held(playing_midi_notes, trace.front_captured,
+                                                              trace.resolved)
+
+            self.latest_notes = playing_notes
+            self.latest_midi_notes = playing_midi_notes
+            put_latest(audio_queue, (trace, playing_midi_notes))
+
+    async def audio_stage(self, audio_queue: asyncio.Queue) -> None:
+        while True:
+            trace, playing_midi_notes = await audio_queue.get()
+
+            with self.timers.time("synth"):
+                play_notes(self.piano, playing_midi_notes, trace)
+
+    async def stats_stage(self) -> None:
+        """Writes the stage percentiles to stats_path every stats_interval seconds"""
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            await self.loop.run_in_executor(None, self.timers.dump, self.stats_path)
+
+    async def render_stage(self, render) -> None:
+        """Calls render(pipeline) at render_fps until it returns False"""
+        frame_interval = 1 / self.render_fps
+
+        while True:
+            start = self.loop.time()
+
+            with self.timers.time("render"):
+                if render(self) is False:
+                    return
+
+            await asyncio.sleep(max(0.0, frame_interval - (self.loop.time() - start)))
+
+    # --------------------------------------------
+
+    async def open_cameras(self) -> None:
+        """waits for the cameras if they are still opening in the background"""
+        self.caps = [await resolve(cap) for cap in self.caps]
+
+        for cap in self.caps:
+            cap.add_listener(self.on_new_frame)
+
+    async def load_engine(self) -> None:
+        """waits for the hands models and piano if they are still loading"""
+        self.hands = [await resolve(hands) for hands in self.hands]
+        self.piano = await resolve(self.piano)
+        self.ready = True
+
+    async def run(self, render=None) -> None:
+        """
+        runs all stages until stop() is called, the cameras close, render
+        returns False or a stage raises
+
+        :param render: optional callback called with this pipeline every frame
+        """
+        self.loop = asyncio.get_running_loop()
+        self.frame_event = asyncio.Event()
+        self.stop_event = asyncio.Event()
+
+        capture_queue = asyncio.Queue(self.queue_size)
+        inference_queue = asyncio.Queue(self.queue_size)
+        audio_queue = asyncio.Queue(self.queue_size)
+
+        # startup task -> stages that can start once it is done, so the
+        # calibration screen gets frames before the models have loaded
+        startup = {
+            asyncio.create_task(self.open_cameras()): [
+                self.capture_stage(capture_queue, inference_queue, audio_queue),
+            ],
+            asyncio.create_task(self.load_engine()): [
+                self.inference_stage(capture_queue, inference_queue),
+                self.resolve_stage(inference_queue, audio_queue),
+                self.audio_stage(audio_queue),
+            ],
+        }
+
+        tasks = set(startup) | {asyncio.create_task(self.stop_event.wait())}
+        if render is not None:
+            tasks.add(asyncio.create_task(self.render_stage(render)))
+        if self.stats_path is not None:
+            tasks.add(asyncio.create_task(self.stats_stage()))
+        if self.profiler is not None:
+            tasks.add(asyncio.create_task(self.profiler.run()))
+
+        try:
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                # only startup tasks finished (without errors): start their stages
+                if all(task in startup and task.exception() is None for task in done):
+                    for task in done:
+                        tasks.remove(task)
+                        tasks.update(asyncio.create_task(stage) for stage in startup.pop(task))
+                    continue
+
+                break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            if self.recorder is not None:
+                self.recorder.stop()
+            if self.motion_gate is not None and self.motion_gate.ran:
+                gate = self.motion_gate
+                log(f"Motion gate skipped the hands model on {gate.skipped} of "
+                    f"{gate.ran + gate.skipped} camera frames")
+
+            # close the coroutines of stages that never started
+            for stages in startup.values():
+                for stage in stages:
+                    stage.close()
+
+        # re-raise errors from a crashed stage
+        for task in done:
+            task.result()
@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import cProfile
+import csv
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from config import env_float, env_str
+from log import log
+
+
+class Profiler:
+    """
+    Field profiling without editing code: runs cProfile over a window of the
+    event loop and takes tracemalloc snapshots at intervals, writing everything
+    to timestamped files in out_dir.
+
+    cProfile only sees the event loop thread (capture, note resolution, audio
+    and rendering). The mediapipe calls run in executor threads, their time is
+    in the stage timers instead.
+    """
+
+    def __init__(self, out_dir="profiles", profile_seconds=None, profile_delay=0.0,
+                 tracemalloc_interval=None, counts=None):
+        """
+        :param out_dir: directory for the result files
+        :param profile_seconds: length of the cProfile window, None to not profile
+        :param profile_delay: seconds to wait before profiling (skip startup)
+        :param tracemalloc_interval: seconds between memory snapshots, None for none
+        :param counts: optional callable returning {name: int} to log with each
+                       snapshot (eg particle list lengths)
+        """
+        self.out_dir = out_dir
+        self.profile_seconds = profile_seconds
+        self.profile_delay = profile_delay
+        self.tracemalloc_interval = tracemalloc_interval
+        self.counts = counts
+
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+
+    def path(self, name) -> str:
+        return os.path.join(self.out_dir, f"{self.stamp}-{name}")
+
+    async def run(self) -> None:
+        """
+        runs until cancelled, writing whatever was collected when it is. Stays
+        running once the profile is written, Pipeline.run stops everything when
+        one of its tasks finishes.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        jobs = []
+        if self.profile_seconds:
+            jobs.append(self.profile())
+        if self.tracemalloc_interval:
+            jobs.append(self.track_memory())
+
+        await asyncio.gather(*jobs)
+        await asyncio.Event().wait()
+
+    # ------------------ CPROFILE ------------------
+
+    async def profile(self) -> None:
+        await asyncio.sleep(self.profile_delay)
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(self.profile_seconds)
+        finally:
+            # also reached when the app closes before the window ends
+            profile.disable()
+            self.write_profile(profile)
+
+    def write_profile(self, profile: cProfile.Profile) -> None:
+        profile.dump_stats(self.path("cprofile.prof"))
+
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(50)
+        with open(self.path("cprofile.txt"), "w") as f:
+            f.write(text.getvalue())
+
+        log(f"Wrote cProfile results to {self.path('cprofile.prof')}")
+
+    # ------------------ TRACEMALLOC ------------------
+
+    async def track_memory(self) -> None:
+        # keep enough frames to see who called pygame.Surface(...)
+        tracemalloc.start(10)
+        first = tracemalloc.take_snapshot()
+        count = 0
+
+        try:
+            while True:
+                await asyncio.sleep(self.tracemalloc_interval)
+                count += 1
+                self.write_snapshot(tracemalloc.take_snapshot(), first, count)
+        finally:
+            tracemalloc.stop()
+
+    def write_snapshot(self, snapshot, first, count) -> None:
+        """
+        writes the snapshot, its biggest growth since the first snapshot, and a
+        row of totals and counts to a csv so growth over time is easy to plot
+        """
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        snapshot.dump(self.path(f"tracemalloc-{count:03}.snapshot"))
+
+        counts = self.counts() if self.counts is not None else {}
+        current, peak = tracemalloc.get_traced_memory()
+
+        with open(self.path(f"tracemalloc-{count:03}.txt"), "w") as f:
+            f.write(f"traced {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)\n")
+            for name, value in counts.items():
+                f.write(f"{name}: {value}\n")
+            f.write("\nTop growth since start:\n")
+            for stat in snapshot.compare_to(first, "traceback")[:25]:
+                f.write(f"{stat}\n")
+                for line in stat.traceback.format()[-6:]:
+                    f.write(f"    {line}\n")
+
+        csv_path = self.path("memory.csv")
+        new_file = not os.path.exists(csv_path)
+        with open(csv_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["time", "traced_mb", "peak_mb", *counts.keys()])
+            writer.writerow([time.strftime("%H:%M:%S"), f"{current / 1e6:.2f}", f"{peak / 1e6:.2f}",
+                             *counts.values()])
+
+
+def profiler_from_args(argv=None):
+    """
+    builds a Profiler from the command line, falling back to .env:
+
+        --profile SECONDS        (PROFILE_SECONDS)   cProfile window length
+        --profile-delay SECONDS  (PROFILE_DELAY)     wait before profiling
+        --tracemalloc SECONDS    (TRACEMALLOC_INTERVAL) time between snapshots
+        --profile-dir DIR        (PROFILE_DIR)       output directory
+
+    :returns: Profiler, or None if neither profiling nor tracemalloc is on
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--profile", type=float, default=env_float("PROFILE_SECONDS"))
+    parser.add_argument("--profile-delay", type=float, default=env_float("PROFILE_DELAY", 0.0))
+    parser.add_argument("--tracemalloc", type=float, default=env_float("TRACEMALLOC_INTERVAL"))
+    parser.add_argument("--profile-dir", default=env_str("PROFILE_DIR", "profiles"))
+    args, _ = parser.parse_known_args(argv)
+
+    if not args.profile and not args.tracemalloc:
+        return None
+
+    return Profiler(out_dir=args.profile_dir,
+                    profile_seconds=args.profile,
+                    profile_delay=args.profile_delay,
+                    tracemalloc_interval=args.tracemalloc)
@@ -0,0 +1,115 @@
+import time
+from collections import namedtuple
+from log import log
+
+
+# what the render stage draws at each quality level
+# sparks_per_finger: sparks added per pressed finger per frame
+# ambient_sparks: the background sparks along the bottom
+# note_glow: rising notes with their glow, otherwise plain bars
+# camera_every: new camera frames are shown every this many frames
+QualityLevel = namedtuple("QualityLevel", "sparks_per_finger ambient_sparks note_glow camera_every")
+
+LEVELS = (
+    QualityLevel(sparks_per_finger=3, ambient_sparks=True, note_glow=True, camera_every=1),
+    QualityLevel(sparks_per_finger=1, ambient_sparks=True, note_glow=True, camera_every=1),
+    QualityLevel(sparks_per_finger=1, ambient_sparks=False, note_glow=True, camera_every=1),
+    QualityLevel(sparks_per_finger=0, ambient_sparks=False, note_glow=False, camera_every=1),
+    QualityLevel(sparks_per_finger=0, ambient_sparks=False, note_glow=False, camera_every=2),
+    QualityLevel(sparks_per_finger=0, ambient_sparks=False, note_glow=False, camera_every=4),
+)
+
+# seconds a pipeline stage may take on one frame, a stage slower than a 30 fps
+# camera's frame interval falls behind the cameras
+STAGE_BUDGET = 1 / 30
+
+
+class QualityController:
+    """
+    Steps the visuals down through LEVELS when frames or pipeline stages take
+    longer than their budget, and back up once they are comfortably under it
+    again
+
+    Rendering shares the event loop and the CPU with the capture, inference
+    and audio stages, so a slow frame delays the notes too, and drawing less
+    leaves more for a stage that can't keep up. Only eye candy is ever
+    dropped, the sound producing stages are never touched.
+
+    The load is the larger of the frame time over budget and the slowest
+    stage time over stage_budget, so 1.0 is at budget. Going down needs
+    down_frames slow frames in a row and going up needs up_frames fast ones
+    (under up_ratio of the budget), so it doesn't flicker between levels, and
+    a level is only logged once it has held for log_hold seconds.
+    """
+
+    def __init__(self, budget, stage_budget=STAGE_BUDGET, levels=LEVELS, down_frames=20, up_frames=180,
+                 up_ratio=0.6, smoothing=0.1, log_hold=2.0, enabled=True):
+        """
+        :param budget: seconds one frame may take
+        :param stage_budget: seconds one run of a pipeline stage may take
+        :param levels: QualityLevels from best to cheapest
+        :param down_frames: slow frames in a row before stepping down
+        :param up_frames: fast frames in a row before stepping up
+        :param up_ratio: fraction of the budget a frame must be under to count as fast
+        :param smoothing: weight of the newest frame in the moving average
+        :param log_hold: seconds a level must last before it is logged
+        :param enabled: False to always stay at the best level
+        """
+        self.budget = budget
+        self.stage_budget = stage_budget
+        self.levels = levels
+        self.down_frames = down_frames
+        self.up_frames = up_frames
+        self.up_ratio = up_ratio
+        self.smoothing = smoothing
+        self.log_hold = log_hold
+        self.enabled = enabled
+
+        self.index = 0
+        # moving average of the load
+        self.average = 0.0
+        self.slow = 0
+        self.fast = 0
+
+        # the level last logged and when the current one was reached
+        self.logged_index = 0
+        self.changed = 0.0
+
+    @property
+    def level(self) -> QualityLevel:
+        return self.levels[self.index]
+
+    def add(self, frame_time: float, stage_time=0.0) -> None:
+        """
+        records how long the last frame took to draw
+
+        :param frame_time: seconds the frame took
+        :param stage_time: seconds the slowest pipeline stage last took
+        """
+        load = max(frame_time / self.budget, stage_time / self.stage_budget)
+        self.average += self.smoothing * (load - self.average)
+        if not self.enabled:
+            return
+
+        if self.average > 1.0:
+            self.slow += 1
+            self.fast = 0
+        elif self.average < self.up_ratio:
+            self.fast += 1
+            self.slow = 0
+        else:
+            self.slow = self.fast = 0
+
+        if self.slow >= self.down_frames and self.index < len(self.levels) - 1:
+            self.set_index(self.index + 1)
+        elif self.fast >= self.up_frames and self.index > 0:
+            self.set_index(self.index - 1)
+
+        if self.index != self.logged_index and time.perf_counter() - self.changed >= self.log_hold:
+            self.logged_index = self.index
+            log(f"Render quality level {self.index} ({self.average:.0%} of budget): {self.level}")
+
+    def set_index(self, index) -> None:
+        self.index = index
+        self.slow = self.fast = 0
+        self.changed = time.perf_counter()
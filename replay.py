@@ -0,0 +1,216 @@
+import argparse
+import time
+from instrument_front import instrument_front_from_calibration
+from keyboard_set import keyboards_from_calibration
+from engine import create_hands_model, process_frame, play_notes, get_keyboard_notes
+from session_recorder import load_session
+from stage_timers import StageTimers
+from video import FileVideo
+
+
+class NoteCounter:
+    """stands in for Instrument during replays: tracks current_notes the same
+    way and counts note ons, without a synth"""
+
+    def __init__(self):
+        self.current_notes = set()
+        self.note_ons = 0
+
+    def add_note(self, midi_note: int, trace=None) -> None:
+        self.current_notes.add(midi_note)
+        self.note_ons += 1
+
+    def remove_note(self, midi_note: int) -> None:
+        self.current_notes.discard(midi_note)
+
+
+def build_instruments(session):
+    """calibrated KeyboardSet and InstrumentFront (or TableSegments) for a recording"""
+    calibration = session["calibration"]
+
+    keyboards = keyboards_from_calibration(calibration, session["transposes"])
+    instrument_front = instrument_front_from_calibration(calibration)
+
+    return keyboards, instrument_front
+
+
+def resolve_notes(keyboards, instrument_front, top_keypoints, front_keypoints, piano, timers) -> set:
+    """same as the pipeline resolve and audio stages, returns the midi notes"""
+    playing_notes = get_keyboard_notes(keyboards, instrument_front,
+                                       top_keypoints, front_keypoints, timers)
+
+    if playing_notes is None:
+        midi_notes = set()
+    else:
+        midi_notes = keyboards.midi_notes(playing_notes)
+
+    with timers.time("synth"):
+        play_notes(piano, midi_notes)
+
+    return midi_notes
+
+
+def replay_video(session, keyboards, instrument_front, piano, timers, limit=None) -> dict:
+    """
+    runs every recorded frame pair through the hands models and note engine
+
+    :returns: seq -> midi notes
+    """
+    top_path, front_path = session["video"]
+    top_cap = FileVideo(top_path)
+    front_cap = FileVideo(front_path)
+    hands_top = create_hands_model(2 * len(keyboards))
+    hands_front = create_hands_model(2 * len(keyboards))
+
+    notes = {}
+    try:
+        # one frame in each video per line of frames.jsonl
+        for line in session["frames"][:limit]:
+            if not (top_cap.step() and front_cap.step()):
+                break
+
+            with timers.time("total"):
+                top_keypoints = process_frame(top_cap.read(), hands_top, timers, "top")
+                front_keypoints = process_frame(front_cap.read(), hands_front, timers, "front")
+                notes[line["seq"]] = resolve_notes(keyboards, instrument_front, top_keypoints,
+                                                   front_keypoints, piano, timers)
+    finally:
+        top_cap.release()
+        front_cap.release()
+        hands_top.close()
+        hands_front.close()
+
+    return notes
+
+
+def replay_landmarks(session, keyboards, instrument_front, piano, timers, limit=None) -> dict:
+    """
+    runs the recorded fingertips through the note engine, skipping mediapipe
+
+    :returns: seq -> midi notes
+    """
+    notes = {}
+    for line in session["results"][:limit]:
+        with timers.time("total"):
+            notes[line["seq"]] = resolve_notes(keyboards, instrument_front, line["top"],
+                                               line["front"], piano, timers)
+
+    return notes
+
+
+# ------------------ ACCURACY ------------------
+
+def note_onsets(notes_by_seq) -> list[tuple[int, int]]:
+    """(seq, note) for every note that starts, in seq order"""
+    onsets = []
+    previous = set()
+    for seq in sorted(notes_by_seq):
+        notes = notes_by_seq[seq]
+        onsets.extend((seq, note) for note in sorted(notes - previous))
+        previous = notes
+
+    return onsets
+
+
+def match_onsets(expected, actual, tolerance) -> int:
+    """number of expected onsets with an actual onset of the same note within tolerance frames"""
+    unmatched = list(actual)
+    matched = 0
+
+    for seq, note in expected:
+        for i, (actual_seq, actual_note) in enumerate(unmatched):
+            if actual_note == note and abs(actual_seq - seq) <= tolerance:
+                del unmatched[i]
+                matched += 1
+                break
+
+    return matched
+
+
+def accuracy(recorded, replayed, tolerance=2) -> dict:
+    """
+    compares replayed notes with the notes recorded live, on the frame pairs
+    that have both
+
+    :param recorded: seq -> midi notes from the recording
+    :param replayed: seq -> midi notes from the replay
+    :param tolerance: frames an onset may move and still count as the same note
+    """
+    seqs = [seq for seq in recorded if seq in replayed]
+
+    exact = sum(recorded[seq] == replayed[seq] for seq in seqs)
+    true_positives = sum(len(recorded[seq] & replayed[seq]) for seq in seqs)
+    false_positives = sum(len(replayed[seq] - recorded[seq]) for seq in seqs)
+    false_negatives = sum(len(recorded[seq] - replayed[seq]) for seq in seqs)
+
+    precision = true_positives / max(1, true_positives + false_positives)
+    recall = true_positives / max(1, true_positives + false_negatives)
+
+    recorded_onsets = note_onsets(recorded)
+    replayed_onsets = note_onsets(replayed)
+
+    return {
+        "frames": len(seqs),
+        "exact_frames": exact,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / max(1e-9, precision + recall),
+        "recorded_onsets": len(recorded_onsets),
+        "replayed_onsets": len(replayed_onsets),
+        "matched_onsets": match_onsets(recorded_onsets, replayed_onsets, tolerance),
+        "tolerance": tolerance,
+    }
+
+
+def print_report(mode, count, elapsed, timers, result) -> None:
+    print(f"Replayed {count} frame pairs from {mode} in {elapsed:.2f} s "
+          f"({count / max(elapsed, 1e-9):.1f} fps)")
+    print()
+
+    for text, _ in timers.hud_lines():
+        print(text)
+    print()
+
+    frames = max(1, result["frames"])
+    print(f"frames matching recording  {result['exact_frames'] / frames:7.1%} "
+          f"({result['exact_frames']}/{result['frames']})")
+    print(f"note precision             {result['precision']:7.1%}")
+    print(f"note recall                {result['recall']:7.1%}")
+    print(f"note F1                    {result['f1']:7.1%}")
+    print(f"note onsets                {result['matched_onsets']} of {result['recorded_onsets']} recorded "
+          f"matched within {result['tolerance']} frames, {result['replayed_onsets']} replayed")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays a session recorded with RECORD_SESSION through the note engine")
+    parser.add_argument("recording", help="recording directory")
+    parser.add_argument("--landmarks", action="store_true",
+                        help="replay the recorded fingertips instead of running mediapipe on the video")
+    parser.add_argument("--limit", type=int, default=None, help="only replay the first N frame pairs")
+    parser.add_argument("--tolerance", type=int, default=2,
+                        help="frames a note onset may move and still match")
+    args = parser.parse_args()
+
+    session = load_session(args.recording)
+    keyboards, instrument_front = build_instruments(session)
+    piano = NoteCounter()
+
+    use_video = session["video"] is not None and not args.landmarks
+    count = len(session["frames"] if use_video else session["results"])
+    timers = StageTimers(window=max(1, count))
+
+    start = time.perf_counter()
+    if use_video:
+        replayed = replay_video(session, keyboards, instrument_front, piano, timers, args.limit)
+    else:
+        replayed = replay_landmarks(session, keyboards, instrument_front, piano, timers, args.limit)
+    elapsed = time.perf_counter() - start
+
+    recorded = {line["seq"]: set(line["notes"]) for line in session["results"]}
+    print_report("video" if use_video else "landmarks", len(replayed), elapsed, timers,
+                 accuracy(recorded, replayed, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
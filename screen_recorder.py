@@ -0,0 +1,218 @@
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+import cv2
+import numpy as np
+import pygame
+from config import env_str, env_int, env_float
+from log import log
+
+
+# container -> fourcc
+CODECS = {
+    ".avi": "MJPG",
+    ".mp4": "mp4v",
+}
+
+
+def fourcc_for(path) -> int:
+    """fourcc for a video path, MJPG unless it is an .mp4"""
+    for extension, codec in CODECS.items():
+        if path.lower().endswith(extension):
+            return cv2.VideoWriter_fourcc(*codec)
+
+    return cv2.VideoWriter_fourcc(*"MJPG")
+
+
+def channel_bytes(surface: pygame.Surface) -> tuple[int, int, int]:
+    """byte offsets of blue, green and red within a 32 bit pixel of surface"""
+    offsets = []
+    for shift in surface.get_shifts()[2::-1]:
+        offset = shift // 8
+        offsets.append(offset if sys.byteorder == "little" else 3 - offset)
+
+    return tuple(offsets)
+
+
+def encode(path, shm_name, window_size, size, order, slots, fps, filled, free, written) -> None:
+    """
+    encoder process: writes the frames the render loop puts in the ring
+
+    Frames are written at their capture time, so a frame is repeated when
+    the render loop was slow (or frames were dropped) and the video still
+    plays back in real time.
+
+    :param window_size: (width, height) of the raw 32 bit frames in the ring
+    :param size: (width, height) of the video
+    :param order: channel_bytes of the raw frames
+    :param filled: queue of (slot, seconds since the recording started), None to stop
+    :param free: queue the slots go back on once written
+    :param written: shared count of frames written
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    window_width, window_height = window_size
+    ring = np.ndarray((slots, window_height, window_width, 4), dtype=np.uint8, buffer=shm.buf)
+    writer = cv2.VideoWriter(path, fourcc_for(path), fps, size)
+    bgr = np.empty((window_height, window_width, 3), dtype=np.uint8)
+    video_frame = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    try:
+        while True:
+            item = filled.get()
+            if item is None:
+                break
+
+            slot, timestamp = item
+            if order == (0, 1, 2):
+                cv2.cvtColor(ring[slot], cv2.COLOR_BGRA2BGR, dst=bgr)
+            else:
+                np.take(ring[slot], order, axis=2, out=bgr)
+            free.put(slot)
+
+            if size != tuple(window_size):
+                cv2.resize(bgr, size, dst=video_frame, interpolation=cv2.INTER_AREA)
+            else:
+                video_frame = bgr
+
+            # one video frame per 1/fps seconds, at least one per captured frame
+            target = int(timestamp * fps)
+            repeats = max(1, target - written.value + 1)
+            for _ in range(repeats):
+                writer.write(video_frame)
+            written.value += repeats
+    finally:
+        writer.release()
+        del ring
+        shm.close()
+
+
+class ScreenRecorder:
+    """
+    Records the window (camera panels, notes and sparks) to a video file
+
+    capture() is called by the render loop and only copies the window's raw
+    pixels into a free slot of a shared memory ring (a memcpy), a separate
+    process converts, scales and encodes the frames so none of that adds to
+    the frame time. When the
+    encoder falls behind and there is no free slot the frame is dropped
+    instead of waiting, and the drops are counted.
+    """
+
+    def __init__(self, path, surface: pygame.Surface, width=None, fps=30.0, slots=8):
+        """
+        :param path: video file (.avi or .mp4), may contain strftime codes
+        :param surface: the window surface recorded
+        :param width: width of the video, the window width if None, the
+                      height keeps the window's aspect ratio
+        :param fps: frames per second captured and written
+        :param slots: frames the ring holds
+        """
+        self.path = time.strftime(path)
+        self.fps = fps
+        self.slots = slots
+
+        self.window_size = surface.get_size()
+        window_width, window_height = self.window_size
+        width = width or window_width
+        # even sizes, some codecs need them
+        self.size = (width // 2 * 2, round(window_height * width / window_width) // 2 * 2)
+
+        # 32 bit surfaces are copied as they are, anything else through tobytes
+        self.raw = surface.get_bytesize() == 4
+        order = channel_bytes(surface) if self.raw else (2, 1, 0)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * window_height * window_width * 4)
+        self.ring = np.ndarray((slots, window_height, window_width, 4), dtype=np.uint8, buffer=self.shm.buf)
+
+        # spawned, not forked, so the camera threads aren't copied into it
+        context = multiprocessing.get_context("spawn")
+        self.filled = context.Queue()
+        self.free = context.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.written = context.Value("q", 0, lock=False)
+        self.process = context.Process(target=encode, daemon=True,
+                                       args=(self.path, self.shm.name, self.window_size, self.size, order,
+                                             slots, fps, self.filled, self.free, self.written))
+
+        self.start_time = None
+        # last frame number (capture time * fps) captured
+        self.last_frame = -1
+        self.captured = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        self.process.start()
+        log(f"Recording the screen to {self.path} at {self.size[0]}x{self.size[1]}, {self.fps:g} fps")
+
+    def stop(self) -> None:
+        """writes the frames still in the ring and closes the video"""
+        if self.process.is_alive():
+            self.filled.put(None)
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.terminate()
+
+        del self.ring
+        self.shm.close()
+        self.shm.unlink()
+
+        log(f"Screen recording: {self.captured} frames captured, {self.dropped} dropped "
+            f"(encoder behind), {self.written.value} written to {self.path}")
+
+    # ---------- hot path (render loop) ----------
+
+    def capture(self, surface: pygame.Surface) -> None:
+        """copies surface into the ring if a frame is due, dropping it if the ring is full"""
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now
+
+        frame = int((now - self.start_time) * self.fps)
+        if frame <= self.last_frame:
+            return
+        self.last_frame = frame
+
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+
+        if self.raw:
+            # (height, width) view of the window's 32 bit pixels, rows contiguous
+            pixels = np.asarray(surface.get_view("2")).T
+            np.copyto(self.ring[slot], pixels.view(np.uint8).reshape(self.ring[slot].shape))
+            # unlocks the surface
+            del pixels
+        else:
+            pixels = np.frombuffer(pygame.image.tobytes(surface, "RGBX"), dtype=np.uint8)
+            np.copyto(self.ring[slot], pixels.reshape(self.ring[slot].shape))
+
+        self.filled.put((slot, now - self.start_time))
+        self.captured += 1
+
+
+def start_screen_recorder_from_env(app):
+    """
+    records app's window while playing if RECORD_SCREEN is set in .env (a
+    video path, strftime codes allowed)
+
+    :param app: main.App
+    :returns: the recorder, or None if recording is off
+    """
+    path = env_str("RECORD_SCREEN")
+    if path is None:
+        return None
+
+    recorder = ScreenRecorder(path, app.screen,
+                              width=env_int("RECORD_SCREEN_WIDTH", None),
+                              fps=env_float("RECORD_SCREEN_FPS", 30.0),
+                              slots=env_int("RECORD_SCREEN_SLOTS", 8))
+    recorder.start()
+    app.screen_recorder = recorder
+
+    return recorder
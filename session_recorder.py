@@ -0,0 +1,234 @@
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+from calibration import save_calibration, load_calibration
+from config import env_str, env_int, env_bool
+from log import log
+
+
+# files inside a recording directory
+CALIBRATION_FILE = "calibration.json"
+SESSION_FILE = "session.json"
+FRAMES_FILE = "frames.jsonl"
+RESULTS_FILE = "results.jsonl"
+TOP_VIDEO_FILE = "top.avi"
+FRONT_VIDEO_FILE = "front.avi"
+
+# nominal rate written to the video headers, replay steps frame by frame anyway
+RECORDING_FPS = 30
+
+
+class SessionRecorder:
+    """
+    Records a playing session to a directory so it can be replayed offline by
+    replay.py:
+
+        calibration.json   the calibration in use (every keyboard)
+        session.json       transposes and whether video was recorded
+        top.avi front.avi  one frame per captured frame pair (optional)
+        frames.jsonl       {"seq", "time"} per frame pair, in video order
+        results.jsonl      {"seq", "time", "top", "front", "notes"}, the
+                           fingertips and midi notes the live engine found for
+                           that frame pair (ground truth for the replay)
+
+    frame() and result() are called from the pipeline stages and only put on a
+    queue, a writer thread encodes the videos and writes the files. At most
+    max_queued_frames frame pairs wait for the writer: if the disk or the
+    encoder falls behind, new frame pairs are dropped (and counted) instead
+    of piling up in memory. Results are small and always kept.
+
+    If the videos can't be written (disk full, codec error) the recording
+    carries on without them, and if the json lines can't be written it
+    stops, logging why either way.
+    """
+
+    def __init__(self, directory, video=True, max_queued_frames=60):
+        """
+        :param directory: directory to write, may contain strftime codes (eg recordings/%Y%m%d-%H%M%S)
+        :param video: also record the camera frames, not just the fingertips
+        :param max_queued_frames: frame pairs that may wait for the writer
+        """
+        self.directory = time.strftime(directory)
+        self.video = video
+
+        self.queue = queue.Queue()
+        # one slot per frame pair allowed on the queue, given back once written
+        self.frame_slots = threading.Semaphore(max_queued_frames)
+        self.dropped_frames = 0
+        # set by the writer thread if it had to stop, nothing more is queued
+        self.failed = False
+        self.start_time = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+        # only touched by the writer thread
+        self.writers = {}
+
+    def start(self, keyboards, instrument_front) -> None:
+        """
+        called once calibrated, saves the calibration and starts writing
+
+        :param keyboards: calibrated keyboard_set.KeyboardSet
+        :param instrument_front: calibrated InstrumentFront (or TableSegments)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        instrument_top = keyboards.primary
+        save_calibration(os.path.join(self.directory, CALIBRATION_FILE),
+                         instrument_top.piano_corners, instrument_front.table_endpoints,
+                         instrument_top.num_keys, instrument_top.lowest_note, keyboards, instrument_front)
+        with open(os.path.join(self.directory, SESSION_FILE), "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "transpose": instrument_top.transpose,
+                "transposes": [keyboard.instrument_top.transpose for keyboard in keyboards],
+                "video": self.video,
+            }, f, indent=2)
+
+        self.start_time = time.perf_counter()
+        self.thread.start()
+
+        log(f"Recording session to {self.directory}")
+
+    def stop(self) -> None:
+        """writes everything still queued and closes the files"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+        if self.dropped_frames:
+            log(f"Session recording dropped {self.dropped_frames} frame pairs, the writer fell behind")
+
+    # ---------- hot path (pipeline stages) ----------
+
+    def frame(self, seq: int, frames) -> None:
+        """a (top, front) frame pair sent to inference"""
+        if self.failed:
+            return
+        if not self.frame_slots.acquire(blocking=False):
+            self.dropped_frames += 1
+            return
+        self.queue.put(("frame", seq, time.perf_counter() - self.start_time, frames))
+
+    def result(self, seq: int, top_keypoints, front_keypoints, midi_notes) -> None:
+        """the fingertips and notes found for frame pair seq"""
+        if self.failed:
+            return
+        self.queue.put(("result", seq, time.perf_counter() - self.start_time,
+                        (top_keypoints, front_keypoints, sorted(midi_notes))))
+
+    # ---------- writer thread ----------
+
+    def run(self) -> None:
+        frames_file = open(os.path.join(self.directory, FRAMES_FILE), "w")
+        results_file = open(os.path.join(self.directory, RESULTS_FILE), "w")
+
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+
+                kind, seq, timestamp, data = item
+                if kind == "frame":
+                    try:
+                        if self.video:
+                            self.write_frames(data)
+                        frames_file.write(json.dumps({"seq": seq, "time": round(timestamp, 4)}) + "\n")
+                    finally:
+                        self.frame_slots.release()
+                else:
+                    top_keypoints, front_keypoints, notes = data
+                    results_file.write(json.dumps({
+                        "seq": seq,
+                        "time": round(timestamp, 4),
+                        "top": top_keypoints,
+                        "front": front_keypoints,
+                        "notes": notes,
+                    }) + "\n")
+        except OSError as e:
+            self.failed = True
+            log(f"Session recording to {self.directory} stopped, {e}")
+        finally:
+            frames_file.close()
+            results_file.close()
+            for writer in self.writers.values():
+                writer.release()
+
+    def write_frames(self, frames) -> None:
+        """writes a (top, front) frame pair, turning video off if that fails"""
+        try:
+            self.write_video(TOP_VIDEO_FILE, frames[0])
+            self.write_video(FRONT_VIDEO_FILE, frames[1])
+        except (cv2.error, OSError) as e:
+            # replay stops at the end of the shorter video, the frame lines still line up
+            self.video = False
+            for writer in self.writers.values():
+                writer.release()
+            self.writers.clear()
+            log(f"Session recording carries on without video, {e}")
+
+    def write_video(self, name, frame) -> None:
+        writer = self.writers.get(name)
+        if writer is None:
+            height, width = frame.shape[:2]
+            path = os.path.join(self.directory, name)
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), RECORDING_FPS, (width, height))
+            if not writer.isOpened():
+                raise OSError(f"can't open {path} for writing")
+            self.writers[name] = writer
+
+        writer.write(frame)
+
+
+def load_session(directory) -> dict:
+    """
+    reads a recording written by SessionRecorder
+
+    :param directory: recording directory
+    :returns: dict with "calibration" (see load_calibration), "transpose"
+              and "transposes" (one per keyboard), "video" (top/front video
+              paths or None), "frames" and "results" (lists of the json lines)
+    """
+    with open(os.path.join(directory, SESSION_FILE)) as f:
+        session = json.load(f)
+
+    def read_lines(name):
+        with open(os.path.join(directory, name)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    video = None
+    top_path = os.path.join(directory, TOP_VIDEO_FILE)
+    front_path = os.path.join(directory, FRONT_VIDEO_FILE)
+    if session.get("video") and os.path.exists(top_path) and os.path.exists(front_path):
+        video = (top_path, front_path)
+
+    return {
+        "calibration": load_calibration(os.path.join(directory, CALIBRATION_FILE)),
+        "transpose": session.get("transpose", 0),
+        "transposes": session.get("transposes", [session.get("transpose", 0)]),
+        "video": video,
+        "frames": read_lines(FRAMES_FILE),
+        "results": read_lines(RESULTS_FILE),
+    }
+
+
+def start_session_recorder_from_env(pipeline):
+    """
+    attaches a SessionRecorder to pipeline if RECORD_SESSION is set in .env,
+    it starts recording once the pipeline starts playing
+
+    :param pipeline: Pipeline to record
+    :returns: the recorder, or None if recording is off
+    """
+    directory = env_str("RECORD_SESSION")
+    if directory is None:
+        return None
+
+    recorder = SessionRecorder(directory, video=env_bool("RECORD_SESSION_VIDEO", True),
+                               max_queued_frames=env_int("RECORD_SESSION_QUEUE", 60))
+    pipeline.recorder = recorder
+
+    return recorder
@@ -0,0 +1,136 @@
+import contextlib
+import csv
+import json
+import os
+import time
+from collections import deque
+
+
+# frame budget at 60 fps, stages over this are highlighted in the HUD
+FRAME_BUDGET = 1 / 60
+
+
+class StageTimer:
+    """context manager that adds its elapsed time to a stage"""
+    __slots__ = ("timers", "stage", "start")
+
+    def __init__(self, timers, stage):
+        self.timers = timers
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # don't record stages that were interrupted (eg a timed out wait)
+        if exc_type is None:
+            self.timers.add(self.stage, time.perf_counter() - self.start)
+
+
+class StageTimers:
+    """
+    Rolling window of durations per pipeline stage, for p50/p95/p99 stats
+
+    add() only appends to a bounded deque, so it is cheap and safe to call from
+    the inference threads as well as the event loop.
+    """
+
+    def __init__(self, window=300):
+        """
+        :param window: number of recent samples kept per stage
+        """
+        self.window = window
+        # stage name -> deque of seconds
+        self.samples = {}
+
+    def time(self, stage: str) -> StageTimer:
+        """with timers.time("stage"): ..."""
+        return StageTimer(self, stage)
+
+    def add(self, stage: str, seconds: float) -> None:
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples.setdefault(stage, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def slowest(self, skip=()) -> float:
+        """
+        :param skip: stages left out, eg ones that time a wait
+        :returns: the longest of every stage's newest sample in seconds, 0 if none
+        """
+        newest = [samples[-1] for stage, samples in list(self.samples.items())
+                  if samples and stage not in skip]
+
+        return max(newest, default=0.0)
+
+    def percentiles(self) -> dict:
+        """
+        :returns: stage -> {"count", "p50", "p95", "p99"} in seconds
+        """
+        stats = {}
+        for stage, samples in list(self.samples.items()):
+            values = sorted(samples)
+            if not values:
+                continue
+
+            def percentile(p):
+                return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+            stats[stage] = {
+                "count": len(values),
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+            }
+
+        return stats
+
+    def dump(self, path: str) -> None:
+        """
+        appends the current percentiles to path, as csv rows if it ends in .csv
+        and as one json line otherwise
+        """
+        stats = self.percentiles()
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if path.endswith(".csv"):
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["time", "stage", "count", "p50_ms", "p95_ms", "p99_ms"])
+                for stage, s in stats.items():
+                    writer.writerow([now, stage, s["count"],
+                                     f"{s['p50'] * 1000:.3f}", f"{s['p95'] * 1000:.3f}", f"{s['p99'] * 1000:.3f}"])
+        else:
+            with open(path, "a") as f:
+                f.write(json.dumps({"time": now, "stages": stats}) + "\n")
+
+    def hud_lines(self) -> list[tuple[str, bool]]:
+        """
+        :returns: (text, over budget) per stage for the on screen HUD
+        """
+        lines = [("stage                 p50    p95    p99 ms", False)]
+        for stage, s in self.percentiles().items():
+            text = f"{stage[:20]:<20} {s['p50'] * 1000:6.1f} {s['p95'] * 1000:6.1f} {s['p99'] * 1000:6.1f}"
+            lines.append((text, s["p95"] > FRAME_BUDGET))
+
+        return lines
+
+
+class NullTimers:
+    """stands in for StageTimers when nothing is being measured"""
+
+    def time(self, stage: str):
+        return contextlib.nullcontext()
+
+    def add(self, stage: str, seconds: float) -> None:
+        pass
+
+
+NULL_TIMERS = NullTimers()
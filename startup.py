@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from log import log
+
+
+class Warmup:
+    """
+    Runs the slow startup jobs (hands models, cameras, soundfont) concurrently
+    in background threads so the window can open straight away, and times them
+    """
+
+    def __init__(self, start_time=None, max_workers=5):
+        """
+        :param start_time: time.perf_counter() at process start, defaults to now
+        :param max_workers: number of jobs that can run at once
+        """
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+
+        # name -> seconds taken by the job (or milestone time since start)
+        self.timings = {}
+        # name -> Future
+        self.jobs = {}
+
+        self.lock = threading.Lock()
+        # no report until every job has been submitted (see all_submitted)
+        self.submitting = True
+        self.reported = False
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        starts fn(*args, **kwargs) in the background
+
+        :param name: name used in the timing report
+        :returns: concurrent.futures.Future with the result
+        """
+        def timed():
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            self.timings[name] = time.perf_counter() - start
+            return result
+
+        job = self.executor.submit(timed)
+        self.jobs[name] = job
+        job.add_done_callback(self.on_job_done)
+
+        return job
+
+    def all_submitted(self) -> None:
+        """called after the last submit, the report is logged when they are all done"""
+        self.submitting = False
+        self.on_job_done(None)
+
+    def on_job_done(self, job) -> None:
+        # report once, when the last job finishes
+        with self.lock:
+            if self.submitting or self.reported or self.pending():
+                return
+            self.reported = True
+
+        self.mark("ready")
+        self.report()
+
+    def mark(self, name) -> None:
+        """records a milestone (eg window shown) as seconds since start"""
+        self.timings[name] = time.perf_counter() - self.start_time
+
+    def pending(self) -> list[str]:
+        """names of jobs that haven't finished yet"""
+        return [name for name, job in self.jobs.items() if not job.done()]
+
+    def result(self, name):
+        """waits for a job and returns its result, or None if it failed"""
+        job = self.jobs[name]
+        if job.exception() is not None:
+            return None
+
+        return job.result()
+
+    def wait(self) -> None:
+        """blocks until every job is done, raising the first error"""
+        for job in self.jobs.values():
+            job.result()
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def report(self) -> None:
+        """logs how long each job and milestone took"""
+        width = max(len(name) for name in self.timings)
+        lines = ["Startup timings"]
+        for name, seconds in self.timings.items():
+            lines.append(f"  {name.ljust(width)}  {seconds * 1000:8.1f} ms")
+
+        for name, job in self.jobs.items():
+            if job.done() and job.exception() is not None:
+                lines.append(f"  {name} failed: {job.exception()!r}")
+
+        log("\n".join(lines))
@@ -0,0 +1,431 @@
+import argparse
+import math
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from config import env_str, env_bool, env_float
+from log import log
+
+
+# event kinds
+NOTE_ON = 1
+NOTE_OFF = 2
+PROGRAM = 3
+# every channel's program and the notes that should be held, sent regularly
+# so the server recovers from lost packets
+SYNC = 4
+# fluidsynth synth.gain
+GAIN = 5
+
+# kind, sender session, sequence number
+HEADER = struct.Struct("!BHI")
+# channel, note, velocity (no velocity for NOTE_OFF)
+NOTE_EVENT = struct.Struct("!BBB")
+NOTE_OFF_EVENT = struct.Struct("!BB")
+# channel, bank, preset
+PROGRAM_EVENT = struct.Struct("!BHH")
+# gain
+GAIN_EVENT = struct.Struct("!f")
+# gain, number of programs, number of held notes, then PROGRAM_EVENTs and NOTE_OFF_EVENTs
+SYNC_COUNTS = struct.Struct("!fBH")
+
+SEQ_MODULO = 2 ** 32
+MAX_PACKET = 8192
+
+DEFAULT_ADDRESS = "udp://127.0.0.1:9123"
+
+# a soundfont preset header: name, preset, bank, then fields not needed here
+PRESET_HEADER = struct.Struct("<20sHH14x")
+
+
+def parse_address(address):
+    """
+    :param address: udp://host:port, or unix:///path/to/socket (not on Windows)
+    :returns: (socket family, socket address)
+    """
+    if address.startswith("udp://"):
+        host, _, port = address[len("udp://"):].rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    if address.startswith("unix://"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("unix:// synth server addresses need a unix socket, use udp://127.0.0.1:<port>")
+        return socket.AF_UNIX, address[len("unix://"):]
+
+    raise ValueError(f"Unknown synth server address {address}, use udp://host:port or unix:///path")
+
+
+def preset_names(soundfont_path) -> dict:
+    """
+    reads the preset names from a soundfont's preset headers, so they don't
+    have to come from a synth
+
+    :param soundfont_path: .sf2 file
+    :returns: (bank, preset) -> name, empty if the file can't be read
+    """
+    try:
+        with open(soundfont_path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return {}
+    if data[:4] != b"RIFF" or data[8:12] != b"sfbk":
+        return {}
+
+    # RIFF chunks: id, little endian size, data padded to an even size, and
+    # the preset headers are a "phdr" chunk in the "pdta" list
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size = int.from_bytes(data[offset + 4:offset + 8], "little")
+        if chunk_id == b"LIST" and data[offset + 8:offset + 12] == b"pdta":
+            # into the list
+            offset += 12
+            continue
+        if chunk_id == b"phdr":
+            names = {}
+            # the last header only marks the end
+            for start in range(offset + 8, offset + 8 + size - PRESET_HEADER.size, PRESET_HEADER.size):
+                name, preset, bank = PRESET_HEADER.unpack_from(data, start)
+                names[(bank, preset)] = name.split(b"\0", 1)[0].decode("latin-1").strip()
+            return names
+        offset += 8 + size + size % 2
+
+    return {}
+
+
+class RemoteSynth:
+    """
+    Stands in for fluidsynth.Synth inside Instrument and sends every call to a
+    SynthServer as a small binary datagram, so a stall in the vision or
+    drawing code can't hold up the audio and the synth can run on another
+    machine.
+
+    Every packet carries the sender session and a sequence number so the
+    server can count lost and reordered packets. Datagrams can be lost, so a
+    thread also sends the full state (programs and held notes) every
+    sync_interval seconds, which releases any note whose note off was lost.
+
+    Preset names are read from the soundfont here (if this machine has a
+    copy), and synth.gain is sent on to the server.
+    """
+
+    def __init__(self, address, sync_interval=0.25, process=None):
+        """
+        :param address: server address, see parse_address
+        :param sync_interval: seconds between state packets
+        :param process: optional subprocess.Popen of a local server to stop with the synth
+        """
+        self.address = address
+        self.family, self.sockaddr = parse_address(address)
+        self.socket = socket.socket(self.family, socket.SOCK_DGRAM)
+        self.sync_interval = sync_interval
+        self.process = process
+
+        # a new session every run, so the server doesn't drop our packets as old
+        self.session = random.randrange(1 << 16)
+        self.seq = 0
+        # sends come from the audio stage and the sync thread
+        self.lock = threading.Lock()
+
+        # channel -> (bank, preset), and the (channel, note) held
+        self.programs = {}
+        self.held = set()
+        # the server's gain until setting() changes it
+        self.gain = None
+        # (bank, preset) -> name
+        self.preset_names = {}
+
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    # ---------- fluidsynth.Synth calls used by Instrument ----------
+
+    def sfload(self, path) -> int:
+        # the server loads the soundfont to play it, only the names are read here
+        self.preset_names = preset_names(path)
+        return 1
+
+    def sfpreset_name(self, sfid, bank, preset):
+        # None without a local copy of the soundfont, Instrument falls back to "Bank b P p"
+        return self.preset_names.get((bank, preset))
+
+    def setting(self, name, value) -> None:
+        # only synth.gain is sent, other settings stay as the server has them
+        if name != "synth.gain":
+            return
+        with self.lock:
+            self.gain = float(value)
+            self.send_locked(GAIN, GAIN_EVENT.pack(self.gain))
+
+    def start(self, *args, **kwargs) -> None:
+        self.thread.start()
+
+    def program_select(self, channel, sfid, bank, preset) -> None:
+        with self.lock:
+            self.programs[channel] = (bank, preset)
+            self.send_locked(PROGRAM, PROGRAM_EVENT.pack(channel, bank, preset))
+
+    def noteon(self, channel, note, velocity) -> None:
+        # held and the sequence numbers change together, so a sync never
+        # goes out after a note on without that note
+        with self.lock:
+            self.held.add((channel, note))
+            self.send_locked(NOTE_ON, NOTE_EVENT.pack(channel, note, velocity))
+
+    def noteoff(self, channel, note) -> None:
+        with self.lock:
+            self.held.discard((channel, note))
+            self.send_locked(NOTE_OFF, NOTE_OFF_EVENT.pack(channel, note))
+
+    def delete(self) -> None:
+        """releases every note on the server and stops the local server if there is one"""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+        with self.lock:
+            self.held.clear()
+        self.sync()
+        self.socket.close()
+
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+
+    # --------------------------------------------
+
+    def send_locked(self, kind, payload) -> None:
+        """sends an event, the caller holds self.lock"""
+        self.seq = (self.seq + 1) % SEQ_MODULO
+        try:
+            self.socket.sendto(HEADER.pack(kind, self.session, self.seq) + payload, self.sockaddr)
+        except OSError:
+            # server not up (yet), the next sync catches it up
+            pass
+
+    def sync(self) -> None:
+        # the state is read and sent under the lock, so it is never older
+        # than an event sent before it
+        with self.lock:
+            programs = list(self.programs.items())
+            held = tuple(self.held)
+
+            # nan leaves the server's gain alone
+            gain = float("nan") if self.gain is None else self.gain
+            payload = SYNC_COUNTS.pack(gain, len(programs), len(held))
+            payload += b"".join(PROGRAM_EVENT.pack(channel, *program) for channel, program in programs)
+            payload += b"".join(NOTE_OFF_EVENT.pack(channel, note) for channel, note in held)
+            self.send_locked(SYNC, payload)
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.sync_interval):
+            self.sync()
+
+
+class SynthServer:
+    """
+    Plays the note events sent by RemoteSynth on fluidsynth
+
+    Packets from an older sequence number than the last one played are
+    dropped (a note on arriving after its note off would stick), gaps are
+    counted as lost, and the stats are logged every stats_interval seconds.
+    """
+
+    def __init__(self, address, soundfont_path, gain=2.0, stats_interval=10.0):
+        """
+        :param address: address to listen on, see parse_address
+        :param soundfont_path: .sf2 file to play
+        :param gain: fluidsynth synth.gain until a RemoteSynth sets it
+        :param stats_interval: seconds between stats logs, 0 for none
+        """
+        self.address = address
+        self.stats_interval = stats_interval
+
+        import fluidsynth
+
+        self.fs = fluidsynth.Synth()
+        self.sfid = self.fs.sfload(soundfont_path)
+        self.gain = gain
+        self.fs.setting("synth.gain", gain)
+        self.fs.start()
+        self.fs.program_select(0, self.sfid, 0, 0)
+
+        family, self.sockaddr = parse_address(address)
+        if family != socket.AF_INET and os.path.exists(self.sockaddr):
+            os.remove(self.sockaddr)
+        self.socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.socket.bind(self.sockaddr)
+
+        # current sender and the last sequence number played from it
+        self.session = None
+        self.last_seq = None
+
+        # channel -> (bank, preset), and the (channel, note) held
+        self.programs = {}
+        self.held = set()
+
+        self.received = 0
+        self.lost = 0
+        self.out_of_order = 0
+        self.released = 0
+
+    def serve(self) -> None:
+        """plays events until interrupted"""
+        log(f"Synth server listening on {self.address}")
+        self.socket.settimeout(0.5)
+        last_stats = time.monotonic()
+
+        try:
+            while True:
+                try:
+                    packet = self.socket.recv(MAX_PACKET)
+                except socket.timeout:
+                    packet = None
+                if packet:
+                    self.handle(packet)
+
+                if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                    last_stats = time.monotonic()
+                    self.log_stats()
+        finally:
+            self.release_all()
+            self.socket.close()
+            self.fs.delete()
+
+    def accept(self, session, seq) -> bool:
+        """whether a packet is newer than the last one played, counting lost packets"""
+        if session != self.session:
+            # a new (or restarted) sender, its notes start from nothing
+            self.release_all()
+            self.session = session
+            self.last_seq = seq
+            return True
+
+        ahead = (seq - self.last_seq) % SEQ_MODULO
+        if ahead == 0 or ahead >= SEQ_MODULO // 2:
+            self.out_of_order += 1
+            return False
+
+        self.lost += ahead - 1
+        self.last_seq = seq
+        return True
+
+    def handle(self, packet) -> None:
+        if len(packet) < HEADER.size:
+            return
+        kind, session, seq = HEADER.unpack_from(packet)
+        self.received += 1
+        if not self.accept(session, seq):
+            return
+
+        offset = HEADER.size
+        if kind == NOTE_ON:
+            channel, note, velocity = NOTE_EVENT.unpack_from(packet, offset)
+            self.note_on(channel, note, velocity)
+        elif kind == NOTE_OFF:
+            self.note_off(*NOTE_OFF_EVENT.unpack_from(packet, offset))
+        elif kind == PROGRAM:
+            self.program(*PROGRAM_EVENT.unpack_from(packet, offset))
+        elif kind == GAIN:
+            self.set_gain(*GAIN_EVENT.unpack_from(packet, offset))
+        elif kind == SYNC:
+            self.sync(packet, offset)
+
+    def note_on(self, channel, note, velocity) -> None:
+        self.held.add((channel, note))
+        self.fs.noteon(channel, note, velocity)
+
+    def note_off(self, channel, note) -> None:
+        self.held.discard((channel, note))
+        self.fs.noteoff(channel, note)
+
+    def program(self, channel, bank, preset) -> None:
+        self.programs[channel] = (bank, preset)
+        self.fs.program_select(channel, self.sfid, bank, preset)
+
+    def set_gain(self, gain) -> None:
+        self.gain = gain
+        self.fs.setting("synth.gain", gain)
+
+    def sync(self, packet, offset) -> None:
+        gain, num_programs, num_notes = SYNC_COUNTS.unpack_from(packet, offset)
+        offset += SYNC_COUNTS.size
+
+        # a float32 round trip, so only a real change is applied
+        if not math.isnan(gain) and not math.isclose(gain, self.gain, rel_tol=1e-6):
+            self.set_gain(gain)
+
+        for _ in range(num_programs):
+            channel, bank, preset = PROGRAM_EVENT.unpack_from(packet, offset)
+            offset += PROGRAM_EVENT.size
+            if self.programs.get(channel) != (bank, preset):
+                self.program(channel, bank, preset)
+
+        held = set()
+        for _ in range(num_notes):
+            held.add(NOTE_OFF_EVENT.unpack_from(packet, offset))
+            offset += NOTE_OFF_EVENT.size
+
+        # notes whose note off was lost
+        for channel, note in self.held - held:
+            self.note_off(channel, note)
+            self.released += 1
+
+    def release_all(self) -> None:
+        for channel, note in list(self.held):
+            self.note_off(channel, note)
+
+    def log_stats(self) -> None:
+        log(f"Synth server: {self.received} packets, {self.lost} lost, "
+            f"{self.out_of_order} out of order, {self.released} stuck notes released")
+
+
+def spawn_server(address, soundfont_path) -> subprocess.Popen:
+    """starts a SynthServer in its own process on this machine"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synth_server.py")
+
+    return subprocess.Popen([sys.executable, script, "--listen", address, "--soundfont", soundfont_path])
+
+
+def remote_synth_from_env(soundfont_path):
+    """
+    a RemoteSynth if SYNTH_SERVER is set in .env, starting a local server
+    process first if SYNTH_SERVER_SPAWN is set
+
+    :param soundfont_path: soundfont for a spawned server
+    :returns: the RemoteSynth, or None to play in process
+    """
+    address = env_str("SYNTH_SERVER")
+    if address is None:
+        return None
+
+    process = None
+    if env_bool("SYNTH_SERVER_SPAWN", False):
+        process = spawn_server(address, soundfont_path)
+
+    return RemoteSynth(address, sync_interval=env_float("SYNTH_SYNC_INTERVAL", 0.25), process=process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plays the notes of a Pianable instance set to SYNTH_SERVER")
+    parser.add_argument("--listen", default=DEFAULT_ADDRESS,
+                        help="udp://host:port (udp://0.0.0.0:9123 for other machines) or unix:///path")
+    parser.add_argument("--soundfont", default=os.path.join(".", "Soundfont.sf2"), help="soundfont to play")
+    parser.add_argument("--gain", type=float, default=2.0, help="fluidsynth gain until Pianable sets its own")
+    parser.add_argument("--stats-interval", type=float, default=10.0,
+                        help="seconds between packet loss logs, 0 for none")
+    args = parser.parse_args()
+
+    server = SynthServer(args.listen, args.soundfont, args.gain, args.stats_interval)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
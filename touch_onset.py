@@ -0,0 +1,255 @@
+import cv2
+import numpy as np
+from instrument_front import TableSegments
+from camera_frame import as_frame
+from config import env_bool, env_int, env_float
+
+
+class TouchBand:
+    """
+    Watches the thin band of pixels along one front camera's table line for
+    fingers arriving, on every captured frame.
+
+    The band is sampled into a small strip (columns along the line, rows
+    across it) with a precomputed remap, and compared with a running
+    background of the empty band. A column is active while enough of its
+    pixels differ from the background, and a contact is reported where
+    columns become active. The background only follows inactive columns
+    (active ones very slowly, so something left on the table is absorbed).
+    """
+
+    def __init__(self, pixel_threshold=25, on_fraction=0.4, off_fraction=0.2,
+                 learning_rate=0.05, global_fraction=0.6):
+        """
+        :param pixel_threshold: grey level change of a pixel that counts as changed
+        :param on_fraction: changed pixels in a column for it to become active
+        :param off_fraction: changed pixels in an active column for it to stay active
+        :param learning_rate: how fast the background follows inactive columns
+        :param global_fraction: if more of the band than this becomes active
+                                at once (a light or exposure change) the
+                                background is reset instead
+        """
+        self.pixel_threshold = pixel_threshold
+        self.on_fraction = on_fraction
+        self.off_fraction = off_fraction
+        self.learning_rate = learning_rate
+        self.global_fraction = global_fraction
+
+        # remap maps of the strip, (rows, columns) float32
+        self.map_x = None
+        self.map_y = None
+        self.background = None
+        # per column
+        self.active = None
+        self.last_image = None
+
+    def set_line(self, endpoints, half_width, frame_shape) -> None:
+        """
+        :param endpoints: the table line's two normalized endpoints
+        :param half_width: normalized distance from the line the band covers
+                           on each side (the InstrumentFront press threshold)
+        :param frame_shape: shape of the camera frames
+        """
+        height, width = frame_shape[:2]
+        scale = np.array([width, height], dtype=np.float32)
+        start = np.asarray(endpoints[0], dtype=np.float32) * scale
+        end = np.asarray(endpoints[1], dtype=np.float32) * scale
+
+        length = max(1.0, float(np.linalg.norm(end - start)))
+        direction = (end - start) / length
+        normal = np.array([-direction[1], direction[0]], dtype=np.float32)
+
+        # one column every 2 pixels along the line, one row per pixel across it
+        half_rows = max(1, int(round(half_width * height)))
+        along = np.linspace(0, 1, max(16, int(length / 2)), dtype=np.float32)
+        across = np.arange(-half_rows, half_rows + 1, dtype=np.float32)
+
+        points = (start[None, None, :] + along[None, :, None] * (end - start)[None, None, :]
+                  + across[:, None, None] * normal[None, None, :])
+        self.map_x = np.ascontiguousarray(points[..., 0])
+        self.map_y = np.ascontiguousarray(points[..., 1])
+
+        self.background = None
+        self.active = np.zeros(len(along), dtype=bool)
+        self.last_image = None
+
+    def strip(self, image) -> np.ndarray:
+        """the band of a BGR image as a float32 grey strip"""
+        band = cv2.remap(image, self.map_x, self.map_y, cv2.INTER_NEAREST, borderMode=cv2.BORDER_REPLICATE)
+
+        return cv2.cvtColor(band, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+    def detect(self, image) -> list[float]:
+        """
+        :param image: BGR front camera frame
+        :returns: positions along the line (0 at the first endpoint, 1 at the
+                  second) of the contacts that started in this frame
+        """
+        if self.map_x is None or image is self.last_image:
+            return []
+        self.last_image = image
+
+        strip = self.strip(image)
+        if self.background is None:
+            self.background = strip
+            return []
+
+        changed = np.abs(strip - self.background) > self.pixel_threshold
+        activity = changed.mean(axis=0)
+        active = np.where(self.active, activity > self.off_fraction, activity > self.on_fraction)
+
+        if active.mean() > self.global_fraction:
+            self.background = strip
+            self.active[:] = False
+            return []
+
+        rate = np.where(active, self.learning_rate * 0.1, self.learning_rate).astype(np.float32)
+        self.background += (strip - self.background) * rate
+
+        onsets = active & ~self.active
+        # a column next to one that was already active is the same finger spreading
+        onsets[1:] &= ~self.active[:-1]
+        onsets[:-1] &= ~self.active[1:]
+        self.active = active
+
+        if not onsets.any():
+            return []
+
+        # the centre of every run of onset columns
+        edges = np.diff(np.concatenate(([0], onsets.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        last = len(onsets) - 1
+
+        return [float((start + end - 1) / 2 / last) for start, end in zip(starts, ends)]
+
+
+class TouchOnsetDetector:
+    """
+    Finds fingertips touching the table between hands model runs.
+
+    Every captured front frame goes through a TouchBand per front camera, and
+    each contact is matched to the nearest fingertip of the last hands model
+    result, giving the note that finger is over right away instead of on the
+    next inference. The note is held until a hands model result from a
+    frame captured after the touch takes over (or hold seconds pass), so a
+    result from an older frame doesn't cut it off.
+    """
+
+    def __init__(self, instrument_front, hold=0.25, max_distance=0.08, **band_args):
+        """
+        :param instrument_front: calibrated InstrumentFront or TableSegments
+        :param hold: longest a touched note is held without a newer result
+        :param max_distance: normalized distance from a contact to the
+                             fingertip it is matched to
+        :param band_args: TouchBand arguments
+        """
+        if isinstance(instrument_front, TableSegments):
+            self.instrument_fronts = list(instrument_front)
+        else:
+            self.instrument_fronts = [instrument_front]
+        self.hold = hold
+        self.max_distance = max_distance
+
+        self.bands = [TouchBand(**band_args) for _ in self.instrument_fronts]
+        self.built = False
+
+        # midi note -> front frame time of the touch
+        self.pending = {}
+
+    def build(self, frames) -> None:
+        for band, instrument_front, frame in zip(self.bands, self.instrument_fronts, frames):
+            band.set_line(instrument_front.table_endpoints, instrument_front.table_distance_threshold,
+                          as_frame(frame).shape)
+        self.built = True
+
+    # ---------- hot path (capture stage) ----------
+
+    def detect(self, frames) -> list[tuple[float, float]]:
+        """
+        :param frames: the front camera frames, in camera order
+        :returns: normalized points of new contacts, with the camera index
+                  added to x like engine.merge_keypoints
+        """
+        if not self.built:
+            self.build(frames)
+
+        touches = []
+        for camera, (band, instrument_front, frame) in enumerate(zip(self.bands, self.instrument_fronts, frames)):
+            start, end = instrument_front.table_endpoints
+            for t in band.detect(as_frame(frame).bgr):
+                touches.append((camera + start[0] + t * (end[0] - start[0]),
+                                start[1] + t * (end[1] - start[1])))
+
+        return touches
+
+    def touched_fingers(self, touches, top_keypoints, front_keypoints) -> list:
+        """the top camera fingertips of the front fingertips nearest each contact"""
+        pairs = [
+            (front_finger, top_finger)
+            for front_hand, top_hand in zip(front_keypoints, top_keypoints)
+            for front_finger, top_finger in zip(front_hand, top_hand)
+        ]
+        if not pairs:
+            return []
+
+        front = np.asarray([front_finger for front_finger, _ in pairs], dtype=float)
+        fingers = []
+        for touch in touches:
+            distances = np.hypot(front[:, 0] - touch[0], front[:, 1] - touch[1])
+            nearest = int(np.argmin(distances))
+            if distances[nearest] <= self.max_distance:
+                fingers.append(pairs[nearest][1])
+
+        return fingers
+
+    def press(self, notes, timestamp) -> set:
+        """
+        holds notes touched at timestamp
+
+        :returns: the notes that weren't already held
+        """
+        new = {note for note in notes if note not in self.pending}
+        for note in new:
+            self.pending[note] = timestamp
+
+        return new
+
+    # ---------- resolve stage ----------
+
+    def held(self, playing_notes, captured, now) -> set:
+        """
+        :param playing_notes: midi notes from a hands model result
+        :param captured: when that result's front frame was captured
+        :param now: time.perf_counter()
+        :returns: playing_notes with the touched notes the result is too old to know about
+        """
+        for note, touched in list(self.pending.items()):
+            if touched <= captured or now - touched > self.hold:
+                del self.pending[note]
+
+        if not self.pending:
+            return playing_notes
+
+        return playing_notes | self.pending.keys()
+
+
+def start_touch_onset_from_env(pipeline):
+    """
+    attaches a TouchOnsetDetector to pipeline if TOUCH_ONSET is set in .env,
+    it starts once the pipeline starts playing
+
+    :param pipeline: Pipeline to detect touches for
+    :returns: the detector, or None if touch onset detection is off
+    """
+    if not env_bool("TOUCH_ONSET", False):
+        return None
+
+    # reads the table lines once they are calibrated
+    detector = TouchOnsetDetector(pipeline.instrument_front,
+                                  hold=env_float("TOUCH_ONSET_HOLD", 0.25),
+                                  max_distance=env_float("TOUCH_ONSET_DISTANCE", 0.08),
+                                  pixel_threshold=env_int("TOUCH_ONSET_THRESHOLD", 25))
+    pipeline.touch_detector = detector
+
+    return detector
@@ -1,5 +1,6 @@
 import cv2
 import threading
+import time
 
 
 class Video():
@@ -7,6 +8,11 @@ class Video():
         self.source = source
         self.cap = cv2.VideoCapture(source)
         self.frame = None
+        # (frame, perf_counter time it arrived), swapped in one assignment
+        self.timestamped = (None, None)
+
+        # callbacks run (on the capture thread) whenever a new frame arrives
+        self.listeners = []
 
         self.thread = threading.Thread(target=self.update, daemon=True)
         self.thread.start()
@@ -14,17 +20,86 @@ class Video():
 
     def isOpened(self):
         return self.cap.isOpened()
-    
+
 
     def release(self):
         self.cap.release()
 
 
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+
     def update(self):
         while self.isOpened():
-            ret, self.frame = self.cap.read()
+            ret, frame = self.cap.read()
+
+            if not ret:
+                if not isinstance(self.source, int):
+                    # a video file ended or a stream dropped, read() won't recover
+                    self.release()
+                else:
+                    # don't spin on a camera that is briefly not delivering
+                    time.sleep(0.01)
+                continue
+
+            self.frame = frame
+            self.timestamped = (frame, time.perf_counter())
+            for callback in self.listeners:
+                callback()
+
+
+    def read(self):
+        return self.frame
+
+
+    def read_timestamped(self):
+        return self.timestamped
+
+
+class FileVideo():
+    """
+    Video compatible source for a recorded file, which only moves on a frame
+    when step() is called instead of in real time, so replays are deterministic
+    """
+    def __init__(self, source):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        self.frame = None
+        self.timestamped = (None, None)
+        self.listeners = []
+
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+
+    def release(self):
+        self.cap.release()
+
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+
+    def step(self):
+        # reads the next frame, returns False (and closes) at the end of the file
+        ret, frame = self.cap.read()
+        if not ret:
+            self.release()
+            return False
+
+        self.frame = frame
+        self.timestamped = (frame, time.perf_counter())
+        for callback in self.listeners:
+            callback()
+
+        return True
 
 
     def read(self):
         return self.frame
-    
\ No newline at end of file
+
+
+    def read_timestamped(self):
+        return self.timestamped